@@ -0,0 +1,3 @@
+"""
+Benchmarks for the scoring hot path, see 'benchmarks/run_benchmarks.py'.
+"""
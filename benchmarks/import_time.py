@@ -0,0 +1,186 @@
+"""
+Module for benchmarking the startup time of the command line entry points.
+
+Validation, '--help', '--dry-run', runs whose outputs all exist and sweeps
+whose scores are all in the score cache should not pay for importing torch,
+transformers or minicons, which takes several seconds. This script runs each
+entry point in a fresh interpreter with '-X importtime', and reports its wall
+time, the slowest top-level imports and the heavy libraries it imported.
+
+Run from the repository root:
+    python -m benchmarks.import_time
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["torch", "transformers", "minicons"]
+# Entry points that must start without the heavy libraries
+COMMANDS = {
+    "import bin.io": ["-c", "import bin.io"],
+    "import bin.corpus": ["-c", "import bin.corpus"],
+    "run_eval --help": ["run_eval.py", "--help"],
+    "bin/run_experiment.py --help": ["-m", "bin.run_experiment", "--help"],
+    "run_eval --dry-run": [
+        "run_eval.py", "dtfit", "EleutherAI/pythia-14m",
+        "--revisions", "step1000..step3000:1000", "--dry-run",
+    ],
+    "run_eval invalid revisions": [
+        "run_eval.py", "dtfit", "EleutherAI/pythia-14m",
+        "--revisions", "step3000..step1000:1000",
+    ],
+    "bin/run_experiment.py fully cached sweep": [
+        "-c", "from benchmarks.import_time import cached_sweep; cached_sweep()",
+    ],
+}
+
+
+def cached_sweep(dataset: str = "dtfit") -> None:
+    """
+    Runs 'bin/run_experiment.py' on a sweep of two revisions whose scores
+    are all in a fresh score cache, filled with made-up scores, and writes
+    the outputs to a temporary directory.
+
+    Args:
+        dataset (str): Optional: the dataset to score.
+    """
+    # pylint: disable=import-outside-toplevel
+    from bin.corpus import find_corpus, read_corpus
+    from bin.io import expected_dtype
+    from bin.run_experiment import main as run_experiment
+    from bin.score_cache import ScoreCache
+    from bin.scoring import CachedScorer, build_stimuli, cache_context
+
+    stimuli = build_stimuli(read_corpus(find_corpus(dataset)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ScoreCache(os.path.join(directory, "scores.sqlite"))
+        for revision in ["step1", "step2"]:
+            cache.store(cache_context(
+                CachedScorer(expected_dtype()),
+                {"model": "cached/model", "revision": revision}
+            ), stimuli, [-1.0] * len(stimuli))
+        cache.close()
+
+        run_experiment([
+            "cached/model", "step1,step2", dataset,
+            os.path.join(directory, "{dataset}_{revision}.json"),
+            "--cache-path", cache.path,
+        ])
+
+
+def parse_import_times(stderr: str) -> dict:
+    """
+    Parses the output of '-X importtime' into the cumulative import time of
+    each top-level module.
+
+    Args:
+        stderr (str): The standard error of the interpreter.
+
+    Returns:
+        dict: Cumulative import time in seconds for each top-level module.
+    """
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented below the module importing them
+        if name.startswith("  ") or not cumulative.strip().isdigit():
+            continue
+        module = name.strip()
+        times[module] = times.get(module, 0) + int(cumulative) / 1e6
+
+    return times
+
+
+def imported_packages(stderr: str) -> set:
+    """
+    Parses the output of '-X importtime' into the packages that were
+    imported, directly or by other modules.
+
+    Args:
+        stderr (str): The standard error of the interpreter.
+
+    Returns:
+        set: The top-level package names.
+    """
+    return {
+        line.split("|")[-1].strip().split(".")[0]
+        for line in stderr.splitlines()
+        if line.startswith("import time:") and "imported package" not in line
+    }
+
+
+def measure_startup(args: list, cwd: str = ROOT) -> dict:
+    """
+    Runs a command in a fresh interpreter and measures its startup.
+
+    Args:
+        args (list): Arguments to the interpreter, e.g. a script and its
+            options.
+        cwd (str): Optional: the working directory, by default the
+            repository root.
+
+    Returns:
+        dict: The 'wall_time' and total 'import_time' in seconds, the five
+        'slowest' top-level imports, the 'heavy' libraries that were
+        imported and the 'returncode'.
+    """
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *args], cwd=cwd,
+        capture_output=True, text=True, check=False
+        )
+    wall_time = time.perf_counter() - start
+
+    times = parse_import_times(process.stderr)
+    packages = imported_packages(process.stderr)
+
+    return {
+        "wall_time": wall_time,
+        "import_time": sum(times.values()),
+        "slowest": sorted(times, key=times.get, reverse=True)[:5],
+        "heavy": [module for module in HEAVY_MODULES if module in packages],
+        "returncode": process.returncode,
+    }
+
+
+def main() -> None:
+    """
+    Measures the startup of each entry point and prints the report as JSON.
+    Exits with an error if an entry point imported a heavy library.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the startup time of the command line entry points."
+    )
+    parser.add_argument(
+        "--commands", type=str, nargs="+", choices=list(COMMANDS),
+        default=list(COMMANDS)
+    )
+    args = parser.parse_args()
+
+    report = {name: measure_startup(COMMANDS[name]) for name in args.commands}
+    print(json.dumps(report, indent=2))
+
+    heavy = [name for name, result in report.items() if result["heavy"]]
+    if heavy:
+        print(f"Error: heavy libraries imported by {', '.join(heavy)}.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
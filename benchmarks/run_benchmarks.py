@@ -0,0 +1,443 @@
+"""
+Module for benchmarking the scoring hot path offline.
+
+This script builds tiny, randomly initialized models from the configs in
+'benchmarks/configs' with a word-level tokenizer, generates a synthetic
+minimal pair corpus, and times `run_experiment` end to end for each scoring
+mode. It reports items and tokens per second, peak memory and model load time
+as JSON, and can compare the report with an earlier one.
+
+Run from the repository root:
+    python -m benchmarks.run_benchmarks --items 2000 --compare old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+import numpy as np
+import pandas as pd
+import torch
+import transformers
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+from transformers import AutoConfig, AutoModelForCausalLM, PreTrainedTokenizerFast
+from bin.io import initialize_model, free_model, timestamp
+from bin.profiling import Profiler, peak_rss, reset_peak_rss
+from bin.run_experiment import run_experiment
+from bin.scoring import ScoringOptions, build_stimuli
+from bin.score_cache import ScoreCache
+from bin.tokenized_corpus import load_tokenized_corpus
+
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "configs")
+MODES = ["unbatched", "batched", "prefix_cache", "score_cache"]
+EOS = "<|endoftext|>"
+# Number of distinct words of the synthetic corpus
+VOCAB_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class BenchmarkSettings:
+    """
+    Settings of a benchmark run.
+
+    Args:
+        items (int): Optional: the number of corpus items.
+        prefix_length (int): Optional: the number of words of each prefix.
+        items_per_prefix (int): Optional: number of items sharing a prefix.
+        batch_size (int): Optional: batch size of the batched modes.
+        repeats (int): Optional: runs per mode; the fastest run is reported.
+    """
+    items: int = 1000
+    prefix_length: int = 16
+    items_per_prefix: int = 2
+    batch_size: int = 32
+    repeats: int = 1
+
+
+def make_corpus(
+    n_items: int, prefix_length: int, items_per_prefix: int = 2,
+    vocab_size: int = 1000, seed: int = 0
+) -> pd.DataFrame:
+    """
+    Generates a synthetic minimal pair corpus of random words.
+
+    Args:
+        n_items (int): The number of items.
+        prefix_length (int): The number of words of each prefix.
+        items_per_prefix (int): Optional: number of items sharing a prefix.
+        vocab_size (int): Optional: the number of distinct words.
+        seed (int): Optional: random seed.
+
+    Returns:
+        pd.DataFrame: The corpus in the layout of 'data/{dataset}/corpus.csv'.
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array([f"w{i}" for i in range(vocab_size)])
+
+    n_prefixes = -(-n_items // items_per_prefix)
+    prefixes = [
+        " ".join(words[rng.integers(0, vocab_size, prefix_length)])
+        for _ in range(n_prefixes)
+    ]
+    good = words[rng.integers(0, vocab_size, n_items)]
+    bad = [
+        " ".join(words[rng.integers(0, vocab_size, rng.integers(1, 3))])
+        for _ in range(n_items)
+    ]
+
+    return pd.DataFrame({
+        "item_id": np.arange(1, n_items + 1),
+        "prefix": [prefixes[i // items_per_prefix] for i in range(n_items)],
+        "good_continuation": good,
+        "bad_continuation": bad,
+        "category": "synthetic",
+    })
+
+
+def build_model(config_name: str, vocab_size: int, model_dir: str) -> str:
+    """
+    Saves a randomly initialized model from a local config, with a
+    word-level tokenizer for the words of `make_corpus`.
+
+    Args:
+        config_name (str): Name of a JSON config in 'benchmarks/configs'.
+        vocab_size (int): The number of distinct corpus words.
+        model_dir (str): The directory to save the model to.
+
+    Returns:
+        str: The model directory, loadable like a Huggingface model.
+    """
+    vocab = {EOS: 0}
+    vocab.update({f"w{i}": i + 1 for i in range(vocab_size)})
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token=EOS))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.decoder = decoders.WordPiece()
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, eos_token=EOS, bos_token=EOS,
+        unk_token=EOS
+    )
+
+    with open(os.path.join(CONFIG_DIR, f"{config_name}.json"), "r",
+              encoding="utf-8") as file:
+        config = json.load(file)
+    config.update(vocab_size=len(vocab), bos_token_id=0, eos_token_id=0)
+
+    torch.manual_seed(0)
+    model = AutoModelForCausalLM.from_config(
+        AutoConfig.for_model(**config)
+        )
+    model.save_pretrained(model_dir)
+    tokenizer.save_pretrained(model_dir)
+
+    return model_dir
+
+
+def git_commit() -> str:
+    """
+    Returns the current git commit of the repository, if available.
+
+    Returns:
+        str: The commit hash, or None.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            check=True, cwd=os.path.dirname(CONFIG_DIR)
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_mode(
+    model, mode: str, dataset: str, batch_size: int, work_dir: str
+) -> dict:
+    """
+    Times one `run_experiment` call in the given scoring mode.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model to benchmark.
+        mode (str): One of `MODES`.
+        dataset (str): The dataset in 'data' of the working directory.
+        batch_size (int): The batch size of the batched modes.
+        work_dir (str): Directory for output files and caches.
+
+    Returns:
+        dict: Wall time, peak memory and whether the peak covers only this
+        mode, padding ratio and the time spent in each stage.
+    """
+    options = {
+        "unbatched": {},
+        "batched": {"batch_size": batch_size},
+        "prefix_cache": {"batch_size": batch_size, "prefix_cache": True},
+        "score_cache": {"batch_size": batch_size},
+    }[mode]
+    file_out = os.path.join(work_dir, f"{mode}.json")
+
+    score_cache = None
+    if mode == "score_cache":
+        # Fill the cache first, so that the timed run only reads it
+        score_cache = ScoreCache(os.path.join(work_dir, f"{mode}.sqlite"))
+        options["score_cache"] = score_cache
+        run_experiment(
+            model, dataset, {"model": "benchmark"}, file_out,
+            ScoringOptions(**options)
+            )
+
+    peak_scope = "mode" if reset_peak_rss() else "process"
+    profiler = Profiler()
+    start = time.perf_counter()
+    run_experiment(
+        model, dataset, {"model": "benchmark"}, file_out,
+        ScoringOptions(profiler=profiler, **options)
+        )
+    seconds = time.perf_counter() - start
+    summary = profiler.summary()
+
+    if score_cache is not None:
+        score_cache.close()
+
+    peak = peak_rss()
+    return {
+        "seconds": seconds,
+        "peak_rss_mb": None if peak is None else peak / 1024 ** 2,
+        "peak_rss_scope": peak_scope,
+        "padding_ratio": summary["padding_ratio"],
+        "stages": summary["stages"],
+    }
+
+
+def prepare_model(architecture: str, corpus: pd.DataFrame, work_dir: str) -> tuple:
+    """
+    Builds and loads the model of an architecture and fills the tokenized
+    corpus cache, timing both.
+
+    Args:
+        architecture (str): Config name in 'benchmarks/configs'.
+        corpus (pd.DataFrame): The corpus of the 'benchmark' dataset.
+        work_dir (str): The working directory holding 'data/benchmark'.
+
+    Returns:
+        tuple: The model and a dict with its 'load_time', the
+        'tokenize_time' and the number of corpus 'tokens'.
+    """
+    model_dir = build_model(
+        architecture, VOCAB_SIZE, os.path.join(work_dir, f"model_{architecture}")
+        )
+
+    start = time.perf_counter()
+    model = initialize_model(model_dir, "main", device="cpu")
+    load_time = time.perf_counter() - start
+
+    # Tokenize once up front, as every later run reads the cache
+    start = time.perf_counter()
+    tokenized = load_tokenized_corpus(
+        os.path.join(work_dir, "data", "benchmark", "corpus.csv"),
+        model.tokenizer,
+        [([prefix for prefix in corpus.prefix for _ in range(2)],
+          build_stimuli(corpus))]
+        )
+
+    return model, {
+        "load_time": load_time,
+        "tokenize_time": time.perf_counter() - start,
+        "tokens": int(tokenized.lengths.sum()),
+    }
+
+
+def time_modes(
+    model, setup: dict, settings: BenchmarkSettings, modes: list,
+    work_dir: str
+) -> list:
+    """
+    Times each scoring mode on a prepared model, keeping the fastest of
+    the repeated runs.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model to benchmark.
+        setup (dict): The load and tokenize times and the number of tokens,
+            see `prepare_model`.
+        settings (BenchmarkSettings): The benchmark settings.
+        modes (list): The modes to run.
+        work_dir (str): Directory for output files and caches.
+
+    Returns:
+        list: One result per mode.
+    """
+    results = []
+    for mode in modes:
+        runs = [
+            benchmark_mode(
+                model, mode, "benchmark", settings.batch_size, work_dir
+                )
+            for _ in range(settings.repeats)
+        ]
+        best = min(runs, key=lambda run: run["seconds"])
+        results.append({
+            "mode": mode,
+            "items": settings.items,
+            "tokens": setup["tokens"],
+            "items_per_second": settings.items / best["seconds"],
+            "tokens_per_second": setup["tokens"] / best["seconds"],
+            "load_time": setup["load_time"],
+            "tokenize_time": setup["tokenize_time"],
+            **best,
+        })
+
+    return results
+
+
+def run_benchmarks(
+    architectures: list, settings: BenchmarkSettings = BenchmarkSettings(),
+    modes: list = None
+) -> dict:
+    """
+    Runs all benchmarks in a temporary working directory.
+
+    Args:
+        architectures (list): Config names in 'benchmarks/configs'.
+        settings (BenchmarkSettings): Optional: corpus size, batch size and
+            number of runs per mode.
+        modes (list): Optional: the modes to run, default is all `MODES`.
+
+    Returns:
+        dict: The report with environment, settings and one result per
+        architecture and mode.
+    """
+    modes = modes or MODES
+    corpus = make_corpus(
+        settings.items, settings.prefix_length, settings.items_per_prefix,
+        VOCAB_SIZE
+        )
+    results = []
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        dataset_dir = os.path.join(work_dir, "data", "benchmark")
+        os.makedirs(dataset_dir)
+        corpus.to_csv(os.path.join(dataset_dir, "corpus.csv"), index=False)
+        os.chdir(work_dir)
+
+        try:
+            for architecture in architectures:
+                model, setup = prepare_model(architecture, corpus, work_dir)
+                results += [
+                    {"architecture": architecture, **result}
+                    for result in time_modes(
+                        model, setup, settings, modes, work_dir
+                        )
+                ]
+                free_model(model)
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "timestamp": timestamp(),
+        "git_commit": git_commit(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+            "cpu_count": os.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+        },
+        "settings": {"architectures": architectures, **asdict(settings)},
+        "results": results,
+    }
+
+
+def compare_reports(previous: dict, current: dict) -> pd.DataFrame:
+    """
+    Compares the throughput of two benchmark reports.
+
+    Args:
+        previous (dict): The earlier report.
+        current (dict): The new report.
+
+    Returns:
+        pd.DataFrame: Items per second of both reports and their ratio, per
+        architecture and mode.
+    """
+    keys = ["architecture", "mode"]
+    merged = pd.DataFrame(previous["results"])[keys + ["items_per_second"]] \
+        .merge(
+            pd.DataFrame(current["results"])[keys + ["items_per_second"]],
+            on=keys, suffixes=("_previous", "_current")
+        )
+    merged["speedup"] = merged["items_per_second_current"] \
+        / merged["items_per_second_previous"]
+
+    return merged
+
+
+def main() -> None:
+    """
+    Runs the benchmarks and writes the JSON report.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the scoring hot path with tiny offline models."
+    )
+    parser.add_argument(
+        "--architectures", type=str, nargs="+", default=["gpt_neox", "gpt2"],
+        help="Config names in 'benchmarks/configs'."
+    )
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--prefix-length", type=int, default=16)
+    parser.add_argument("--items-per-prefix", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--modes", type=str, nargs="+", choices=MODES,
+                        default=MODES)
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument(
+        "--output", type=str, default=None,
+        help="Path to the JSON report, default is\
+              'benchmarks/results/report_{time}.json'."
+    )
+    parser.add_argument(
+        "--compare", type=str, default=None,
+        help="Optional: earlier report to compare the throughput with."
+    )
+    args = parser.parse_args()
+
+    report = run_benchmarks(
+        args.architectures, BenchmarkSettings(
+            items=args.items, prefix_length=args.prefix_length,
+            items_per_prefix=args.items_per_prefix,
+            batch_size=args.batch_size, repeats=args.repeats
+        ),
+        modes=args.modes
+    )
+
+    output = args.output or os.path.join(
+        os.path.dirname(CONFIG_DIR), "results",
+        f"report_{time.strftime('%Y%m%d-%H%M%S')}.json"
+        )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+
+    print(pd.DataFrame(report["results"])[[
+        "architecture", "mode", "items_per_second", "tokens_per_second",
+        "peak_rss_mb", "load_time"
+    ]].to_string(index=False))
+    print(f"Report saved to: {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            previous = json.load(file)
+        print(compare_reports(previous, report).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Module for searching the revisions where the accuracy of a model changes.
+
+Instead of evaluating every revision of a sweep, the search evaluates a
+coarse grid of revisions first. It then bisects only the intervals between
+neighbouring evaluated revisions whose accuracy differs significantly in some
+dataset, relation or type, according to the McNemar test of
+`significance.compare_revisions`. Intervals are refined until no revision of
+the sweep is left between their ends, or until their ends are at most
+`resolution` training steps apart. Revisions whose outputs already exist are
+reused and never evaluated again, and each pair of neighbouring revisions is
+tested only once, in the round in which it becomes a pair.
+
+Like any bisection, the search assumes that the accuracy between two
+revisions that do not differ significantly does not change much either; a
+rise and fall between two grid points can be missed, so the grid should not
+be too coarse.
+"""
+
+import json
+import re
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from bin.significance import compare_revisions
+from bin.sweep import plan_outputs, revision_sort_key
+
+
+RESULT_COLUMNS = [
+    "item_id", "relation", "type",
+    "logprob_of_good_continuation", "logprob_of_bad_continuation",
+]
+
+
+@dataclass(frozen=True)
+class SearchSettings:
+    """
+    Where an adaptive search writes its outputs and when it stops refining.
+
+    Args:
+        file_out_template (str): Template for output file paths with
+            '{dataset}', '{model}' and '{revision}' placeholders.
+        initial_points (int): Optional: the number of revisions of the
+            coarse grid evaluated first.
+        resolution (int): Optional: stop refining intervals whose ends are
+            at most this many training steps apart. By default intervals are
+            refined until they contain no other revision of the sweep.
+        alpha (float): Optional: significance level of the McNemar test
+            between neighbouring revisions.
+        max_evaluations (int): Optional: maximum number of revisions to
+            evaluate. The most significant intervals are refined first.
+    """
+    file_out_template: str
+    initial_points: int = 5
+    resolution: int = 0
+    alpha: float = 0.05
+    max_evaluations: int = None
+
+
+def initial_grid(revisions: list, points: int) -> list:
+    """
+    Selects evenly spaced revisions of a sweep, including the first and the
+    last one.
+
+    Args:
+        revisions (list): The revisions of the sweep, in training order.
+        points (int): The number of revisions to select.
+
+    Returns:
+        list: The selected revisions, in training order.
+    """
+    if points < 2:
+        raise ValueError("The initial grid needs at least two revisions.")
+
+    indices = np.linspace(0, len(revisions) - 1, min(points, len(revisions)))
+    return [revisions[i] for i in sorted(set(np.round(indices).astype(int)))]
+
+
+def training_step(revision: str) -> int:
+    """
+    Returns the training step of a revision such as 'step1000' or
+    'step1000-tokens4B'.
+
+    Args:
+        revision (str): The revision name.
+
+    Returns:
+        int: The training step, or None for other names such as 'main'.
+    """
+    match = re.match(r"^step(\d+)", revision)
+    return int(match.group(1)) if match else None
+
+
+def read_output(path: str) -> pd.DataFrame:
+    """
+    Reads the scores of a JSON or Parquet output file.
+
+    Args:
+        path (str): The output file.
+
+    Returns:
+        pd.DataFrame: The 'item_id', log probability and, if present,
+        'relation' and 'type' columns.
+    """
+    if path.endswith(".parquet"):
+        results = pd.read_parquet(path)
+    else:
+        with open(path, "r", encoding="utf-8") as file:
+            results = pd.DataFrame(json.load(file)["results"])
+
+    return results[[column for column in RESULT_COLUMNS if column in results]]
+
+
+def find_changes(results: dict, model_name: str, pairs: list) -> dict:
+    """
+    Tests the accuracy change between pairs of evaluated revisions, per
+    dataset, relation and type, without the bootstrap.
+
+    Args:
+        results (dict): The scores of each (revision, dataset) pair, see
+            `read_output`.
+        model_name (str): The name of the model.
+        pairs (list): The (earlier, later) revision pairs to test.
+
+    Returns:
+        dict: One DataFrame per revision pair with a row per group, see
+        `significance.compare_revisions`.
+    """
+    changes = {}
+    for pair in pairs:
+        df = pd.concat([
+            frame.assign(model=model_name, revision=revision, dataset=dataset)
+            for (revision, dataset), frame in results.items()
+            if revision in pair
+        ], ignore_index=True)
+        by = ["model", "dataset"] + [
+            column for column in ["relation", "type"] if column in df.columns
+        ]
+
+        if "type" in df.columns:
+            # Datasets without types are compared as one group
+            df["type"] = df["type"].fillna("")
+
+        changes[pair] = compare_revisions(df, by=by, bootstrap=None)
+
+    return changes
+
+
+def _neighbour_changes(
+    results: dict, model_name: str, evaluated: set, tested: dict
+) -> pd.DataFrame:
+    """
+    Tests the accuracy change between each pair of neighbouring evaluated
+    revisions. Pairs tested in earlier rounds are not tested again.
+
+    Args:
+        results (dict): The scores of each (revision, dataset) pair.
+        model_name (str): The name of the model.
+        evaluated (set): The revisions with outputs.
+        tested (dict): The tests of the pairs of earlier rounds, updated in
+            place.
+
+    Returns:
+        pd.DataFrame: One row per neighbouring pair and group.
+    """
+    ordered = sorted(evaluated, key=revision_sort_key)
+    pairs = list(zip(ordered, ordered[1:]))
+    tested.update(find_changes(
+        results, model_name, [pair for pair in pairs if pair not in tested]
+        ))
+
+    return pd.concat([tested[pair] for pair in pairs], ignore_index=True)
+
+
+def _next_revisions(
+    changes: pd.DataFrame, revisions: list, resolution: int
+) -> list:
+    """
+    Selects the revision halfway between the ends of each interval with a
+    significant change that can still be refined.
+
+    Args:
+        changes (pd.DataFrame): The significant changes between neighbouring
+            evaluated revisions.
+        revisions (list): The revisions of the full sweep, in training order.
+        resolution (int): Intervals whose ends are at most this many
+            training steps apart are not refined, 0 to refine them all.
+
+    Returns:
+        list: The revisions to evaluate, most significant interval first.
+    """
+    position = {revision: i for i, revision in enumerate(revisions)}
+    intervals = changes.groupby(
+        ["revision_a", "revision_b"], observed=True
+        ).p_mcnemar.min().sort_values()
+
+    pending = []
+    for first, second in intervals.index:
+        start, stop = position[first], position[second]
+        steps = [training_step(first), training_step(second)]
+        if stop - start < 2 or (
+            resolution and None not in steps
+            and steps[1] - steps[0] <= resolution
+        ):
+            continue
+        pending.append(revisions[(start + stop) // 2])
+
+    return pending
+
+
+def _report(
+    revisions: list, evaluated: set, reused: list, rounds: int,
+    changes: pd.DataFrame
+) -> dict:
+    """
+    Summarizes and prints the outcome of an adaptive search.
+
+    Args:
+        revisions (list): The revisions of the full sweep.
+        evaluated (set): The revisions with outputs, evaluated or reused.
+        reused (list): The revisions whose outputs already existed.
+        rounds (int): The number of rounds that evaluated revisions.
+        changes (pd.DataFrame): The significant changes.
+
+    Returns:
+        dict: The report, see `adaptive_search`.
+    """
+    report = {
+        "evaluated": sorted(evaluated, key=revision_sort_key),
+        "reused": reused,
+        "full_sweep": len(revisions),
+        "saved": len(revisions) - len(evaluated),
+        "rounds": rounds,
+        "changes": changes.reset_index(drop=True),
+    }
+    print(
+        f"Evaluated {len(evaluated) - len(reused)} revisions and reused "
+        f"{len(reused)}, saving {report['saved']} of the {len(revisions)} "
+        "revisions of the full sweep."
+    )
+    for change in report["changes"].to_dict("records"):
+        group = "/".join(
+            str(change[column]) for column in ["dataset", "relation", "type"]
+            if change.get(column)
+        )
+        print(
+            f"Accuracy changes between {change['revision_a']} and "
+            f"{change['revision_b']} on {group}: "
+            f"{change['accuracy_a']:.3f} -> {change['accuracy_b']:.3f} "
+            f"(p = {change['p_mcnemar']:.3g})."
+        )
+
+    return report
+
+
+def adaptive_search(
+    model_name: str, revisions: list, datasets: list, evaluate,
+    settings: SearchSettings
+) -> dict:
+    """
+    Finds the revisions between which the accuracy changes significantly,
+    evaluating as few revisions as possible.
+
+    Args:
+        model_name (str): The name of the model.
+        revisions (list): The revisions of the full sweep.
+        datasets (list): The datasets each revision is evaluated on.
+        evaluate (callable): Writes the outputs of all datasets for a list
+            of revisions, e.g. with `run_experiment.run_sweep`.
+        settings (SearchSettings): The output paths, the initial grid and
+            when to stop refining.
+
+    Returns:
+        dict: The 'evaluated' revisions, those 'reused' from existing
+        outputs, the number of revisions of the 'full_sweep' and of the
+        evaluations 'saved' compared with it, the number of 'rounds', and
+        the significant 'changes' between neighbouring evaluated revisions
+        as a DataFrame.
+    """
+    revisions = sorted(revisions, key=revision_sort_key)
+    outputs = plan_outputs(
+        model_name, revisions, datasets, settings.file_out_template
+        )
+    paths = {(out["revision"], out["dataset"]): out["path"] for out in outputs}
+    reused = [
+        revision for revision in revisions
+        if all(out["exists"] for out in outputs if out["revision"] == revision)
+    ]
+
+    evaluated = set(reused)
+    pending = [
+        revision for revision in initial_grid(revisions, settings.initial_points)
+        if revision not in evaluated
+    ]
+    results = {}
+    # The tests of each pair of neighbouring revisions, which do not change
+    # when other revisions are evaluated
+    tested = {}
+    changes = pd.DataFrame()
+    rounds = 0
+
+    while True:
+        if settings.max_evaluations is not None:
+            pending = pending[:max(
+                0, settings.max_evaluations - len(evaluated) + len(reused)
+                )]
+        if pending:
+            rounds += 1
+            print(f"Round {rounds}: evaluating {', '.join(pending)}.")
+            evaluate(pending)
+            evaluated.update(pending)
+
+        for key in paths:
+            if key[0] in evaluated and key not in results:
+                results[key] = read_output(paths[key])
+
+        if len(evaluated) < 2:
+            break
+        changes = _neighbour_changes(results, model_name, evaluated, tested)
+        changes = changes[changes.p_mcnemar < settings.alpha]
+
+        pending = _next_revisions(changes, revisions, settings.resolution)
+        if not pending or (
+            settings.max_evaluations is not None
+            and len(evaluated) - len(reused) >= settings.max_evaluations
+        ):
+            break
+
+    return _report(revisions, evaluated, reused, rounds, changes)
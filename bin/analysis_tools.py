@@ -1,17 +1,25 @@
 """
 Module for analyzing model evaluation results.
 
-This module contains functions to read JSON data from folders,
-compute accuracy metrics, and plot the results.
+This module contains functions to read JSON or Parquet data from folders,
+compute accuracy and other aggregate metrics, and plot the results.
 """
 
 import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from os import listdir
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import matplotlib.pyplot as plt
 import seaborn as sns
+from bin.io import PRECISIONS
+from bin.significance import Bootstrap
 
 
 def read_data_from_folder(
@@ -45,7 +53,7 @@ def read_data_from_folder(
             data = json.load(file)
         results = pd.DataFrame(data["results"])
         for key, value in data["meta"].items():
-            if not isinstance(value, list):
+            if not isinstance(value, (list, dict)):
                 results[key] = value
         all_data.append(results)
 
@@ -57,9 +65,386 @@ def read_data_from_folder(
     return df
 
 
+CATEGORICAL_COLUMNS = ["model", "revision", "dataset", "relation", "type"]
+INDEX_FILE = ".results_index.parquet"
+
+
+def parse_result_file_name(file_name: str) -> tuple:
+    """
+    Splits a result file name of the form '{save_name}_{revision}.json' into
+    model name and revision. The '_{precision}' suffix of results of other
+    precisions than 'bf16', see `PRECISIONS`, is left out.
+
+    Args:
+        file_name (str): The name of the result file.
+
+    Returns:
+        tuple: The model name and the revision, or (None, None) if the file
+        name does not follow the pattern.
+    """
+    stem = file_name[:-len(".json")]
+    for precision in PRECISIONS:
+        if stem.endswith(f"_{precision}"):
+            stem = stem[:-len(f"_{precision}")]
+            break
+    if "_" not in stem:
+        return None, None
+
+    return tuple(stem.rsplit("_", 1))
+
+
+def _read_result_file(file_path: str) -> pd.DataFrame:
+    """
+    Reads one JSON result file into a DataFrame, with each scalar meta key
+    as a column and the model name after the last '/'. List and dict meta
+    entries such as 'profile' are skipped.
+
+    Args:
+        file_path (str): The path to the JSON file.
+
+    Returns:
+        pd.DataFrame: The results of the file.
+    """
+    with open(file_path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+
+    results = pd.DataFrame(data["results"])
+    for key, value in data["meta"].items():
+        if not isinstance(value, (list, dict)):
+            results[key] = value
+    if "model" in results.columns:
+        results["model"] = data["meta"]["model"].split("/")[-1]
+
+    return results
+
+
+def _file_signature(file_path: str) -> list:
+    """
+    Returns the modification time and size of a file, or None if it does not
+    exist.
+
+    Args:
+        file_path (str): The path to the file.
+
+    Returns:
+        list: The modification time in nanoseconds and the size in bytes.
+    """
+    if not os.path.exists(file_path):
+        return None
+
+    stat = os.stat(file_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _read_index(index_path: str) -> tuple:
+    """
+    Reads the index of a results folder.
+
+    Args:
+        index_path (str): The path to the index file.
+
+    Returns:
+        tuple: The file signatures (mtime, size) the cached rows were parsed
+        from, and the Parquet dataset of cached rows, or ({}, None) if there
+        is no readable index.
+    """
+    if not os.path.exists(index_path):
+        return {}, None
+
+    try:
+        metadata = pq.read_schema(index_path).metadata or {}
+        signatures = json.loads(metadata[b"signatures"])
+    except (pa.ArrowInvalid, KeyError, ValueError):
+        return {}, None
+
+    return signatures, ds.dataset(index_path, format="parquet")
+
+
+@dataclass(frozen=True)
+class ResultFilter:
+    """
+    Selects the results of some models and revisions.
+
+    Args:
+        models (list): Optional: model names (after the last '/') to keep.
+        revisions (list): Optional: revisions to keep.
+        final_chkpt_only (bool): Optional: only keep the 'main' revision.
+    """
+    models: list = None
+    revisions: list = None
+    final_chkpt_only: bool = False
+
+    def keeps_file(self, file_name: str) -> bool:
+        """
+        Checks a result file by its name, see `parse_result_file_name`.
+        Files not following the name pattern are kept.
+
+        Args:
+            file_name (str): The name of the result file.
+
+        Returns:
+            bool: Whether the file may hold results to keep.
+        """
+        model, revision = parse_result_file_name(file_name)
+        revisions = ["main"] if self.final_chkpt_only else self.revisions
+
+        return model is None or (
+            (self.models is None or model in self.models)
+            and (revisions is None or revision in revisions)
+        )
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Keeps the rows of the selected models and revisions.
+
+        Args:
+            df (pd.DataFrame): Results with 'model' and 'revision' columns.
+
+        Returns:
+            pd.DataFrame: The selected rows.
+        """
+        revisions = ["main"] if self.final_chkpt_only else self.revisions
+        if self.models is not None and "model" in df.columns:
+            df = df[df["model"].isin(self.models)]
+        if revisions is not None and "revision" in df.columns:
+            df = df[df["revision"].isin(revisions)]
+
+        return df
+
+
+def _parse_result_files(
+        folder_path: str, file_names: list, max_workers: int = None
+        ) -> list:
+    """
+    Parses JSON result files, in a process pool if there are several, and
+    marks the rows of each with its '_source_file'.
+
+    Args:
+        folder_path (str): The path to the folder containing the files.
+        file_names (list): The names of the files.
+        max_workers (int): Optional: number of parsing processes, default is
+            the number of CPUs.
+
+    Returns:
+        list: The DataFrame of each file, see `_read_result_file`.
+    """
+    paths = [os.path.join(folder_path, file_name) for file_name in file_names]
+    if len(paths) > 1 and max_workers != 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            parsed = list(executor.map(_read_result_file, paths))
+    else:
+        parsed = [_read_result_file(path) for path in paths]
+
+    for file_name, results in zip(file_names, parsed):
+        results["_source_file"] = file_name
+
+    return parsed
+
+
+def read_results(
+        folder_path: str, filters: ResultFilter = None, datasets: list = None,
+        max_workers: int = None, use_index: bool = True
+        ) -> pd.DataFrame:
+    """
+    Reads JSON result files and returns a single concatenated DataFrame, like
+    `read_data_from_folder`, but faster on folders with many files.
+
+    Files are filtered by model and revision from their file name pattern
+    '{save_name}_{revision}.json' before they are parsed, and parsed in a
+    process pool. Parsed rows are kept in an index file in each folder, so
+    files that did not change since the last call are never parsed again.
+
+    Args:
+        folder_path (str): The path to the folder containing JSON files, or
+            to the results folder containing one folder per dataset if
+            `datasets` is given.
+        filters (ResultFilter): Optional: the models and revisions to keep.
+        datasets (list): Optional: dataset folders to read from
+            `folder_path`.
+        max_workers (int): Optional: number of parsing processes, default is
+            the number of CPUs.
+        use_index (bool): Optional: read and update the index file.
+
+    Returns:
+        pd.DataFrame: A DataFrame containing the concatenated data, with
+        categorical model, revision, dataset, relation and type columns.
+    """
+    filters = filters or ResultFilter()
+
+    if datasets is not None:
+        return _concat_categorical([
+            read_results(
+                os.path.join(folder_path, dataset), filters=filters,
+                max_workers=max_workers, use_index=use_index
+                )
+            for dataset in datasets
+        ])
+
+    current = {
+        file_name: _file_signature(os.path.join(folder_path, file_name))
+        for file_name in sorted(listdir(folder_path))
+        if file_name.endswith(".json") and filters.keeps_file(file_name)
+    }
+
+    index_path = os.path.join(folder_path, INDEX_FILE)
+    signatures, cached = _read_index(index_path) if use_index else ({}, None)
+    unchanged = [
+        file_name for file_name, signature in current.items()
+        if signatures.get(file_name) == signature
+    ]
+    changed = [
+        file_name for file_name in current if file_name not in unchanged
+    ]
+
+    all_data = []
+    if unchanged:
+        all_data.append(cached.to_table(
+            filter=ds.field("_source_file").isin(unchanged)
+            ).to_pandas())
+
+    if changed:
+        parsed = _parse_result_files(folder_path, changed, max_workers)
+        all_data.extend(parsed)
+
+        if use_index:
+            _update_index(index_path, cached, signatures, current, parsed)
+
+    # Files not following the name pattern are filtered after parsing
+    df = filters.apply(_concat_categorical(all_data))
+
+    return df.drop(columns="_source_file", errors="ignore") \
+        .reset_index(drop=True)
+
+
+def _concat_categorical(all_data: list) -> pd.DataFrame:
+    """
+    Concatenates result DataFrames and converts the metadata columns to
+    categoricals.
+
+    Args:
+        all_data (list): The DataFrames to concatenate.
+
+    Returns:
+        pd.DataFrame: The concatenated DataFrame.
+    """
+    if not all_data:
+        return pd.DataFrame()
+
+    df = pd.concat(
+        [
+            data.astype({
+                col: "object" for col in CATEGORICAL_COLUMNS
+                if col in data.columns
+            })
+            for data in all_data
+        ],
+        ignore_index=True
+    )
+
+    return df.astype({
+        col: "category" for col in CATEGORICAL_COLUMNS if col in df.columns
+    })
+
+
+def _update_index(
+        index_path: str, cached: ds.Dataset, signatures: dict,
+        current: dict, parsed: list
+        ) -> None:
+    """
+    Rewrites the index file with the newly parsed rows, keeping cached rows
+    of files that still exist unchanged.
+
+    Args:
+        index_path (str): The path to the index file.
+        cached (ds.Dataset): The previously cached rows, or None.
+        signatures (dict): The file signatures of the cached rows.
+        current (dict): The current signatures of the files read.
+        parsed (list): DataFrames of the newly parsed files.
+    """
+    folder_path = os.path.dirname(index_path)
+    keep = [
+        file_name for file_name, signature in signatures.items()
+        if (current.get(file_name) or _file_signature(
+            os.path.join(folder_path, file_name)
+            )) == signature
+    ]
+
+    frames = list(parsed)
+    if keep and cached is not None:
+        frames.insert(0, cached.to_table(
+            filter=ds.field("_source_file").isin(keep)
+            ).to_pandas())
+
+    new_signatures = {file_name: signatures[file_name] for file_name in keep}
+    new_signatures.update({
+        data["_source_file"].iloc[0]: current[data["_source_file"].iloc[0]]
+        for data in parsed if len(data.index)
+    })
+
+    try:
+        table = pa.Table.from_pandas(
+            _concat_categorical(frames), preserve_index=False
+            )
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as error:
+        print(f"Warning: could not update the index file {index_path}: {error}")
+        return
+
+    table = table.replace_schema_metadata(
+        {"signatures": json.dumps(new_signatures)}
+        )
+    pq.write_table(table, f"{index_path}.tmp")
+    os.replace(f"{index_path}.tmp", index_path)
+
+
+def read_parquet_dataset(
+        folder_path: str, columns: list = None, models: list = None,
+        revisions: list = None, final_chkpt_only: bool = False
+        ) -> pd.DataFrame:
+    """
+    Reads all Parquet files from a specified folder as one Arrow dataset and
+    returns a single DataFrame. Only the requested columns are read, and
+    files and row groups not matching the model and revision filters are
+    skipped without being decoded.
+
+    Args:
+        folder_path (str): The path to the folder containing Parquet files.
+        columns (list): Optional: the columns to read, default is all.
+        models (list): Optional: full model names ('namespace/modelname') to
+            keep.
+        revisions (list): Optional: revisions to keep.
+        final_chkpt_only (bool): Optional: only keep the 'main' revision.
+
+    Returns:
+        pd.DataFrame: A DataFrame containing the data from all Parquet files
+        in the folder, with metadata columns as categoricals.
+    """
+    dataset = ds.dataset(folder_path, format="parquet")
+
+    if final_chkpt_only:
+        revisions = ["main"]
+
+    expression = None
+    for field, values in [("model", models), ("revision", revisions)]:
+        if values is not None:
+            condition = ds.field(field).isin(values)
+            expression = condition if expression is None \
+                else expression & condition
+
+    df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+    # Extract model name after the last '/'
+    if "model" in df.columns:
+        df["model"] = df["model"].map(
+            lambda model: model.split("/")[-1]
+            ).astype("category")
+
+    return df
+
+
 def compute_accuracy(df: pd.DataFrame) -> pd.DataFrame:
     """
     Computes accuracy metric indicating if the model prefers good continuation.
+    The input DataFrame is left unchanged.
 
     Args:
         df (pd.DataFrame): DataFrame with log probabilities.
@@ -67,6 +452,291 @@ def compute_accuracy(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         pd.DataFrame: Aggregated DataFrame with accuracy metric.
     """
+    keys = ["model", "revision", "type", "relation"]
+
+    return aggregate_metrics(df, by=keys, metrics=["accuracy"])[
+        keys + ["accuracy"]
+    ]
+
+
+def _factorize_keys(df: pd.DataFrame, by: list) -> tuple:
+    """
+    Factorizes each key column of a DataFrame in sorted order.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to group.
+        by (list): The columns to group by.
+
+    Returns:
+        tuple: The codes of each column (-1 where a key is missing), the
+        unique values of each column, and whether all keys of a row are set.
+    """
+    key_codes = []
+    levels = []
+    for col in by:
+        codes, uniques = pd.factorize(df[col], sort=True)
+        key_codes.append(codes)
+        levels.append(uniques)
+
+    valid = np.logical_and.reduce([codes >= 0 for codes in key_codes])
+
+    return key_codes, levels, valid
+
+
+def _group_codes(df: pd.DataFrame, by: list) -> tuple:
+    """
+    Numbers the groups of a DataFrame in sorted key order, like
+    `DataFrame.groupby(by).ngroup()`, by factorizing each key column and
+    combining the codes.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to group.
+        by (list): The columns to group by.
+
+    Returns:
+        tuple: The group code of each row (-1 where a key is missing) and a
+        DataFrame with the keys of each group.
+    """
+    key_codes, levels, valid = _factorize_keys(df, by)
+    shape = [max(len(uniques), 1) for uniques in levels]
+    flat = np.ravel_multi_index([codes[valid] for codes in key_codes], shape)
+
+    # Hash-based factorization, then sort only the unique keys
+    inverse, unique_flat = pd.factorize(flat)
+    order = np.argsort(unique_flat)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    group_codes = np.full(len(df.index), -1, dtype=np.int64)
+    group_codes[valid] = rank[inverse]
+    keys = pd.DataFrame({
+        col: uniques.take(indices)
+        for col, uniques, indices in zip(
+            by, levels, np.unravel_index(unique_flat[order], shape)
+        )
+    })
+
+    return group_codes, keys
+
+
+def _group_sums(codes: np.ndarray, n_groups: int, values: np.ndarray) -> np.ndarray:
+    """
+    Sums values per group, ignoring rows outside of any group.
+
+    Args:
+        codes (np.ndarray): The group code of each row, -1 for no group.
+        n_groups (int): The number of groups.
+        values (np.ndarray): The value of each row.
+
+    Returns:
+        np.ndarray: The sum of each group.
+    """
+    valid = codes >= 0
+    return np.bincount(codes[valid], weights=values[valid], minlength=n_groups)
+
+
+def _item_weights(df: pd.DataFrame) -> np.ndarray:
+    """
+    Returns the number of items each result stands for: 'n_total' /
+    'n_scored' for datasets that were stopped early, 1 otherwise.
+
+    Args:
+        df (pd.DataFrame): The results.
+
+    Returns:
+        np.ndarray: The weight of each row.
+    """
+    if not {"n_scored", "n_total"} <= set(df.columns):
+        return np.ones(len(df.index))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = df["n_total"].to_numpy(dtype=float) \
+            / df["n_scored"].to_numpy(dtype=float)
+    # Results scored completely have no counts after concatenation
+    return np.where(np.isfinite(ratio), ratio, 1.0)
+
+
+def _accuracy_ci(
+        n_items: np.ndarray, accuracy: np.ndarray, bootstrap: Bootstrap
+        ) -> tuple:
+    """
+    Computes bootstrap confidence intervals of the accuracy of each group.
+    Resampling the items of a group is equivalent to drawing the number of
+    correct items from a binomial distribution.
+
+    Args:
+        n_items (np.ndarray): The number of items of each group.
+        accuracy (np.ndarray): The accuracy of each group.
+        bootstrap (Bootstrap): The number of samples, confidence level and
+            seed.
+
+    Returns:
+        tuple: The lower and upper bound of each group.
+    """
+    rng = np.random.default_rng(bootstrap.seed)
+    alpha = (1 - bootstrap.confidence) / 2
+    n_groups = len(n_items)
+    low = np.empty(n_groups)
+    high = np.empty(n_groups)
+    # Chunked over groups to bound memory on large sweeps
+    for start in range(0, n_groups, 10_000):
+        stop = min(start + 10_000, n_groups)
+        samples = rng.binomial(
+            n_items[start:stop, None], accuracy[start:stop, None],
+            size=(stop - start, bootstrap.n_boot)
+            ) / n_items[start:stop, None]
+        low[start:stop], high[start:stop] = np.quantile(
+            samples, [alpha, 1 - alpha], axis=1
+            )
+
+    return low, high
+
+
+def _mean_margin(
+        codes: np.ndarray, n_groups: int, margin: np.ndarray
+        ) -> np.ndarray:
+    """
+    Averages the finite log probability margins of each group.
+
+    Args:
+        codes (np.ndarray): The group code of each row.
+        n_groups (int): The number of groups.
+        margin (np.ndarray): The margin of each row.
+
+    Returns:
+        np.ndarray: The mean margin of each group.
+    """
+    finite = np.isfinite(margin)
+
+    return _group_sums(codes, n_groups, np.where(finite, margin, 0.0)) \
+        / _group_sums(codes, n_groups, finite.astype(float))
+
+
+def _agreement(
+        df: pd.DataFrame, by: list, codes: np.ndarray, n_groups: int,
+        correct: np.ndarray
+        ) -> np.ndarray:
+    """
+    Computes the share of items of each group where the model agrees with
+    its own majority preference across all revisions.
+
+    Args:
+        df (pd.DataFrame): The results, with an 'item_id' column.
+        by (list): The columns to group by, including 'revision'.
+        codes (np.ndarray): The group code of each row.
+        n_groups (int): The number of groups.
+        correct (np.ndarray): Whether each row is correct, as 0/1.
+
+    Returns:
+        np.ndarray: The agreement of each group.
+    """
+    item_codes, item_keys = _group_codes(
+        df, [col for col in by if col != "revision"] + ["item_id"]
+        )
+    n_item_groups = len(item_keys.index)
+    consensus = _group_sums(item_codes, n_item_groups, correct) \
+        / _group_sums(item_codes, n_item_groups, np.ones_like(correct))
+    agrees = np.where(
+        item_codes >= 0, correct == (consensus[item_codes] >= 0.5), False
+        ).astype(float)
+
+    return _group_sums(codes, n_groups, agrees) \
+        / _group_sums(codes, n_groups, np.ones_like(agrees))
+
+
+def _human_correlation(
+        df: pd.DataFrame, codes: np.ndarray, n_groups: int, margin: np.ndarray
+        ) -> np.ndarray:
+    """
+    Computes the Pearson correlation of the margin with the difference of
+    the human scores of the good and the bad continuation in each group.
+
+    Args:
+        df (pd.DataFrame): The results, with 'good_human_score' and
+            'bad_human_score' columns.
+        codes (np.ndarray): The group code of each row.
+        n_groups (int): The number of groups.
+        margin (np.ndarray): The margin of each row.
+
+    Returns:
+        np.ndarray: The correlation of each group.
+    """
+    human = df["good_human_score"].to_numpy(dtype=float) \
+        - df["bad_human_score"].to_numpy(dtype=float)
+    valid = np.isfinite(margin) & np.isfinite(human)
+    x = np.where(valid, margin, 0.0)
+    y = np.where(valid, human, 0.0)
+
+    n = _group_sums(codes, n_groups, valid.astype(float))
+    sum_x = _group_sums(codes, n_groups, x)
+    sum_y = _group_sums(codes, n_groups, y)
+    # Empty and constant groups have no correlation
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = _group_sums(codes, n_groups, x * y) - sum_x * sum_y / n
+        var_x = _group_sums(codes, n_groups, x * x) - sum_x ** 2 / n
+        var_y = _group_sums(codes, n_groups, y * y) - sum_y ** 2 / n
+        return cov / np.sqrt(var_x * var_y)
+
+
+def _default_metrics(df: pd.DataFrame, by: list) -> list:
+    """
+    Returns all metrics of `aggregate_metrics` that the columns allow.
+
+    Args:
+        df (pd.DataFrame): The results.
+        by (list): The columns to group by.
+
+    Returns:
+        list: The names of the metrics.
+    """
+    metrics = ["accuracy", "ci", "margin"]
+    if "revision" in by and "item_id" in df.columns:
+        metrics.append("agreement")
+    if {"good_human_score", "bad_human_score"} <= set(df.columns):
+        metrics.append("human_correlation")
+
+    return metrics
+
+
+def aggregate_metrics(
+        df: pd.DataFrame, by: list = None, metrics: list = None,
+        bootstrap: Bootstrap = Bootstrap(n_boot=1000)
+        ) -> pd.DataFrame:
+    """
+    Computes several metrics per group in one pass of vectorized operations,
+    without modifying or copying the input DataFrame.
+
+    Available metrics:
+        - 'accuracy': share of items where the model prefers the good
+          continuation, with the number of items as 'n_items'. Items of
+          datasets that were stopped early, see `bin.early_stopping`, stand
+          for 'n_total' / 'n_scored' items each, so that pooled datasets
+          count by their full size.
+        - 'ci': bootstrap confidence interval of the accuracy as
+          'accuracy_ci_low' and 'accuracy_ci_high'. Resampling the items of
+          a group is equivalent to drawing the number of correct items from
+          a binomial distribution, which is done for all groups at once.
+        - 'margin': mean log probability margin of the good over the bad
+          continuation.
+        - 'agreement': share of items where the model agrees with its own
+          majority preference across all revisions of the same group. Needs
+          'revision' in `by` and an 'item_id' column.
+        - 'human_correlation': Pearson correlation of the margin with the
+          difference of 'good_human_score' and 'bad_human_score', e.g. for
+          dtfit.
+
+    Args:
+        df (pd.DataFrame): DataFrame with log probabilities.
+        by (list): Optional: columns to group by, default is model, revision,
+            type and relation, as far as present.
+        metrics (list): Optional: metrics to compute, default is all that the
+            available columns allow.
+        bootstrap (Bootstrap): Optional: number of samples, confidence level
+            and seed for 'ci', 1000 samples by default.
+
+    Returns:
+        pd.DataFrame: One row per group with the group keys and the metrics.
+    """
     required_columns = [
         "logprob_of_good_continuation", "logprob_of_bad_continuation"
         ]
@@ -74,15 +744,191 @@ def compute_accuracy(df: pd.DataFrame) -> pd.DataFrame:
         if col not in df.columns:
             raise ValueError(f"Column '{col}' is missing in the dataset.")
 
-    df["model_prefers_good_continuation"] = (
-        df["logprob_of_good_continuation"] > df["logprob_of_bad_continuation"]
-    )
+    if by is None:
+        by = [
+            col for col in ["model", "revision", "type", "relation"]
+            if col in df.columns
+        ]
+    for col in by:
+        if col not in df.columns:
+            raise ValueError(f"Column '{col}' is missing in the dataset.")
 
-    df = df.groupby(
-        ["model", "revision", "type", "relation"], as_index=False
-        ).agg(accuracy=("model_prefers_good_continuation", "mean"))
+    has_human_scores = {"good_human_score", "bad_human_score"} <= set(df.columns)
+    if metrics is None:
+        metrics = _default_metrics(df, by)
+
+    codes, out = _group_codes(df, by)
+    n_groups = len(out.index)
+    out["n_items"] = np.bincount(codes[codes >= 0], minlength=n_groups)
+
+    good = df["logprob_of_good_continuation"].to_numpy(dtype=float)
+    bad = df["logprob_of_bad_continuation"].to_numpy(dtype=float)
+    correct = (good > bad).astype(float)
+
+    weights = _item_weights(df)
+    accuracy = _group_sums(codes, n_groups, correct * weights) \
+        / _group_sums(codes, n_groups, weights)
+    if "accuracy" in metrics:
+        out["accuracy"] = accuracy
+    if "ci" in metrics:
+        out["accuracy_ci_low"], out["accuracy_ci_high"] = _accuracy_ci(
+            out["n_items"].to_numpy(), accuracy, bootstrap
+            )
+    if "margin" in metrics:
+        out["mean_margin"] = _mean_margin(codes, n_groups, good - bad)
+    if "agreement" in metrics:
+        out["agreement"] = _agreement(df, by, codes, n_groups, correct)
+    if "human_correlation" in metrics and has_human_scores:
+        out["human_correlation"] = _human_correlation(
+            df, codes, n_groups, good - bad
+            )
+
+    return out
+
+
+TOKEN_REDUCTIONS = [
+    "mean", "sum", "last", "continuation_mean", "continuation_sum"
+]
+
+
+def _flatten_lists(values) -> tuple:
+    """
+    Flattens a column of lists into one array and the offsets of each list.
+    Arrow list arrays are flattened without copying.
+
+    Args:
+        values: The lists, as a pd.Series, pyarrow array or sequence.
+
+    Returns:
+        tuple: The flat float array and the start of each list, plus the end
+        of the last one.
+    """
+    if isinstance(values, pd.Series) and isinstance(values.dtype, pd.ArrowDtype):
+        values = pa.array(values)
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    if isinstance(values, (pa.ListArray, pa.LargeListArray)):
+        return (
+            values.values.to_numpy(zero_copy_only=False),
+            np.asarray(values.offsets, dtype=np.int64)
+        )
+
+    values = [() if value is None else value for value in values]
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in values], out=offsets[1:])
+    flat = np.concatenate(
+        [np.asarray(value, dtype=np.float32) for value in values]
+        ) if values else np.empty(0, dtype=np.float32)
+
+    return flat, offsets
+
+
+def reduce_token_logprobs(
+        token_logprobs, prefix_tokens=None, reduction: str = "mean"
+        ) -> np.ndarray:
+    """
+    Reduces the per-token log probabilities of many stimuli at once with
+    segment sums over one flat array.
+
+    Available reductions:
+        - 'mean': mean log probability, as computed during scoring.
+        - 'sum': total log probability.
+        - 'last': log probability of the last token.
+        - 'continuation_mean', 'continuation_sum': mean and total log
+          probability of the tokens after the prefix. NaN where the stimulus
+          does not start with the tokenization of its prefix.
+
+    Args:
+        token_logprobs: Per-token log probabilities of each stimulus, as
+            stored by `run_experiment` with `token_logprobs=True`.
+        prefix_tokens: Optional: number of prefix tokens of each stimulus,
+            needed for the 'continuation_' reductions.
+        reduction (str): Optional: the reduction, default is 'mean'.
+
+    Returns:
+        np.ndarray: The reduced score of each stimulus.
+    """
+    if reduction not in TOKEN_REDUCTIONS:
+        raise ValueError(
+            f"Unknown reduction '{reduction}', expected one of "
+            f"{TOKEN_REDUCTIONS}."
+        )
+
+    flat, offsets = _flatten_lists(token_logprobs)
+    starts, ends = offsets[:-1], offsets[1:]
+
+    if reduction.startswith("continuation_"):
+        if prefix_tokens is None:
+            raise ValueError(f"Reduction '{reduction}' needs prefix token counts.")
+        # Score j belongs to token j + 1, so the continuation starts at
+        # score prefix_tokens - 1
+        prefix_tokens = np.asarray(prefix_tokens, dtype=np.int64)
+        starts = np.where(
+            prefix_tokens > 0,
+            np.minimum(starts + prefix_tokens - 1, ends), ends
+            )
+        undefined = prefix_tokens <= 0
+        reduction = reduction[len("continuation_"):]
+    else:
+        undefined = np.zeros(len(starts), dtype=bool)
+
+    counts = ends - starts
+    nonempty = counts > 0
+    result = np.full(len(starts), np.nan)
+
+    if reduction == "last":
+        result[nonempty] = flat[ends[nonempty] - 1]
+    else:
+        # Interleaved (start, end) indices, so that every other reduceat
+        # segment is exactly one stimulus; the padding keeps the final end
+        # index in bounds
+        padded = np.append(flat, np.zeros(1, dtype=flat.dtype))
+        bounds = np.stack([starts[nonempty], ends[nonempty]], axis=1).ravel()
+        sums = np.zeros(len(starts))
+        if len(bounds):
+            sums[nonempty] = np.add.reduceat(
+                padded, bounds, dtype=np.float64
+                )[0::2]
+        if reduction == "sum":
+            result = sums
+        else:
+            result[nonempty] = sums[nonempty] / counts[nonempty]
+
+    result[undefined] = np.nan
+
+    return result
+
+
+def apply_token_reduction(df: pd.DataFrame, reduction: str) -> pd.DataFrame:
+    """
+    Recomputes the scores of both continuations from stored per-token log
+    probabilities, so that `compute_accuracy` and `aggregate_metrics` can be
+    used with any reduction in `TOKEN_REDUCTIONS`. The input DataFrame is left
+    unchanged.
+
+    Args:
+        df (pd.DataFrame): DataFrame with 'token_logprobs_of_...' and
+            'prefix_tokens_of_...' columns of both continuations.
+        reduction (str): The reduction, see `reduce_token_logprobs`.
+
+    Returns:
+        pd.DataFrame: A copy of the DataFrame with the reduced scores as
+        'logprob_of_good_continuation' and 'logprob_of_bad_continuation'.
+    """
+    scores = {}
+    for which in ["good", "bad"]:
+        col = f"token_logprobs_of_{which}_continuation"
+        if col not in df.columns:
+            raise ValueError(f"Column '{col}' is missing in the dataset.")
+        prefix_col = f"prefix_tokens_of_{which}_continuation"
+        scores[f"logprob_of_{which}_continuation"] = reduce_token_logprobs(
+            df[col],
+            df[prefix_col] if prefix_col in df.columns else None,
+            reduction
+            )
+
+    return df.assign(**scores)
 
-    return df
 
 def plot_bar_charts(df: pd.DataFrame, model_order: list) -> None:
     """
@@ -103,7 +949,9 @@ def plot_bar_charts(df: pd.DataFrame, model_order: list) -> None:
     Example:
         plot_bar_charts(df)
     """
-    df['type_relation'] = df['type'] + " - " + df['relation']
+    df['type_relation'] = (
+        df['type'].astype(str) + " - " + df['relation'].astype(str)
+    )
 
     plt.figure(figsize=(19, 8))  # adjust size
 
@@ -0,0 +1,215 @@
+"""
+Module for batched scoring of minimal pair stimuli.
+
+This module provides functions to score many stimuli per forward pass.
+Stimuli are scored from their token ids, sorted by token length and grouped
+into batches so that each batch pads as little as possible. Scores are
+returned in the original stimulus order.
+"""
+
+import torch
+from torch.nn.utils.rnn import pad_sequence
+from tqdm import tqdm
+from minicons import scorer
+from transformers import BatchEncoding
+from bin import profiling
+
+
+def mean_reduction(scores) -> float:
+    """
+    Sequence log-probability, normalized by number of tokens.
+    See https://github.com/kanishkamisra/minicons
+
+    Args:
+        scores (torch.Tensor): Per-token log probabilities of one stimulus.
+
+    Returns:
+        float: The mean log probability.
+    """
+    return scores.mean(0).item()
+
+
+def token_reduction(scores) -> tuple:
+    """
+    Keeps the per-token log probabilities of a stimulus next to their mean,
+    so that other reductions can be computed offline.
+
+    Args:
+        scores (torch.Tensor): Per-token log probabilities of one stimulus.
+
+    Returns:
+        tuple: The mean log probability and the list of per-token log
+        probabilities, rounded to float32.
+    """
+    return scores.mean(0).item(), scores.float().tolist()
+
+
+def length_sorted_batches(lengths: list, batch_size: int) -> list:
+    """
+    Groups stimulus indices into batches of similar token length.
+
+    The sort is stable, so stimuli of equal length keep their original
+    relative order and the batch plan is deterministic.
+
+    Args:
+        lengths (list): Token length of each stimulus.
+        batch_size (int): Maximum number of stimuli per batch.
+
+    Returns:
+        list: A list of batches, each a list of stimulus indices.
+    """
+    if batch_size < 1:
+        raise ValueError("Batch size must be a positive integer.")
+
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+
+    return [
+        order[start:start + batch_size]
+        for start in range(0, len(order), batch_size)
+    ]
+
+
+def pad_batch(model: scorer.IncrementalLMScorer, token_ids: list):
+    """
+    Right-pads the token ids of several stimuli into one model input, the
+    same input `sequence_score` builds from the stimulus strings, without a
+    round trip through the tokenizer.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model used for scoring.
+        token_ids (list): The token ids of each stimulus.
+
+    Returns:
+        transformers.BatchEncoding: Input ids and attention mask.
+    """
+    input_ids = pad_sequence(
+        [torch.tensor(ids, dtype=torch.long) for ids in token_ids],
+        batch_first=True, padding_value=model.tokenizer.pad_token_id
+        )
+    lengths = torch.tensor([len(ids) for ids in token_ids])
+    attention_mask = (
+        torch.arange(input_ids.shape[1]) < lengths[:, None]
+        ).long()
+
+    return BatchEncoding(
+        {"input_ids": input_ids, "attention_mask": attention_mask}
+        )
+
+
+def score_batch(
+    model: scorer.IncrementalLMScorer, token_ids: list, reduction=mean_reduction
+) -> list:
+    """
+    Scores one batch of pre-tokenized stimuli in a single forward pass.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model used for scoring.
+        token_ids (list): The token ids of each stimulus in the batch.
+        reduction (callable): Reduces the per-token log probabilities of a
+            stimulus, same as in `sequence_score`.
+
+    Returns:
+        list: The reduced score of each stimulus.
+    """
+    with profiling.stage("pad"):
+        encoded = pad_batch(model, token_ids)
+    profiling.add_tokens(
+        int(encoded["attention_mask"].sum()), encoded["input_ids"].numel()
+        )
+    with profiling.stage("forward"):
+        batch_scores = model.compute_stats(
+            (encoded, [0] * len(token_ids)), return_tensors=True
+            )
+
+    # Moving the scores to the host waits for the device
+    with profiling.stage("reduction"):
+        return [reduction(score) for score in batch_scores]
+
+
+def map_batches(model, function, tasks: list) -> list:
+    """
+    Runs `function(model, *task)` for each task, in order. With a
+    `DataParallelScorer`, the tasks are spread over its worker processes,
+    each of which holds its own model replica.
+
+    Args:
+        model: The model used for scoring, an IncrementalLMScorer or a
+            DataParallelScorer.
+        function (callable): A module-level scoring function such as
+            `score_batch`, so that it can be sent to worker processes.
+        tasks (list): The remaining arguments of each call.
+
+    Returns:
+        list: The result of each call, in task order.
+    """
+    if hasattr(model, "map"):
+        return list(tqdm(model.map(function, tasks), total=len(tasks)))
+
+    return [function(model, *task) for task in tqdm(tasks)]
+
+
+def score_token_ids(
+    model: scorer.IncrementalLMScorer, token_ids: list, batch_size: int,
+    reduction=mean_reduction, sort_by_length: bool = True
+) -> list:
+    """
+    Scores pre-tokenized stimuli in batches, without tokenizing again. The
+    batch plan only depends on the stimuli, so the scores are the same with
+    a single model and with a `DataParallelScorer`.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model used for scoring, or a
+            DataParallelScorer.
+        token_ids (list): The token ids of each stimulus.
+        batch_size (int): Maximum number of stimuli per forward pass.
+        reduction (callable): Reduces the per-token log probabilities of a
+            stimulus, same as in `sequence_score`.
+        sort_by_length (bool): Bucket stimuli by token length; otherwise,
+            batches follow the input order.
+
+    Returns:
+        list: The reduced score of each stimulus, in input order.
+    """
+    if sort_by_length:
+        batches = length_sorted_batches(
+            [len(ids) for ids in token_ids], batch_size
+            )
+    else:
+        batches = [
+            list(range(start, min(start + batch_size, len(token_ids))))
+            for start in range(0, len(token_ids), batch_size)
+        ]
+
+    batch_scores = map_batches(model, score_batch, [
+        ([token_ids[i] for i in batch], reduction) for batch in batches
+    ])
+
+    scores = [None] * len(token_ids)
+    for batch, batch_score in zip(batches, batch_scores):
+        for i, score in zip(batch, batch_score):
+            scores[i] = score
+
+    return scores
+
+
+def score_stimuli(
+    model: scorer.IncrementalLMScorer, stimuli: list, batch_size: int,
+    reduction=mean_reduction
+) -> list:
+    """
+    Scores stimuli in length-bucketed batches.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model used for scoring.
+        stimuli (list): The stimulus strings to score.
+        batch_size (int): Maximum number of stimuli per forward pass.
+        reduction (callable): Reduces the per-token log probabilities of a
+            stimulus, same as in `sequence_score`.
+
+    Returns:
+        list: The reduced score of each stimulus, in input order.
+    """
+    return score_token_ids(
+        model, model.tokenizer(stimuli)["input_ids"], batch_size,
+        reduction=reduction
+        )
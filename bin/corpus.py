@@ -0,0 +1,154 @@
+"""
+Module for streaming minimal pair corpora from disk.
+
+A corpus is a 'corpus.csv', 'corpus.jsonl' or 'corpus.parquet' file in
+'data/{dataset}' with one item per row. `iter_corpus` reads it in chunks of
+typed DataFrames with only the columns needed for scoring, so that memory
+stays flat regardless of the corpus size. Each chunk is indexed by the
+position of its rows in the corpus, see `scoring.stimulus_indices`.
+"""
+
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+from bin import profiling
+
+
+FORMATS = ["csv", "jsonl", "parquet"]
+REQUIRED_COLUMNS = [
+    "item_id", "prefix", "good_continuation", "bad_continuation", "category"
+]
+# Optional column for inter- or intra-sentential connective continuations
+OPTIONAL_COLUMNS = ["type"]
+TEXT_COLUMNS = [
+    "prefix", "good_continuation", "bad_continuation", "category", "type"
+]
+
+
+def find_corpus(dataset: str, data_dir: str = "data") -> str:
+    """
+    Returns the corpus file of a dataset.
+
+    Args:
+        dataset (str): The dataset name.
+        data_dir (str): Optional: the directory holding the datasets.
+
+    Returns:
+        str: The path to the corpus file, the first of `FORMATS` found.
+    """
+    for file_format in FORMATS:
+        path = os.path.join(data_dir, dataset, f"corpus.{file_format}")
+        if os.path.isfile(path):
+            return path
+
+    raise FileNotFoundError(
+        f"No corpus file for dataset '{dataset}' in '{data_dir}', expected "
+        f"one of {', '.join(f'corpus.{f}' for f in FORMATS)}."
+    )
+
+
+def _typed(chunk: pd.DataFrame, path: str, start: int) -> pd.DataFrame:
+    """
+    Checks and types the columns of a chunk and indexes it by row position.
+
+    Args:
+        chunk (pd.DataFrame): The rows as read from the corpus file.
+        path (str): The corpus file, for error messages.
+        start (int): The position of the first row in the corpus.
+
+    Returns:
+        pd.DataFrame: The scoring columns, text columns as str.
+    """
+    missing = [column for column in REQUIRED_COLUMNS if column not in chunk]
+    if missing:
+        raise ValueError(
+            f"Corpus '{path}' is missing the columns {', '.join(missing)}."
+        )
+
+    chunk = chunk[[
+        column for column in REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+        if column in chunk
+    ]]
+    chunk = chunk.astype({
+        column: str for column in TEXT_COLUMNS if column in chunk
+    })
+    chunk.index = pd.RangeIndex(start, start + len(chunk.index))
+
+    return chunk
+
+
+def read_chunks(path: str, chunk_size: int, columns: list = None):
+    """
+    Yields the raw chunks of a CSV, JSONL or Parquet file.
+
+    Args:
+        path (str): The file.
+        chunk_size (int): The number of rows per chunk.
+        columns (list): Optional: the columns to read if present, by default
+            those of a corpus.
+    """
+    columns = columns or REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+
+    if path.endswith(".csv"):
+        # Words such as 'null' or 'NA' are continuations, not missing values
+        with pd.read_csv(
+            path, chunksize=chunk_size, usecols=lambda c: c in columns,
+            keep_default_na=False
+        ) as reader:
+            yield from reader
+    elif path.endswith(".jsonl"):
+        with pd.read_json(
+            path, lines=True, chunksize=chunk_size, dtype=False
+        ) as reader:
+            yield from reader
+    elif path.endswith(".parquet"):
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(
+            batch_size=chunk_size,
+            columns=[c for c in columns if c in parquet_file.schema_arrow.names]
+        ):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(
+            f"Unknown file format of '{path}', expected one of "
+            f"{', '.join(FORMATS)}."
+        )
+
+
+def iter_corpus(path: str, chunk_size: int = 1024):
+    """
+    Yields the items of a corpus file in chunks. Reading is recorded as the
+    'read_corpus' stage of the active profiler.
+
+    Args:
+        path (str): The corpus file, CSV, JSONL or Parquet.
+        chunk_size (int): Optional: the number of items per chunk.
+
+    Yields:
+        pd.DataFrame: The 'item_id', 'prefix', 'good_continuation',
+        'bad_continuation', 'category' and, if present, 'type' columns of
+        the next items, indexed by their position in the corpus.
+    """
+    chunks = read_chunks(path, chunk_size)
+    start = 0
+    while True:
+        with profiling.stage("read_corpus"):
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+            chunk = _typed(chunk, path, start)
+        start += len(chunk.index)
+        yield chunk
+
+
+def read_corpus(path: str) -> pd.DataFrame:
+    """
+    Reads a whole corpus file, for corpora that fit into memory.
+
+    Args:
+        path (str): The corpus file, CSV, JSONL or Parquet.
+
+    Returns:
+        pd.DataFrame: The items, see `iter_corpus`.
+    """
+    return pd.concat(iter_corpus(path, chunk_size=100_000))
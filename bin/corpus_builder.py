@@ -0,0 +1,354 @@
+"""
+Module for building minimal pair corpora from sentence-level source data.
+
+Source data lists one sentence per row, with the item it belongs to and
+whether it is the good or the bad sentence of the pair, such as the DTFit
+ratings in 'data/dtfit'. `build_corpus` pairs the two sentences of every item
+with a single pivot and splits off the last word of each sentence as its
+continuation. `build_corpus_file` streams large source files in chunks and
+writes a CSV or Parquet corpus that `run_experiment` reads directly, see
+`bin.corpus`.
+
+Run from the repository root:
+    python -m bin.corpus_builder source.csv data/{dataset}/corpus.parquet \
+        --category event_plausibility
+"""
+
+import argparse
+import contextlib
+import os
+from dataclasses import dataclass
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bin.corpus import read_chunks
+
+
+OUTPUT_FORMATS = ["csv", "parquet"]
+
+
+@dataclass(frozen=True)
+class SourceSchema:
+    """
+    The columns and labels of source data with one sentence per row.
+
+    Args:
+        item_column (str): Optional: the column of the item ids.
+        sentence_column (str): Optional: the column of the sentences.
+        label_column (str): Optional: the column telling good from bad
+            sentences.
+        score_column (str): Optional: the column of human ratings, None if
+            there are none.
+        good_label (str): Optional: the label of good sentences.
+        bad_label (str): Optional: the label of bad sentences.
+    """
+    item_column: str = "ItemNum"
+    sentence_column: str = "Sentence"
+    label_column: str = "Plausibility"
+    score_column: str = "Score"
+    good_label: str = "Plausible"
+    bad_label: str = "Implausible"
+
+    @property
+    def columns(self) -> list:
+        """
+        The columns to read from the source, without a missing score column.
+        """
+        return [
+            column for column in [
+                self.item_column, self.sentence_column, self.label_column,
+                self.score_column
+            ]
+            if column is not None
+        ]
+
+
+def _format_ids(ids) -> str:
+    ids = [str(item_id) for item_id in ids]
+    if len(ids) > 5:
+        return f"{', '.join(ids[:5])} and {len(ids) - 5} more"
+    return ", ".join(ids)
+
+
+def validate_source(
+    source: pd.DataFrame, schema: SourceSchema = SourceSchema()
+) -> None:
+    """
+    Checks that source data has the expected columns and labels, and at most
+    one good and one bad sentence per item.
+
+    Args:
+        source (pd.DataFrame): One sentence per row.
+        schema (SourceSchema): Optional: the columns and labels of the
+            source.
+    """
+    missing = [column for column in schema.columns if column not in source]
+    if missing:
+        raise ValueError(
+            f"Source data is missing the columns {', '.join(missing)}."
+        )
+
+    labels = source[schema.label_column]
+    unknown = labels[
+        ~labels.isin([schema.good_label, schema.bad_label])
+    ].unique()
+    if len(unknown):
+        raise ValueError(
+            f"Unknown labels {_format_ids(unknown)} in column "
+            f"'{schema.label_column}', expected '{schema.good_label}' or "
+            f"'{schema.bad_label}'."
+        )
+
+    duplicated = source.duplicated([schema.item_column, schema.label_column])
+    if duplicated.any():
+        raise ValueError(
+            "Duplicate item_ids with more than one sentence per label: "
+            f"{_format_ids(source.loc[duplicated, schema.item_column].unique())}."
+        )
+
+
+def build_corpus(
+    source: pd.DataFrame, category: str, schema: SourceSchema = SourceSchema()
+) -> pd.DataFrame:
+    """
+    Pairs the good and the bad sentence of each item into a corpus. The
+    prefix is the good sentence without its last word, the continuations are
+    the last words of both sentences without periods.
+
+    Args:
+        source (pd.DataFrame): One sentence per row.
+        category (str): The relation tested by the items, e.g.
+            'event_plausibility'.
+        schema (SourceSchema): Optional: the columns and labels of the
+            source.
+
+    Returns:
+        pd.DataFrame: The corpus sorted by 'item_id', with 'prefix',
+        'good_continuation', 'bad_continuation', 'category' and, with a
+        score column, 'good_human_score' and 'bad_human_score'.
+    """
+    validate_source(source, schema)
+    # Validated, so an item with two rows has a good and a bad sentence
+    sizes = source.groupby(schema.item_column).size()
+    if (sizes < 2).any():
+        raise ValueError(
+            f"Items {_format_ids(sizes.index[sizes < 2])} lack a good or a "
+            "bad sentence."
+        )
+
+    words = source[schema.sentence_column].astype(str).str.rpartition(" ")
+    pairs = pd.DataFrame({
+        "item_id": source[schema.item_column].to_numpy(),
+        "label": source[schema.label_column].to_numpy(),
+        "prefix": words[0].to_numpy(),
+        "continuation": words[2].str.replace(".", "", regex=False).to_numpy(),
+    })
+    if schema.score_column is not None:
+        pairs["score"] = pd.to_numeric(source[schema.score_column]) \
+            .astype(float).to_numpy()
+    pairs = pairs.pivot(index="item_id", columns="label")
+
+    good, bad = schema.good_label, schema.bad_label
+    corpus = pd.DataFrame({
+        "item_id": pairs.index,
+        "prefix": pairs[("prefix", good)].to_numpy(),
+        "good_continuation": pairs[("continuation", good)].to_numpy(),
+        "bad_continuation": pairs[("continuation", bad)].to_numpy(),
+        "category": category,
+    })
+    if schema.score_column is not None:
+        corpus["good_human_score"] = pairs[("score", good)].to_numpy()
+        corpus["bad_human_score"] = pairs[("score", bad)].to_numpy()
+
+    return corpus
+
+
+def _complete_items(source_path: str, chunk_size: int, schema: SourceSchema):
+    """
+    Reads a source file in chunks and yields the rows of the items whose two
+    sentences have been read. The sentences of the other items are carried
+    over to the next chunk.
+
+    Args:
+        source_path (str): The source file with one sentence per row.
+        chunk_size (int): The number of source rows per chunk.
+        schema (SourceSchema): The columns and labels of the source.
+
+    Yields:
+        pd.DataFrame: The rows of the items completed in a chunk.
+    """
+    item_column = schema.item_column
+    completed = set()
+    pending = None
+
+    for chunk in read_chunks(source_path, chunk_size, schema.columns):
+        if pending is not None:
+            chunk = pd.concat([pending, chunk], ignore_index=True)
+        validate_source(chunk, schema)
+
+        repeated = chunk[item_column].map(completed.__contains__)
+        if repeated.any():
+            raise ValueError(
+                "Duplicate item_ids with more than one sentence per label: "
+                f"{_format_ids(chunk.loc[repeated, item_column].unique())}."
+            )
+
+        sizes = chunk.groupby(item_column)[item_column].transform("size")
+        pending = chunk[sizes < 2]
+        if (sizes == 2).any():
+            completed.update(chunk.loc[sizes == 2, item_column].tolist())
+            yield chunk[sizes == 2]
+
+    if pending is not None and len(pending.index):
+        raise ValueError(
+            f"Items {_format_ids(pending[item_column].unique())} lack a good "
+            "or a bad sentence."
+        )
+
+
+class _CorpusSink:
+    """
+    Appends corpus chunks to a CSV or Parquet file, which is created with
+    the first chunk.
+
+    Args:
+        path (str): The file to write.
+        file_format (str): One of `OUTPUT_FORMATS`.
+    """
+
+    def __init__(self, path: str, file_format: str) -> None:
+        self.path = path
+        self.file_format = file_format
+        self.handle = None
+
+    def write(self, corpus: pd.DataFrame) -> None:
+        """
+        Appends a chunk of the corpus.
+
+        Args:
+            corpus (pd.DataFrame): The chunk.
+        """
+        if self.file_format == "csv":
+            if self.handle is None:
+                # pylint: disable-next=consider-using-with
+                self.handle = open(self.path, "w", encoding="utf-8", newline="")
+            corpus.to_csv(self.handle, header=self.handle.tell() == 0, index=False)
+            return
+
+        table = pa.Table.from_pandas(corpus, preserve_index=False)
+        if self.handle is None:
+            self.handle = pq.ParquetWriter(self.path, table.schema)
+        self.handle.write_table(table.cast(self.handle.schema))
+
+    def close(self) -> None:
+        """
+        Closes the file, if any chunk was written.
+        """
+        if self.handle is not None:
+            self.handle.close()
+
+
+def build_corpus_file(
+    source_path: str, corpus_path: str, category: str,
+    chunk_size: int = 100_000, schema: SourceSchema = SourceSchema()
+) -> int:
+    """
+    Builds a corpus file from a CSV, JSONL or Parquet source file, reading
+    it in chunks. Sentences of items that are not complete at the end of a
+    chunk are carried over to the next one, so the two sentences of an item
+    may be anywhere in the source. Items are written in the order in which
+    they are completed, sorted by 'item_id' within each chunk. The corpus is
+    written to a temporary file first and only replaces `corpus_path` once
+    it is complete.
+
+    Args:
+        source_path (str): The source file with one sentence per row.
+        corpus_path (str): The corpus file to write, '.csv' or '.parquet',
+            e.g. 'data/{dataset}/corpus.parquet'.
+        category (str): The relation tested by the items.
+        chunk_size (int): Optional: the number of source rows per chunk.
+        schema (SourceSchema): Optional: the columns and labels of the
+            source.
+
+    Returns:
+        int: The number of items written.
+    """
+    file_format = os.path.splitext(corpus_path)[1].lstrip(".")
+    if file_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Unknown corpus format of '{corpus_path}', expected one of "
+            f"{', '.join(OUTPUT_FORMATS)}."
+        )
+
+    tmp_path = f"{corpus_path}.tmp-{os.getpid()}"
+    n_items = 0
+    try:
+        with contextlib.closing(_CorpusSink(tmp_path, file_format)) as sink:
+            for rows in _complete_items(source_path, chunk_size, schema):
+                corpus = build_corpus(rows, category, schema)
+                sink.write(corpus)
+                n_items += len(corpus.index)
+        if not n_items:
+            raise ValueError(f"Source data '{source_path}' has no items.")
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    os.replace(tmp_path, corpus_path)
+    print(f"Wrote {n_items} items to {corpus_path}.")
+
+    return n_items
+
+
+def main() -> None:
+    """
+    Builds a corpus file from source data with one sentence per row.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(
+        description="Build a minimal pair corpus from sentence-level data."
+    )
+    parser.add_argument(
+        "source", type=str,
+        help="Source file with one sentence per row, CSV, JSONL or Parquet."
+    )
+    parser.add_argument(
+        "corpus", type=str,
+        help="Corpus file to write, e.g. 'data/{dataset}/corpus.parquet'."
+    )
+    parser.add_argument(
+        "--category", type=str, required=True,
+        help="The relation tested by the items, e.g. 'event_plausibility'."
+    )
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--item-column", type=str, default="ItemNum")
+    parser.add_argument("--sentence-column", type=str, default="Sentence")
+    parser.add_argument("--label-column", type=str, default="Plausibility")
+    parser.add_argument(
+        "--score-column", type=str, default="Score",
+        help="Column of human ratings, stored as 'good_human_score' and\
+              'bad_human_score'. Pass an empty string if there are none."
+    )
+    parser.add_argument("--good-label", type=str, default="Plausible")
+    parser.add_argument("--bad-label", type=str, default="Implausible")
+    args = parser.parse_args()
+
+    build_corpus_file(
+        args.source, args.corpus, args.category, chunk_size=args.chunk_size,
+        schema=SourceSchema(
+            item_column=args.item_column, sentence_column=args.sentence_column,
+            label_column=args.label_column,
+            score_column=args.score_column or None,
+            good_label=args.good_label, bad_label=args.bad_label
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
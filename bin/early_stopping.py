@@ -0,0 +1,186 @@
+"""
+Module for sequential early stopping of an evaluation.
+
+For screening many checkpoints, the accuracy on a dataset often does not need
+all of its items. With early stopping, the items are scored in a random
+order, seeded with SEED from 'bin/io.py' so that every revision sees the same
+order, and a Wilson confidence interval of the running accuracy is kept for
+each relation and type. The dataset is stopped once every group is either
+scored completely, or has an interval narrower than the target width or
+entirely above or below a threshold accuracy such as chance.
+
+The items scored are a simple random sample of the corpus, so the accuracy
+of a dataset is estimated without bias; `analysis_tools.aggregate_metrics`
+weights items by the 'n_total' / 'n_scored' ratio stored in the metadata when
+it pools datasets.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from bin.io import SEED
+
+
+# Corpus columns defining the groups whose accuracy is tracked
+GROUP_COLUMNS = ["category", "type"]
+
+
+def wilson_interval(
+    n_correct: np.ndarray, n_items: np.ndarray, confidence: float = 0.95
+) -> tuple:
+    """
+    Computes Wilson score intervals of accuracies.
+
+    Args:
+        n_correct (np.ndarray): The number of correct items per group.
+        n_items (np.ndarray): The number of scored items per group.
+        confidence (float): Optional: the confidence level.
+
+    Returns:
+        tuple: The lower and upper bounds, (0, 1) for groups without items.
+    """
+    n_correct = np.asarray(n_correct, dtype=float)
+    n_items = np.asarray(n_items, dtype=float)
+    z = stats.norm.ppf(1 - (1 - confidence) / 2)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        accuracy = n_correct / n_items
+        denominator = 1 + z ** 2 / n_items
+        center = (accuracy + z ** 2 / (2 * n_items)) / denominator
+        half_width = z * np.sqrt(
+            accuracy * (1 - accuracy) / n_items + z ** 2 / (4 * n_items ** 2)
+            ) / denominator
+
+    empty = n_items == 0
+    low = np.where(empty, 0.0, np.clip(center - half_width, 0.0, 1.0))
+    high = np.where(empty, 1.0, np.clip(center + half_width, 0.0, 1.0))
+
+    return low, high
+
+
+class EarlyStopping:
+    """
+    Running accuracy of each relation and type of a dataset scored in a
+    seeded random order, see the module docstring.
+
+    Args:
+        target_width (float): Optional: a group may stop once its interval
+            is at most this wide.
+        threshold (float): Optional: a group may also stop once its interval
+            lies entirely above or below this accuracy, e.g. 0.5.
+        confidence (float): Optional: the confidence level of the intervals.
+        min_items (int): Optional: the number of items a group needs before
+            it may stop.
+        seed (int): Optional: the seed of the item order, SEED by default.
+    """
+
+    def __init__(
+        self, target_width: float = 0.1, threshold: float = None,
+        confidence: float = 0.95, min_items: int = 30, seed: int = SEED
+    ) -> None:
+        if not 0 < target_width <= 1:
+            raise ValueError("Target width must be in (0, 1].")
+
+        self.target_width = target_width
+        self.threshold = threshold
+        self.confidence = confidence
+        self.min_items = min_items
+        self.seed = seed
+        self.columns = []
+        self.counts = pd.DataFrame()
+
+    def order(self, corpus: pd.DataFrame) -> pd.DataFrame:
+        """
+        Shuffles the items of a corpus and starts counting its groups anew.
+
+        Args:
+            corpus (pd.DataFrame): The whole corpus, see `bin.corpus`.
+
+        Returns:
+            pd.DataFrame: The items in the order to score them, still indexed
+            by their position in the corpus.
+        """
+        self.columns = [column for column in GROUP_COLUMNS if column in corpus]
+        self.counts = corpus.groupby(self.columns).size() \
+            .to_frame("n_total").assign(n_scored=0, n_correct=0)
+
+        rng = np.random.default_rng(self.seed)
+        return corpus.iloc[rng.permutation(len(corpus.index))]
+
+    def update(self, items: pd.DataFrame, correct: np.ndarray) -> None:
+        """
+        Counts scored items.
+
+        Args:
+            items (pd.DataFrame): The scored corpus items.
+            correct (np.ndarray): Whether the model preferred the good
+                continuation of each item.
+        """
+        if items.empty:
+            return
+
+        scored = items[self.columns].assign(
+            correct=np.asarray(correct, dtype=int)
+            ).groupby(self.columns).correct.agg(["size", "sum"])
+        self.counts.loc[scored.index, "n_scored"] += scored["size"]
+        self.counts.loc[scored.index, "n_correct"] += scored["sum"]
+
+    def groups(self) -> pd.DataFrame:
+        """
+        Returns the running accuracy of each group.
+
+        Returns:
+            pd.DataFrame: The group keys, 'n_scored', 'n_total', 'accuracy',
+            'ci_low', 'ci_high' and whether the group is 'done'.
+        """
+        counts = self.counts.reset_index()
+        low, high = wilson_interval(
+            counts.n_correct, counts.n_scored, self.confidence
+            )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            counts["accuracy"] = counts.n_correct / counts.n_scored
+        counts["ci_low"], counts["ci_high"] = low, high
+
+        decided = high - low <= self.target_width
+        if self.threshold is not None:
+            decided |= (low > self.threshold) | (high < self.threshold)
+        counts["done"] = (counts.n_scored >= counts.n_total) \
+            | ((counts.n_scored >= self.min_items) & decided)
+
+        return counts.drop(columns="n_correct")
+
+    def done(self) -> bool:
+        """
+        Checks whether all groups may stop.
+
+        Returns:
+            bool: Whether scoring can stop.
+        """
+        return bool(self.groups().done.all())
+
+    def summary(self) -> dict:
+        """
+        Returns the settings and the final state of each group, for the
+        metadata of an output file.
+
+        Returns:
+            dict: The settings and a list of groups, see `groups`.
+        """
+        groups = self.groups().rename(columns={"category": "relation"})
+
+        return {
+            "seed": self.seed,
+            "target_width": self.target_width,
+            "threshold": self.threshold,
+            "confidence": self.confidence,
+            "min_items": self.min_items,
+            "groups": [
+                {
+                    key: None if pd.isna(value)
+                    else value.item() if isinstance(value, np.generic)
+                    else value
+                    for key, value in group.items()
+                }
+                for group in groups.to_dict("records")
+            ],
+        }
@@ -4,19 +4,64 @@ Module for initializing models and handling JSON operations.
 This module provides utility functions to initialize language models
 for scoring and to handle JSON operations such as writing dictionaries
 to JSON files.
+
+torch, transformers and minicons are only imported once a model or tokenizer
+is loaded, so that command line validation and dry runs start quickly.
 """
 
+# pylint: disable=import-outside-toplevel
+import gc
 import json
+from dataclasses import dataclass
 from datetime import datetime
-from minicons import scorer
-import torch
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from minicons import scorer
 
 
 SEED = 42
-torch.manual_seed(SEED)
-torch.cuda.manual_seed(SEED)
-torch.backends.cudnn.deterministic = True
-torch.set_grad_enabled(False)
+
+# Dtype of the weights for each precision. Dynamically quantized models are
+# loaded in full precision and their linear layers quantized afterwards.
+PRECISIONS = {
+    "fp32": "float32",
+    "bf16": "bfloat16",
+    "fp16": "float16",
+    "int8-dynamic": "float32",
+}
+BACKENDS = ["minicons", "target"]
+
+
+@dataclass(frozen=True)
+class ModelOptions:
+    """
+    How the weights of a model are loaded and scored, the same for all
+    revisions and replicas of a run.
+
+    Args:
+        precision (str): Optional: one of `PRECISIONS`. 'int8-dynamic'
+            quantizes the weights of the linear layers to int8 with dynamic
+            activation quantization on CPU, and loads the model in 8 bit with
+            bitsandbytes on GPUs.
+        backend (str): Optional: 'minicons' scores with minicons, 'target'
+            with a `TargetScorer` that only computes the log probabilities
+            of the target tokens, using much less memory per batch.
+    """
+    precision: str = "bf16"
+    backend: str = "minicons"
+
+    def __post_init__(self) -> None:
+        if self.precision not in PRECISIONS:
+            raise ValueError(
+                f"Unknown precision '{self.precision}', expected one of "
+                f"{', '.join(PRECISIONS)}."
+            )
+        if self.backend not in BACKENDS:
+            raise ValueError(
+                f"Unknown backend '{self.backend}', expected one of "
+                f"{', '.join(BACKENDS)}."
+            )
 
 
 def timestamp() -> str:
@@ -38,7 +83,23 @@ def dict2json(input_dict: dict, out_file: str) -> None:
         json.dump(input_dict, file, indent=2)
 
 
-def initialize_model(model_name: str, revision: str) -> scorer.IncrementalLMScorer:
+def configure_torch() -> None:
+    """
+    Seeds torch and disables gradients for scoring. Called before a model is
+    loaded rather than at import time.
+    """
+    import torch
+
+    torch.manual_seed(SEED)
+    torch.cuda.manual_seed(SEED)
+    torch.backends.cudnn.deterministic = True
+    torch.set_grad_enabled(False)
+
+
+def initialize_model(
+    model_name: str, revision: str, tokenizer=None, device: str = None,
+    options: ModelOptions = None
+) -> "scorer.IncrementalLMScorer":
     """
     Initializes the model for scoring. Supports all models supported by the
     current Huggingface Transformers library.
@@ -46,11 +107,28 @@ def initialize_model(model_name: str, revision: str) -> scorer.IncrementalLMScor
     Args:
         model_name (str): The name of the model.
         revision (str): The revision of the model.
+        tokenizer: Optional: an already loaded tokenizer, so that only the
+            weights are loaded, e.g. when sweeping over revisions.
+        device (str): Optional: the device to load the model on, e.g.
+            'cuda:1' for one replica of a data-parallel run. By default, all
+            available GPUs or the CPU are used.
+        options (ModelOptions): Optional: the precision and scoring backend,
+            bf16 with minicons by default.
 
     Returns:
         scorer.IncrementalLMScorer: The initialized model scorer.
     """
-    if torch.cuda.is_available():
+    options = options or ModelOptions()
+
+    import torch
+    from minicons import scorer
+    from bin.target_scorer import TargetScorer
+
+    configure_torch()
+
+    if device is not None:
+        device = torch.device(device)
+    elif torch.cuda.is_available():
         if torch.cuda.device_count() > 1:
             device = 'auto'  # passed as 'device_map' to IncrementalLMScorer
             print("Multiple GPUs detected! Using all available GPUs.")
@@ -61,10 +139,116 @@ def initialize_model(model_name: str, revision: str) -> scorer.IncrementalLMScor
         device = torch.device("cpu")
         print("Using CPU (CUDA unavailable); adjust your expectations.")
 
-    model = scorer.IncrementalLMScorer(
+    kwargs = {} if tokenizer is None else {"tokenizer": tokenizer}
+    on_cpu = device != 'auto' and device.type == "cpu"
+    torch_dtype = getattr(torch, PRECISIONS[options.precision])
+    if options.precision == "int8-dynamic" and not on_cpu:
+        from transformers import BitsAndBytesConfig
+        kwargs["quantization_config"] = BitsAndBytesConfig(load_in_8bit=True)
+        torch_dtype = torch.float16
+
+    scorer_class = TargetScorer if options.backend == "target" \
+        else scorer.IncrementalLMScorer
+    model = scorer_class(
             model=model_name, device=device, revision=revision,
-            torch_dtype=torch.bfloat16,
-            low_cpu_mem_usage=True
+            torch_dtype=torch_dtype,
+            low_cpu_mem_usage=True, **kwargs
         )
 
+    if options.precision == "int8-dynamic":
+        if on_cpu:
+            torch.ao.quantization.quantize_dynamic(
+                model.model, {torch.nn.Linear}, dtype=torch.qint8,
+                inplace=True
+                )
+        model.precision = options.precision
+
     return model
+
+
+def model_dtype(model: "scorer.IncrementalLMScorer") -> str:
+    """
+    Returns the name of the dtype a model scores in, e.g. to key cached
+    scores. Quantized models and the target-only backend, which normalizes
+    in float32, are told apart from minicons models of the same dtype.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model.
+
+    Returns:
+        str: The dtype name, e.g. 'torch.bfloat16'.
+    """
+    from bin.target_scorer import TargetScorer
+
+    dtype = str(model.model.dtype)
+    if getattr(model, "precision", None) == "int8-dynamic":
+        dtype += "+int8-dynamic"
+    if isinstance(model, TargetScorer):
+        dtype += "+target"
+
+    return dtype
+
+
+def expected_dtype(options: ModelOptions = None) -> str:
+    """
+    Returns the dtype name `model_dtype` gives a model initialized with
+    `initialize_model` on this machine, without loading it. torch is only
+    imported for 'int8-dynamic', whose dtype depends on the device.
+
+    Args:
+        options (ModelOptions): Optional: the precision and scoring backend.
+
+    Returns:
+        str: The dtype name, e.g. 'torch.bfloat16'.
+    """
+    options = options or ModelOptions()
+    dtype = f"torch.{PRECISIONS[options.precision]}"
+    if options.precision == "int8-dynamic":
+        import torch
+
+        # Loaded in 8 bit with float16 activations on GPUs
+        if torch.cuda.is_available():
+            dtype = "torch.float16"
+        dtype += "+int8-dynamic"
+    if options.backend == "target":
+        dtype += "+target"
+
+    return dtype
+
+
+def load_tokenizer(model_name: str):
+    """
+    Loads the tokenizer of a model, the same way the minicons scorer does.
+    Checkpoints of a model suite share this tokenizer.
+
+    Args:
+        model_name (str): The name of the model.
+
+    Returns:
+        transformers.PreTrainedTokenizerBase: The tokenizer.
+    """
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+
+    # Same padding as set by the scorer, which warns when it has to change
+    # a tokenizer it was given
+    if tokenizer.pad_token is None and tokenizer.eos_token is not None:
+        tokenizer.pad_token_id = tokenizer.eos_token_id
+
+    return tokenizer
+
+
+def free_model(model: "scorer.IncrementalLMScorer") -> None:
+    """
+    Releases the weights of a model before the next one is loaded.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model to release.
+    """
+    import torch
+
+    model.model = None
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
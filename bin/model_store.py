@@ -0,0 +1,168 @@
+"""
+Module for a local store of pre-converted model weights.
+
+Each (model, revision, dtype) is downloaded and converted once into a local
+directory with a safetensors file already in the target dtype, next to the
+tokenizer. Later loads read that directory, so nothing is cast or downloaded
+again; safetensors files are memory-mapped when loaded, and the store also
+works without network access. Revisions can be converted ahead of a sweep:
+
+    python -m bin.model_store EleutherAI/pythia-14m step1000..step5000:1000
+"""
+
+import argparse
+import json
+import os
+import shutil
+from bin.io import timestamp
+from bin.sweep import parse_revisions
+
+
+DEFAULT_STORE = os.path.join(".cache", "models")
+INFO_FILE = "store.json"
+
+
+def store_path(
+    model_name: str, revision: str, dtype: str = "bfloat16",
+    root: str = DEFAULT_STORE
+) -> str:
+    """
+    Returns the directory of a model revision in the store.
+
+    Args:
+        model_name (str): The name of the model.
+        revision (str): The revision of the model.
+        dtype (str): Optional: the dtype of the stored weights.
+        root (str): Optional: the store directory.
+
+    Returns:
+        str: The directory of the stored model.
+    """
+    name = model_name.strip("/").replace("/", "--")
+
+    return os.path.join(root, name, revision, dtype)
+
+
+def is_stored(path: str) -> bool:
+    """
+    Checks whether a store directory holds a completely converted model.
+
+    Args:
+        path (str): The directory, see `store_path`.
+
+    Returns:
+        bool: Whether the conversion finished.
+    """
+    return os.path.isfile(os.path.join(path, INFO_FILE))
+
+
+def convert_model(
+    model_name: str, revision: str, dtype: str = "bfloat16",
+    root: str = DEFAULT_STORE
+) -> str:
+    """
+    Downloads a model revision, casts it to the dtype and saves it to the
+    store as safetensors together with its tokenizer. The directory is only
+    put in place once complete, so an interrupted conversion is redone.
+
+    Args:
+        model_name (str): The name of the model.
+        revision (str): The revision of the model.
+        dtype (str): Optional: the dtype of the stored weights.
+        root (str): Optional: the store directory.
+
+    Returns:
+        str: The directory of the stored model.
+    """
+    # Imported only here, so that looking up stored revisions stays fast
+    # pylint: disable-next=import-outside-toplevel
+    import torch
+    # pylint: disable-next=import-outside-toplevel
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    path = store_path(model_name, revision, dtype, root)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name, revision=revision, torch_dtype=getattr(torch, dtype),
+        low_cpu_mem_usage=True
+        )
+    model.save_pretrained(tmp_path, safe_serialization=True)
+    AutoTokenizer.from_pretrained(
+        model_name, revision=revision, use_fast=True
+        ).save_pretrained(tmp_path)
+    with open(os.path.join(tmp_path, INFO_FILE), "w", encoding="utf-8") as file:
+        json.dump({
+            "model": model_name, "revision": revision, "dtype": dtype,
+            "converted": timestamp(),
+        }, file, indent=2)
+
+    del model
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def ensure_stored(
+    model_name: str, revision: str, dtype: str = "bfloat16",
+    root: str = DEFAULT_STORE, offline: bool = False
+) -> str:
+    """
+    Returns the store directory of a model revision, converting it first if
+    it is not in the store yet.
+
+    Args:
+        model_name (str): The name of the model.
+        revision (str): The revision of the model.
+        dtype (str): Optional: the dtype of the stored weights.
+        root (str): Optional: the store directory.
+        offline (bool): Optional: never download; raise if the revision is
+            missing from the store.
+
+    Returns:
+        str: The directory of the stored model, loadable like a Huggingface
+        model.
+    """
+    path = store_path(model_name, revision, dtype, root)
+    if is_stored(path):
+        return path
+
+    if offline:
+        raise FileNotFoundError(
+            f"Revision '{revision}' of '{model_name}' ({dtype}) is not in the "
+            f"model store '{root}'. Convert it first with "
+            f"'python -m bin.model_store {model_name} {revision}'."
+        )
+
+    print(f"Converting {model_name}@{revision} to {dtype} in {path}...")
+    return convert_model(model_name, revision, dtype, root)
+
+
+def main() -> None:
+    """
+    Converts revisions of a model into the store ahead of a sweep.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(
+        description="Convert model revisions into the local model store."
+    )
+    parser.add_argument("model_name", type=str)
+    parser.add_argument("revisions", type=parse_revisions)
+    parser.add_argument("--dtype", type=str, default="bfloat16")
+    parser.add_argument("--store", type=str, default=DEFAULT_STORE)
+    args = parser.parse_args()
+
+    for revision in args.revisions:
+        print(ensure_stored(args.model_name, revision, args.dtype, args.store))
+
+
+if __name__ == "__main__":
+    main()
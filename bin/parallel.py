@@ -0,0 +1,150 @@
+"""
+Module for data-parallel scoring with several model replicas.
+
+A DataParallelScorer starts one worker process per replica, each holding its
+own copy of the model on a separate GPU or on a group of CPU threads. The
+scoring functions plan their batches as for a single model and hand whole
+batches to the workers, so every stimulus is scored in the same batch and
+the merged results match a single-worker run.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import torch
+from bin.io import ModelOptions, initialize_model, model_dtype
+
+
+# Model replica of the current worker process
+_MODEL = None
+
+
+def default_devices(workers: int) -> list:
+    """
+    Returns one device per worker: the available GPUs in turn, or the CPU.
+
+    Args:
+        workers (int): The number of workers.
+
+    Returns:
+        list: The device name of each worker.
+    """
+    if torch.cuda.is_available():
+        return [f"cuda:{i % torch.cuda.device_count()}" for i in range(workers)]
+
+    return ["cpu"] * workers
+
+
+def _init_worker(
+    model_name: str, revision: str, tokenizer, devices, options: ModelOptions
+) -> None:
+    """
+    Loads the model replica of a worker process.
+
+    Args:
+        model_name (str): The name of the model.
+        revision (str): The revision of the model.
+        tokenizer: The tokenizer shared by all replicas.
+        devices (multiprocessing.Queue): The device and number of CPU threads
+            of each worker not yet started.
+        options (ModelOptions): The precision and backend of the replicas.
+    """
+    global _MODEL  # pylint: disable=global-statement
+    device, num_threads = devices.get()
+    torch.set_num_threads(num_threads)
+    torch.set_grad_enabled(False)
+    _MODEL = initialize_model(
+        model_name, revision, tokenizer=tokenizer, device=device,
+        options=options
+        )
+
+
+def _run_task(function, task: tuple):
+    """
+    Runs a scoring function on the model replica of the worker process.
+
+    Args:
+        function (callable): The scoring function.
+        task (tuple): The remaining arguments of the call.
+
+    Returns:
+        The result of the call.
+    """
+    return function(_MODEL, *task)
+
+
+def _model_dtype() -> str:
+    """
+    Returns the dtype of the model replica of the worker process.
+
+    Returns:
+        str: The dtype name.
+    """
+    return model_dtype(_MODEL)
+
+
+class DataParallelScorer:
+    """
+    Scores batches on several model replicas in worker processes. It can be
+    passed to `run_experiment` in place of an IncrementalLMScorer.
+
+    Args:
+        model_name (str): The name of the model.
+        revision (str): The revision of the model.
+        tokenizer: The tokenizer of the model.
+        devices (list): The device of each worker process, see
+            `default_devices`. The CPU cores are divided evenly among the
+            workers.
+        options (ModelOptions): Optional: the precision and backend of the
+            replicas.
+    """
+
+    def __init__(
+        self, model_name: str, revision: str, tokenizer, devices: list,
+        options: ModelOptions = None
+    ) -> None:
+        if not devices:
+            raise ValueError("Number of workers must be a positive integer.")
+
+        workers = len(devices)
+        num_threads = max(1, (os.cpu_count() or 1) // workers)
+
+        self.tokenizer = tokenizer
+        self.workers = workers
+        self.devices = devices
+
+        context = multiprocessing.get_context("spawn")
+        device_queue = context.Queue()
+        for device in devices:
+            device_queue.put((device, num_threads))
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=context,
+            initializer=_init_worker,
+            initargs=(
+                model_name, revision, tokenizer, device_queue,
+                options or ModelOptions()
+            )
+        )
+        self.dtype = self.pool.submit(_model_dtype).result()
+        print(f"Started {workers} scoring workers on {', '.join(devices)}.")
+
+    def map(self, function, tasks: list):
+        """
+        Runs `function(model, *task)` for each task on the workers.
+
+        Args:
+            function (callable): A module-level scoring function.
+            tasks (list): The remaining arguments of each call.
+
+        Returns:
+            Iterator over the results, in task order.
+        """
+        return self.pool.map(
+            _run_task, [function] * len(tasks), tasks, chunksize=1
+            )
+
+    def close(self) -> None:
+        """
+        Shuts down the worker processes and frees their models.
+        """
+        self.pool.shutdown()
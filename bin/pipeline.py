@@ -0,0 +1,227 @@
+"""
+Module for running the stages of an experiment as a threaded pipeline.
+
+In pipelined mode, the corpus is read and the next chunk prepared in a
+producer thread while the current chunk is scored, and the results are built
+and written in a consumer thread. The stages are connected by bounded queues,
+so at most a few chunks are held in memory. The forward pass and file I/O
+release the GIL, so the threads overlap in practice.
+
+Each queue records its depth and how long its producer waited for space
+(the consumer is the bottleneck) or its consumer waited for items (the
+producer is the bottleneck), see `Pipeline.metrics`.
+"""
+
+import contextlib
+import queue
+import threading
+import time
+from dataclasses import dataclass
+
+
+# Marks the end of a queue
+_DONE = object()
+
+
+@dataclass(frozen=True)
+class _Error:
+    """
+    Carries an exception from a pipeline thread to the main thread.
+
+    Args:
+        error (BaseException): The exception.
+    """
+    error: BaseException
+
+
+class MeteredQueue(queue.Queue):
+    """
+    A bounded queue that records its depth and waiting times.
+
+    Args:
+        maxsize (int): The capacity of the queue.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        super().__init__(maxsize)
+        self.items = 0
+        self.depth_sum = 0
+        self.max_depth = 0
+        self.put_wait = 0.0
+        self.get_wait = 0.0
+
+    def put_item(self, item, stop: threading.Event = None) -> bool:
+        """
+        Puts an item into the queue, waiting for space.
+
+        Args:
+            item: The item.
+            stop (threading.Event): Optional: gives up waiting once set.
+
+        Returns:
+            bool: Whether the item was put into the queue.
+        """
+        start = time.perf_counter()
+        while True:
+            try:
+                self.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                if stop is not None and stop.is_set():
+                    return False
+        self.put_wait += time.perf_counter() - start
+        return True
+
+    def get_item(self):
+        """
+        Takes the next item from the queue, waiting for one.
+
+        Returns:
+            The item.
+        """
+        start = time.perf_counter()
+        item = self.get()
+        self.get_wait += time.perf_counter() - start
+        if item is not _DONE:
+            depth = self.qsize() + 1
+            self.items += 1
+            self.depth_sum += depth
+            self.max_depth = max(self.max_depth, depth)
+
+        return item
+
+    def metrics(self) -> dict:
+        """
+        Returns the recorded metrics of the queue.
+
+        Returns:
+            dict: Capacity, number of items, mean and maximum depth when an
+            item was taken, and the seconds the producer waited for space and
+            the consumer waited for items.
+        """
+        return {
+            "capacity": self.maxsize,
+            "items": self.items,
+            "mean_depth": self.depth_sum / self.items if self.items else 0.0,
+            "max_depth": self.max_depth,
+            "put_wait_seconds": self.put_wait,
+            "get_wait_seconds": self.get_wait,
+        }
+
+
+class Pipeline:
+    """
+    Connects the stages of an experiment with threads and bounded queues.
+
+    Args:
+        queue_size (int): Optional: the capacity of each queue.
+    """
+
+    def __init__(self, queue_size: int = 2) -> None:
+        if queue_size < 1:
+            raise ValueError("Queue size must be a positive integer.")
+
+        self.queue_size = queue_size
+        self.queues = {}
+
+    def _queue(self, name: str) -> MeteredQueue:
+        if name in self.queues:
+            raise ValueError(f"Pipeline already has a queue '{name}'.")
+        self.queues[name] = MeteredQueue(self.queue_size)
+        return self.queues[name]
+
+    def prefetch(self, iterable, name: str):
+        """
+        Iterates over `iterable` in a producer thread, ahead of the consumer.
+
+        Args:
+            iterable: The items to produce, e.g. a generator of corpus
+                chunks.
+            name (str): The name of the queue in the metrics.
+
+        Yields:
+            The items of `iterable`, in order. Exceptions of the producer are
+            raised here.
+        """
+        items = self._queue(name)
+        stop = threading.Event()
+
+        def produce() -> None:
+            try:
+                for item in iterable:
+                    if not items.put_item(item, stop):
+                        return
+            except BaseException as error:  # pylint: disable=broad-except
+                items.put_item(_Error(error), stop)
+                return
+            items.put_item(_DONE, stop)
+
+        thread = threading.Thread(
+            target=produce, name=f"pipeline-{name}", daemon=True
+            )
+        thread.start()
+        try:
+            while True:
+                item = items.get_item()
+                if item is _DONE:
+                    break
+                if isinstance(item, _Error):
+                    raise item.error
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+    @contextlib.contextmanager
+    def consume(self, function, name: str):
+        """
+        Runs `function(item)` for each item put in a consumer thread.
+
+        Args:
+            function (callable): Handles one item, e.g. writes results.
+            name (str): The name of the queue in the metrics.
+
+        Yields:
+            callable: Puts an item into the queue. Waits for all items to be
+            handled on exit, and raises the first exception of the consumer.
+        """
+        items = self._queue(name)
+        errors = []
+
+        def run() -> None:
+            while True:
+                item = items.get_item()
+                if item is _DONE:
+                    return
+                if errors:
+                    continue  # Drain the queue after a failure
+                try:
+                    function(item)
+                except BaseException as error:  # pylint: disable=broad-except
+                    errors.append(error)
+
+        def put(item) -> None:
+            if errors:
+                raise errors[0]
+            items.put_item(item)
+
+        thread = threading.Thread(target=run, name=f"pipeline-{name}", daemon=True)
+        thread.start()
+        try:
+            yield put
+        finally:
+            items.put_item(_DONE)
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def metrics(self) -> dict:
+        """
+        Returns the metrics of all queues, for the 'meta' block of the
+        output file.
+
+        Returns:
+            dict: The metrics of each queue by name, see
+            `MeteredQueue.metrics`.
+        """
+        return {name: items.metrics() for name, items in self.queues.items()}
@@ -0,0 +1,214 @@
+"""
+Module for comparing the scores of a model across precisions.
+
+Scoring in bf16, fp16 or with int8 dynamic quantization is faster or lighter
+than fp32 on many devices, but changes the log probabilities slightly. This
+module scores a dataset once in fp32 as the reference and once in each
+candidate precision, and reports the time taken, the per-item drift of the
+log probabilities and the change in accuracy, so that the fastest precision
+with acceptable drift can be picked:
+
+    python -m bin.precision EleutherAI/pythia-14m dtfit --batch-size 32
+"""
+
+import argparse
+import os
+import time
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from bin.corpus import find_corpus, read_corpus
+from bin.io import (
+    PRECISIONS, ModelOptions, free_model, initialize_model, load_tokenizer
+)
+from bin.scoring import ScoringOptions, build_stimuli, score_corpus
+from bin.tokenized_corpus import load_tokenized_corpus
+
+
+REFERENCE = "fp32"
+
+
+@dataclass(frozen=True)
+class PrecisionRun:
+    """
+    The model a dataset is scored with in each precision, and how.
+
+    Args:
+        model_name (str): The name of the model.
+        revision (str): Optional: the revision of the model.
+        batch_size (int): Optional: number of stimuli per forward pass.
+        device (str): Optional: the device to score on.
+    """
+    model_name: str
+    revision: str = "main"
+    batch_size: int = None
+    device: str = None
+
+
+def score_precision(
+    run: PrecisionRun, precision: str, tokenizer, tokenized
+) -> tuple:
+    """
+    Scores all stimuli of a tokenized corpus in one precision.
+
+    Args:
+        run (PrecisionRun): The model and scoring settings.
+        precision (str): One of `bin.io.PRECISIONS`.
+        tokenizer: The tokenizer of the model.
+        tokenized (TokenizedCorpus): The tokenized stimuli.
+
+    Returns:
+        tuple: The mean log probability of each stimulus as np.ndarray, and
+        the scoring time in seconds.
+    """
+    model = initialize_model(
+        run.model_name, run.revision, tokenizer=tokenizer, device=run.device,
+        options=ModelOptions(precision=precision)
+        )
+    indices = list(range(len(tokenized.lengths)))
+
+    start = time.perf_counter()
+    scores = score_corpus(
+        model, tokenized.token_ids(indices), tokenized.prefix_lengths,
+        ScoringOptions(batch_size=run.batch_size)
+        )
+    seconds = time.perf_counter() - start
+    free_model(model)
+
+    return np.asarray(scores, dtype=np.float64), seconds
+
+
+def _compare_scores(df: pd.DataFrame, scores: dict, seconds: dict) -> tuple:
+    """
+    Compares the scores of each precision with the fp32 reference.
+
+    Args:
+        df (pd.DataFrame): The corpus.
+        scores (dict): The scores of the good and bad continuation of each
+            item, interleaved, per precision.
+        seconds (dict): The scoring time per precision.
+
+    Returns:
+        tuple: The summary and the per-item drift, see `compare_precisions`.
+    """
+    reference = scores[REFERENCE].reshape(-1, 2)
+    reference_correct = reference[:, 0] > reference[:, 1]
+
+    summary, items = [], []
+    for precision, precision_scores in scores.items():
+        pairs = precision_scores.reshape(-1, 2)
+        drift = pairs - reference
+        correct = pairs[:, 0] > pairs[:, 1]
+        summary.append({
+            "precision": precision,
+            "seconds": seconds[precision],
+            "speedup": seconds[REFERENCE] / seconds[precision],
+            "mean_abs_drift": float(np.abs(drift).mean()),
+            "max_abs_drift": float(np.abs(drift).max()),
+            "accuracy": float(correct.mean()),
+            "accuracy_change": float(correct.mean() - reference_correct.mean()),
+            "flipped_items": int((correct != reference_correct).sum()),
+        })
+        if precision != REFERENCE:
+            items.append(pd.DataFrame({
+                "item_id": df.item_id,
+                "precision": precision,
+                "drift_of_good_continuation": drift[:, 0],
+                "drift_of_bad_continuation": drift[:, 1],
+                "flipped": correct != reference_correct,
+            }))
+
+    items = pd.concat(items, ignore_index=True) if items else pd.DataFrame()
+
+    return pd.DataFrame(summary), items
+
+
+def compare_precisions(
+    run: PrecisionRun, dataset: str, precisions: list
+) -> tuple:
+    """
+    Scores a dataset in fp32 and in each of the given precisions, and
+    compares the scores with the fp32 reference.
+
+    Args:
+        run (PrecisionRun): The model and scoring settings.
+        dataset (str): The dataset in 'data' of the working directory.
+        precisions (list): The precisions to compare, see
+            `bin.io.PRECISIONS`.
+
+    Returns:
+        tuple: The summary with one row per precision (scoring time, speedup,
+        mean and maximum absolute drift, accuracy, accuracy change and number
+        of items whose decision flipped), and the per-item drift of the good
+        and bad continuation in each precision.
+    """
+    corpus_path = find_corpus(dataset)
+    df = read_corpus(corpus_path)
+    tokenizer = load_tokenizer(run.model_name)
+    tokenized = load_tokenized_corpus(
+        corpus_path, tokenizer,
+        [([prefix for prefix in df.prefix for _ in range(2)], build_stimuli(df))]
+        )
+
+    scores, seconds = {}, {}
+    for precision in [REFERENCE] + [p for p in precisions if p != REFERENCE]:
+        print(f"Scoring {dataset} in {precision}...")
+        scores[precision], seconds[precision] = score_precision(
+            run, precision, tokenizer, tokenized
+            )
+
+    return _compare_scores(df, scores, seconds)
+
+
+def main() -> None:
+    """
+    Compares the precisions of a model on a dataset and saves the per-item
+    drift as CSV.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare the scores of a model in several precisions "
+                    "with fp32."
+    )
+    parser.add_argument("model_name", type=str)
+    parser.add_argument("dataset", type=str)
+    parser.add_argument("--revision", type=str, default="main")
+    parser.add_argument(
+        "--precisions", type=str, nargs="+", choices=list(PRECISIONS),
+        default=["bf16", "fp16", "int8-dynamic"]
+    )
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--device", type=str, default=None)
+    parser.add_argument(
+        "--output", type=str, default=None,
+        help="Path to the per-item drift CSV, default is\
+              'results/{dataset}/precision_{model}_{revision}.csv'."
+    )
+    args = parser.parse_args()
+
+    summary, items = compare_precisions(
+        PrecisionRun(
+            args.model_name, revision=args.revision,
+            batch_size=args.batch_size, device=args.device
+        ),
+        args.dataset, args.precisions
+    )
+    print(summary.to_string(index=False))
+
+    output = args.output or os.path.join(
+        "results", args.dataset,
+        f"precision_{args.model_name.rstrip('/').split('/')[-1]}_"
+        f"{args.revision}.csv"
+        )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    items.to_csv(output, index=False)
+    print(f"Per-item drift saved to: {output}")
+
+
+if __name__ == "__main__":
+    main()
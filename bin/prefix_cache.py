@@ -0,0 +1,271 @@
+"""
+Module for scoring stimuli that share a prefix with a cached prefix pass.
+
+Each distinct prefix among the stimuli scored together, one chunk of the
+corpus in `run_experiment`, is run through the model once. Its
+past_key_values are then reused to score the continuations of that prefix in
+forward passes of at most the batch size, so only the continuation tokens are
+computed again. A prefix shared across chunks is run once per chunk.
+The per-token log probabilities are the same as those of
+`IncrementalLMScorer.sequence_score` on the full stimulus strings.
+"""
+
+import copy
+import torch
+from minicons import scorer
+from bin import profiling
+from bin.batching import map_batches, mean_reduction, score_token_ids
+
+
+def _repeat_cache(past_key_values, repeats: int):
+    """
+    Repeats a prefix cache along the batch dimension, leaving the original
+    untouched.
+
+    Args:
+        past_key_values: The cache returned for a prefix of batch size 1,
+            either a transformers Cache object or legacy tuples.
+        repeats (int): The number of continuations to score.
+
+    Returns:
+        The cache with batch size `repeats`.
+    """
+    if isinstance(past_key_values, tuple):
+        return tuple(
+            tuple(tensor.repeat_interleave(repeats, dim=0) for tensor in layer)
+            for layer in past_key_values
+        )
+
+    past_key_values = copy.deepcopy(past_key_values)
+    past_key_values.batch_repeat_interleave(repeats)
+
+    return past_key_values
+
+
+def _token_logprobs(logits: torch.Tensor, targets: torch.Tensor) -> torch.Tensor:
+    """
+    Returns the log probabilities of the target tokens, normalized over the
+    vocabulary in the same way as minicons.
+
+    Args:
+        logits (torch.Tensor): Logits of shape (..., vocab_size).
+        targets (torch.Tensor): Target token ids of shape (...).
+
+    Returns:
+        torch.Tensor: The log probability of each target token.
+    """
+    logprobs = logits - logits.logsumexp(-1).unsqueeze(-1)
+
+    return logprobs.gather(-1, targets.unsqueeze(-1)).squeeze(-1)
+
+
+def _score_from_cache(
+    model: scorer.IncrementalLMScorer, past_key_values, prefix_length: int,
+    continuation_ids: list
+) -> list:
+    """
+    Scores all but the first token of several continuations from the cache
+    of their shared prefix, expanded to one row per continuation.
+
+    The continuations are right-padded; the last token of each continuation
+    is only a target, never an input.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model used for scoring.
+        past_key_values: The cache of the prefix, of batch size 1.
+        prefix_length (int): The number of prefix tokens.
+        continuation_ids (list): Token ids of each continuation, at least one
+            of them longer than one token.
+
+    Returns:
+        list: The log probabilities of the tokens after the first one of
+        each continuation.
+    """
+    device = model.model.device
+    max_len = max(len(ids) for ids in continuation_ids)
+
+    inputs = torch.full(
+        (len(continuation_ids), max_len - 1), model.tokenizer.pad_token_id,
+        device=device
+        )
+    mask = torch.zeros(
+        (len(continuation_ids), prefix_length + max_len - 1),
+        dtype=torch.long, device=device
+        )
+    mask[:, :prefix_length] = 1
+    for i, ids in enumerate(continuation_ids):
+        inputs[i, :len(ids) - 1] = torch.tensor(ids[:-1], device=device)
+        mask[i, prefix_length:prefix_length + len(ids) - 1] = 1
+
+    logits = model.model(
+        inputs, attention_mask=mask,
+        past_key_values=_repeat_cache(past_key_values, len(continuation_ids)),
+        use_cache=True
+    ).logits
+
+    return [
+        _token_logprobs(
+            logits[i, :len(ids) - 1], torch.tensor(ids[1:], device=device)
+            )
+        for i, ids in enumerate(continuation_ids)
+    ]
+
+
+@torch.no_grad()
+def score_prefix_group(
+    model: scorer.IncrementalLMScorer, prefix_ids: list,
+    continuation_ids: list
+) -> list:
+    """
+    Scores several continuations of one prefix, running the prefix once.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model used for scoring.
+        prefix_ids (list): Token ids of the shared prefix.
+        continuation_ids (list): Token ids of each continuation, each
+            non-empty.
+
+    Returns:
+        list: Per-token log probabilities (torch.Tensor) of each full
+        stimulus, without the first token, as in `compute_stats`.
+    """
+    device = model.model.device
+
+    prefix = torch.tensor([prefix_ids], device=device)
+    output = model.model(prefix, use_cache=True)
+    prefix_scores = _token_logprobs(output.logits[0, :-1], prefix[0, 1:])
+
+    # The first continuation token is predicted from the prefix alone
+    first_tokens = torch.tensor([ids[0] for ids in continuation_ids], device=device)
+    first_scores = _token_logprobs(
+        output.logits[0, -1].expand(len(continuation_ids), -1), first_tokens
+        )
+
+    # The remaining tokens are predicted from the cache
+    rest_scores = [first_scores.new_empty(0)] * len(continuation_ids)
+    if max(len(ids) for ids in continuation_ids) > 1:
+        rest_scores = _score_from_cache(
+            model, output.past_key_values, len(prefix_ids), continuation_ids
+            )
+
+    return [
+        torch.cat([prefix_scores, first_scores[i:i + 1], rest_scores[i]])
+        for i in range(len(continuation_ids))
+    ]
+
+
+def score_prefix_task(
+    model: scorer.IncrementalLMScorer, prefix_ids: list,
+    continuation_ids: list, reduction=mean_reduction
+) -> list:
+    """
+    Scores several continuations of one prefix and reduces their scores.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model used for scoring.
+        prefix_ids (list): Token ids of the shared prefix.
+        continuation_ids (list): Token ids of each continuation.
+        reduction (callable): Reduces the per-token log probabilities of a
+            stimulus, same as in `sequence_score`.
+
+    Returns:
+        list: The reduced score of each full stimulus.
+    """
+    max_len = max(len(ids) for ids in continuation_ids)
+    profiling.add_tokens(
+        len(prefix_ids) + sum(len(ids) - 1 for ids in continuation_ids),
+        len(prefix_ids) + len(continuation_ids) * (max_len - 1)
+        )
+    with profiling.stage("forward"):
+        token_scores = score_prefix_group(model, prefix_ids, continuation_ids)
+
+    with profiling.stage("reduction"):
+        return [reduction(score) for score in token_scores]
+
+
+def _group_by_prefix(
+    token_ids: list, prefix_lengths: list, max_size: int
+) -> tuple:
+    """
+    Groups stimuli by their prefix tokens, splitting the stimuli of a prefix
+    into groups of at most `max_size`.
+
+    Args:
+        token_ids (list): The token ids of each full stimulus.
+        prefix_lengths (list): The number of prefix tokens of each stimulus.
+        max_size (int): The maximum number of stimuli per group.
+
+    Returns:
+        tuple: A list of groups, each the prefix token ids and the indices of
+        its stimuli, and the indices of the stimuli to score without the
+        cache.
+    """
+    by_prefix = {}
+    fallback = []
+    for i, (ids, prefix_length) in enumerate(zip(token_ids, prefix_lengths)):
+        if 0 < prefix_length < len(ids):
+            by_prefix.setdefault(tuple(ids[:prefix_length]), []).append(i)
+        else:
+            fallback.append(i)
+
+    groups = [
+        (prefix_ids, indices[start:start + max_size])
+        for prefix_ids, indices in by_prefix.items()
+        for start in range(0, len(indices), max_size)
+    ]
+
+    return groups, fallback
+
+
+def score_with_prefix_cache(
+    model: scorer.IncrementalLMScorer, token_ids: list, prefix_lengths: list,
+    reduction=mean_reduction, batch_size: int = 2
+) -> list:
+    """
+    Scores pre-tokenized stimuli grouped by their prefix tokens, running
+    each distinct prefix once per `batch_size` of its continuations.
+
+    Stimuli whose tokenization does not start with the tokenization of their
+    prefix (e.g. when a token spans the boundary), marked by a negative
+    prefix length, are scored on their full token ids with `score_token_ids`
+    instead.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model used for scoring, or a
+            DataParallelScorer.
+        token_ids (list): The token ids of each full stimulus.
+        prefix_lengths (list): The number of prefix tokens of each stimulus,
+            see `TokenizedCorpus`.
+        reduction (callable): Reduces the per-token log probabilities of a
+            stimulus, same as in `sequence_score`.
+        batch_size (int): Maximum number of continuations scored from one
+            prefix pass, and batch size for stimuli scored without the
+            cache.
+
+    Returns:
+        list: The reduced score of each stimulus, in input order.
+    """
+    groups, fallback = _group_by_prefix(token_ids, prefix_lengths, batch_size)
+    scores = [None] * len(token_ids)
+
+    group_scores = map_batches(model, score_prefix_task, [
+        (
+            list(prefix_ids),
+            [list(token_ids[i][len(prefix_ids):]) for i in indices],
+            reduction
+        )
+        for prefix_ids, indices in groups
+    ])
+    for (_, indices), group_score in zip(groups, group_scores):
+        for i, score in zip(indices, group_score):
+            scores[i] = score
+
+    if fallback:
+        fallback_scores = score_token_ids(
+            model, [token_ids[i] for i in fallback], batch_size,
+            reduction=reduction
+            )
+        for i, score in zip(fallback, fallback_scores):
+            scores[i] = score
+
+    return scores
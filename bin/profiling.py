@@ -0,0 +1,282 @@
+"""
+Module for profiling the stages of an experiment.
+
+A Profiler records the wall time of each stage of `run_experiment`, such as
+reading the corpus, tokenization, the forward pass, the reduction of the
+per-token scores (which waits for the device) and writing results, together
+with the number of tokens, the share of padding, peak memory and model load
+time. Scoring code marks its stages with `stage`, which does nothing unless
+a profiler is active, so the instrumentation costs nothing when disabled.
+The stages can be exported as a Chrome trace, or recorded with the torch
+profiler for an operator-level trace. torch is only imported by a Profiler,
+so that modules marking their stages, such as `bin.corpus`, stay light.
+"""
+
+import contextlib
+import json
+import os
+import platform
+import threading
+import time
+from dataclasses import dataclass
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_ACTIVE = None
+
+
+def reset_peak_rss() -> bool:
+    """
+    Resets the peak resident set size of this process, where supported.
+
+    Returns:
+        bool: Whether the peak was reset; otherwise `peak_rss` reports the
+        peak over the lifetime of the process.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss() -> int:
+    """
+    Returns the peak resident set size of this process.
+
+    Returns:
+        int: The peak memory in bytes, None where it is not available, e.g.
+        on Windows.
+    """
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    if resource is None:
+        return None
+
+    # Kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+
+def stage(name: str):
+    """
+    Returns a context manager timing a stage with the active profiler.
+
+    Args:
+        name (str): The stage name.
+
+    Returns:
+        A context manager, a no-op without an active profiler.
+    """
+    if _ACTIVE is None:
+        return contextlib.nullcontext()
+
+    return _ACTIVE.stage(name)
+
+
+def add_tokens(n_tokens: int, n_positions: int) -> None:
+    """
+    Counts the tokens of a forward pass with the active profiler.
+
+    Args:
+        n_tokens (int): The number of real tokens.
+        n_positions (int): The number of input positions including padding.
+    """
+    if _ACTIVE is not None:
+        _ACTIVE.add_tokens(n_tokens, n_positions)
+
+
+@dataclass
+class _Totals:
+    """
+    Counters and timings of a profiled run as a whole.
+
+    Args:
+        tokens (int): The number of real tokens of all forward passes.
+        positions (int): The number of input positions including padding.
+        model_load_time (float): The model load time in seconds.
+        wall_time (float): The wall time of the run in seconds.
+        peak_scope (str): 'run' if the peak memory covers only the run,
+            'process' if it covers the lifetime of the process.
+    """
+    tokens: int = 0
+    positions: int = 0
+    model_load_time: float = None
+    wall_time: float = None
+    peak_scope: str = None
+
+
+class Profiler:
+    """
+    Records stage timings and counters of one experiment.
+
+    Args:
+        trace (str): Optional: None for no trace, 'stages' for a Chrome
+            trace of the recorded stages, 'torch' for a torch profiler trace
+            with the stages as labelled ranges.
+        sync_cuda (bool): Optional: synchronize CUDA at the end of each stage,
+            so that asynchronous kernels count towards the stage that
+            launched them.
+    """
+
+    def __init__(self, trace: str = None, sync_cuda: bool = True) -> None:
+        import torch  # pylint: disable=import-outside-toplevel
+
+        if trace not in (None, "stages", "torch"):
+            raise ValueError(f"Unknown trace '{trace}', expected 'stages' or 'torch'.")
+
+        self.trace = trace
+        self.sync_cuda = sync_cuda and torch.cuda.is_available()
+        self.stages = {}
+        self.events = []
+        self.totals = _Totals()
+        self.torch_profiler = None
+        # Stages of a pipelined experiment run in several threads
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """
+        Times a stage; nested stages are recorded separately.
+
+        Args:
+            name (str): The stage name.
+        """
+        import torch  # pylint: disable=import-outside-toplevel
+
+        label = torch.profiler.record_function(name) \
+            if self.torch_profiler is not None else contextlib.nullcontext()
+        start = time.perf_counter()
+        try:
+            with label:
+                yield
+                if self.sync_cuda:
+                    torch.cuda.synchronize()
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                seconds, calls = self.stages.get(name, (0.0, 0))
+                self.stages[name] = (seconds + end - start, calls + 1)
+                if self.trace == "stages":
+                    self.events.append({
+                        "name": name, "ph": "X", "pid": os.getpid(),
+                        "tid": threading.get_ident(),
+                        "ts": start * 1e6, "dur": (end - start) * 1e6,
+                    })
+
+    def add_tokens(self, n_tokens: int, n_positions: int) -> None:
+        """
+        Counts the tokens of a forward pass.
+
+        Args:
+            n_tokens (int): The number of real tokens.
+            n_positions (int): The number of input positions including
+                padding.
+        """
+        with self.lock:
+            self.totals.tokens += n_tokens
+            self.totals.positions += n_positions
+
+    def record(self, name: str, seconds: float) -> None:
+        """
+        Records a stage timed elsewhere, e.g. the model load before the
+        profiler existed.
+
+        Args:
+            name (str): The stage name.
+            seconds (float): The duration.
+        """
+        if name == "model_load":
+            self.totals.model_load_time = seconds
+            return
+        total, calls = self.stages.get(name, (0.0, 0))
+        self.stages[name] = (total + seconds, calls + 1)
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        Makes this the active profiler for the scoring code, and runs the
+        torch profiler if requested.
+        """
+        import torch  # pylint: disable=import-outside-toplevel
+
+        global _ACTIVE  # pylint: disable=global-statement
+        previous = _ACTIVE
+        self.totals.peak_scope = "run" if reset_peak_rss() else "process"
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+
+        with contextlib.ExitStack() as stack:
+            if self.trace == "torch":
+                activities = [torch.profiler.ProfilerActivity.CPU]
+                if torch.cuda.is_available():
+                    activities.append(torch.profiler.ProfilerActivity.CUDA)
+                self.torch_profiler = stack.enter_context(
+                    torch.profiler.profile(activities=activities)
+                    )
+
+            _ACTIVE = self
+            start = time.perf_counter()
+            try:
+                yield self
+            finally:
+                self.totals.wall_time = time.perf_counter() - start
+                _ACTIVE = previous
+
+    def summary(self) -> dict:
+        """
+        Returns the recorded timings and counters, for the 'meta' block of
+        the output file.
+
+        Returns:
+            dict: Stage timings in seconds with call counts, tokens,
+            padding ratio, peak memory and model load time.
+        """
+        import torch  # pylint: disable=import-outside-toplevel
+
+        totals = self.totals
+        peak = peak_rss()
+        summary = {
+            "wall_time": totals.wall_time,
+            "model_load_time": totals.model_load_time,
+            "stages": {
+                name: {"seconds": seconds, "calls": calls}
+                for name, (seconds, calls) in self.stages.items()
+            },
+            "tokens": totals.tokens,
+            "padding_ratio": (
+                1 - totals.tokens / totals.positions if totals.positions
+                else 0.0
+            ),
+            "peak_rss_mb": None if peak is None else peak / 1024 ** 2,
+            "peak_rss_scope": totals.peak_scope,
+        }
+        if torch.cuda.is_available():
+            summary["peak_cuda_mb"] = torch.cuda.max_memory_allocated() / 1024 ** 2
+
+        return summary
+
+    def export_trace(self, path: str) -> None:
+        """
+        Writes the trace as a Chrome trace file, viewable in
+        chrome://tracing or Perfetto.
+
+        Args:
+            path (str): The path to the trace file.
+        """
+        if self.trace == "torch":
+            self.torch_profiler.export_chrome_trace(path)
+            return
+
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": self.events}, file)
@@ -0,0 +1,231 @@
+"""
+Module for incrementally checkpointed result writing.
+
+Results are appended to a JSONL sidecar next to the output file as soon as
+they are computed, and flushed to disk at a configurable interval. An
+interrupted experiment can resume from the sidecar, skipping items that were
+already scored. Once all items are done, the sidecar is turned into the final
+{"meta", "results"} JSON file, or into a Parquet file.
+"""
+
+import json
+import os
+import time
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class ResultWriter:
+    """
+    Appends result records to a JSONL sidecar of an output file.
+
+    Args:
+        file_out (str): The path to the final output file.
+        fsync_interval (float): Minimum number of seconds between two fsync
+            calls on the sidecar.
+        resume (bool): Keep the results of an existing sidecar instead of
+            starting over.
+    """
+
+    ROW_GROUP_SIZE = 100_000
+
+    def __init__(
+        self, file_out: str, fsync_interval: float = 30.0,
+        resume: bool = False
+    ) -> None:
+        self.file_out = file_out
+        self.sidecar = f"{file_out}.partial.jsonl"
+        self.fsync_interval = fsync_interval
+        self.completed = set()
+
+        if resume and os.path.exists(self.sidecar):
+            self._recover()
+        self.file = open(  # pylint: disable=consider-using-with
+            self.sidecar, "a" if resume else "w", encoding="utf-8"
+            )
+        self.last_sync = time.monotonic()
+
+    def _recover(self) -> None:
+        """
+        Collects the item ids of an existing sidecar and truncates it after
+        the last complete line, dropping a record cut off by a crash.
+        """
+        valid_bytes = 0
+        with open(self.sidecar, "rb") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                self.completed.add(record["item_id"])
+                valid_bytes += len(line)
+
+        with open(self.sidecar, "r+b") as file:
+            file.truncate(valid_bytes)
+
+    def completed_ids(self) -> set:
+        """
+        Returns the item ids already present in the sidecar.
+
+        Returns:
+            set: The completed item ids.
+        """
+        return self.completed
+
+    def completed_records(self):
+        """
+        Yields the result records already present in the sidecar.
+
+        Yields:
+            dict: One result record per completed item.
+        """
+        self.file.flush()
+        with open(self.sidecar, "r", encoding="utf-8") as file:
+            for line in file:
+                yield json.loads(line)
+
+    def write(self, results: list) -> None:
+        """
+        Appends result records to the sidecar.
+
+        Args:
+            results (list): The result records, each with an 'item_id'.
+        """
+        for res in results:
+            self.file.write(json.dumps(res) + "\n")
+            self.completed.add(res["item_id"])
+        self.file.flush()
+
+        if time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        """
+        Forces the written records to disk.
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
+
+    def _ordered_lines(self, item_ids: list):
+        """
+        Yields the sidecar record of each item, in the given order. Only byte
+        offsets are indexed, so memory use does not grow with the size of the
+        records.
+
+        Args:
+            item_ids (list): The item ids in corpus order.
+
+        Yields:
+            str: One JSON-encoded result record per item.
+        """
+        offsets = {}
+        with open(self.sidecar, "rb") as file:
+            position = 0
+            for line in file:
+                offsets.setdefault(json.loads(line)["item_id"], position)
+                position += len(line)
+
+        with open(self.sidecar, "rb") as sidecar:
+            for item_id in item_ids:
+                sidecar.seek(offsets[item_id])
+                yield sidecar.readline().decode("utf-8").rstrip("\n")
+
+    def _write_json(self, meta_data: dict, lines) -> None:
+        """
+        Writes the {"meta", "results"} JSON output file.
+
+        Args:
+            meta_data (dict): Metadata about the model and dataset.
+            lines: JSON-encoded result records in output order.
+        """
+        with open(self.file_out, "w", encoding="utf-8") as file:
+            file.write('{\n  "meta": ')
+            file.write(json.dumps(meta_data, indent=2).replace("\n", "\n  "))
+            file.write(',\n  "results": [')
+            separator = "\n    "
+            for line in lines:
+                file.write(separator)
+                file.write(line)
+                separator = ",\n    "
+            file.write("\n  ]\n}\n")
+
+    def _write_parquet(self, meta_data: dict, lines) -> None:
+        """
+        Writes the Parquet output file in row groups. Scalar metadata such as
+        model and revision is stored as dictionary-encoded columns, which
+        cost next to nothing on disk and allow filtering whole files. The
+        complete metadata is also stored as file-level key/value metadata
+        under 'meta'.
+
+        Args:
+            meta_data (dict): Metadata about the model and dataset.
+            lines: JSON-encoded result records in output order.
+        """
+        meta_columns = {
+            key: value for key, value in meta_data.items()
+            if not isinstance(value, (list, dict))
+        }
+        writer = None
+        schema = None
+
+        def write_row_group(records: list) -> None:
+            nonlocal writer, schema
+            table = pa.Table.from_pylist(records, schema=schema)
+            for key, value in meta_columns.items():
+                if key in table.column_names:
+                    table = table.drop_columns([key])
+                table = table.append_column(
+                    key, pa.array([value] * len(records)).dictionary_encode()
+                    )
+            if writer is None:
+                # Per-token log probabilities are stored as float32 lists
+                table = table.cast(pa.schema([
+                    field.with_type(pa.list_(pa.float32()))
+                    if pa.types.is_list(field.type)
+                    and pa.types.is_floating(field.type.value_type)
+                    else field
+                    for field in table.schema
+                ]))
+                schema = table.schema.remove_metadata()
+                for key in meta_columns:
+                    schema = schema.remove(schema.get_field_index(key))
+                table = table.replace_schema_metadata(
+                    {"meta": json.dumps(meta_data)}
+                    )
+                writer = pq.ParquetWriter(self.file_out, table.schema)
+            writer.write_table(table.cast(writer.schema))
+
+        records = []
+        for line in lines:
+            records.append(json.loads(line))
+            if len(records) == self.ROW_GROUP_SIZE:
+                write_row_group(records)
+                records = []
+        if records or writer is None:
+            write_row_group(records)
+
+        writer.close()
+
+    def finalize(self, meta_data: dict, item_ids: list) -> None:
+        """
+        Writes the final output file from the sidecar and removes the sidecar.
+        Output files ending with '.parquet' are written as Parquet, all others
+        as JSON.
+
+        Args:
+            meta_data (dict): Metadata about the model and dataset.
+            item_ids (list): The item ids in corpus order.
+        """
+        self.sync()
+        self.file.close()
+
+        lines = self._ordered_lines(item_ids)
+        if self.file_out.endswith(".parquet"):
+            self._write_parquet(meta_data, lines)
+        else:
+            self._write_json(meta_data, lines)
+
+        os.remove(self.sidecar)
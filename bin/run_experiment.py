@@ -3,115 +3,795 @@ Module to run experiments for evaluating language models.
 
 This module provides functions to run experiments using a specified language
 model on a dataset, and save the results to a JSON file with metadata.
+
+torch, transformers and minicons are only imported once a model is loaded or
+stimuli are scored, so that '--help' and argument errors return quickly, and
+a revision whose scores are all in the score cache is not loaded at all.
 """
 
-import sys
-import pandas as pd
-from tqdm import tqdm
-from minicons import scorer
-from bin.io import initialize_model, timestamp, dict2json
+# pylint: disable=import-outside-toplevel
+import argparse
+import contextlib
+import functools
+import os
+import time
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING
+import numpy as np
+from bin import profiling
+from bin.io import (
+    BACKENDS, PRECISIONS, ModelOptions, expected_dtype, initialize_model,
+    load_tokenizer, free_model, model_dtype, timestamp
+)
+from bin.corpus import find_corpus, iter_corpus, read_corpus
+from bin.early_stopping import EarlyStopping
+from bin.model_store import DEFAULT_STORE, ensure_stored
+from bin.pipeline import Pipeline
+from bin.profiling import Profiler
+from bin.result_writer import ResultWriter
+from bin.score_cache import ScoreCache
+from bin.scoring import (
+    CachedScorer, ScoringOptions, build_results, build_stimuli,
+    cache_context, item_correct, score_items, stimulus_indices,
+    stimulus_prefixes
+)
+from bin.sweep import parse_revisions, plan_outputs
+from bin.tokenized_corpus import TokenizedCorpus, load_tokenized_corpus
+
+if TYPE_CHECKING:
+    from minicons import scorer
+
+
+@dataclass
+class SweepOptions:  # pylint: disable=too-many-instance-attributes
+    """
+    How the revisions of a sweep are loaded, and which outputs are written.
+
+    Args:
+        model (ModelOptions): Optional: the precision and scoring backend.
+            Stored weights are kept in the matching dtype, in full precision
+            for 'int8-dynamic'.
+        workers (int): Optional: number of model replicas scoring batches in
+            parallel worker processes, one per GPU or CPU thread group.
+        model_store (str): Optional: directory of the local model store, see
+            `bin.model_store`.
+        offline (bool): Optional: only load revisions already in the model
+            store, the default store if none is given.
+        max_tokens (int): Optional: batch by this budget of padded tokens,
+            lowered after out-of-memory errors and remembered per model,
+            dtype and device, see `bin.token_budget`.
+        skip_existing (bool): Optional: skip datasets whose output file
+            already exists, and revisions without any dataset left to score.
+        profile (bool): Optional: store stage timings, tokens, padding,
+            peak memory and model load time in the 'profile' entry of the
+            metadata of each output file.
+        profile_trace (str): Optional: also write a trace next to each output
+            file, 'stages' or 'torch', see `Profiler`.
+        scoring (ScoringOptions): Optional: the scoring options passed on to
+            `run_experiment`. The token budget and profiler are set per
+            revision.
+    """
+    model: ModelOptions = ModelOptions()
+    workers: int = 1
+    model_store: str = None
+    offline: bool = False
+    max_tokens: int = None
+    skip_existing: bool = False
+    profile: bool = False
+    profile_trace: str = None
+    scoring: ScoringOptions = None
+
+
+def _load_tokenized(
+    model: "scorer.IncrementalLMScorer", corpus_path: str,
+    options: ScoringOptions
+) -> TokenizedCorpus:
+    """
+    Loads the pre-tokenized corpus from its cache, tokenizing it first if
+    needed.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model whose tokenizer is used.
+        corpus_path (str): The corpus file.
+        options (ScoringOptions): The cache directory and chunk size.
+
+    Returns:
+        TokenizedCorpus: The tokenized corpus, None without a cache
+        directory or tokenizer.
+    """
+    if options.tokenized_cache_dir is None or model.tokenizer is None:
+        return None
+
+    with profiling.stage("tokenize"):
+        return load_tokenized_corpus(
+            corpus_path, model.tokenizer, (
+                (stimulus_prefixes(chunk), build_stimuli(chunk))
+                for chunk in iter_corpus(corpus_path, options.chunk_size)
+            ),
+            cache_dir=options.tokenized_cache_dir
+            )
+
+
+def _corpus_chunks(corpus_path: str, options: ScoringOptions, item_ids: list):
+    """
+    Reads the corpus in chunks, in corpus order or, with early stopping, in
+    its seeded random order and in chunks of at most `early_stopping_step`
+    items, after each of which the stopping rule is checked.
+
+    Args:
+        corpus_path (str): The corpus file.
+        options (ScoringOptions): The chunk size and early stopping.
+        item_ids (list): Receives the item ids of the corpus in corpus order.
+
+    Yields:
+        pd.DataFrame: The next chunk, indexed by position in the corpus.
+    """
+    if options.early_stopping is None:
+        for chunk in iter_corpus(corpus_path, options.chunk_size):
+            item_ids.append(chunk.item_id.to_numpy())
+            yield chunk
+        return
+
+    corpus = read_corpus(corpus_path)
+    item_ids.append(corpus.item_id.to_numpy())
+    corpus = options.early_stopping.order(corpus)
+    step = min(options.chunk_size, options.early_stopping_step)
+    for start in range(0, len(corpus.index), step):
+        yield corpus.iloc[start:start + step]
+
+
+def _prepare_chunks(
+    tokenizer, chunks, tokenized: TokenizedCorpus, completed: list,
+    options: ScoringOptions
+):
+    """
+    Attaches the token ids of their stimuli to corpus chunks and splits off
+    the items of an interrupted run.
+
+    Args:
+        tokenizer: The tokenizer of the model, None for a CachedScorer,
+            whose chunks are not tokenized.
+        chunks (iterable): Corpus chunks, see `_corpus_chunks`.
+        tokenized (TokenizedCorpus): The tokenized corpus, None to tokenize
+            each chunk.
+        completed (list): The item ids already scored.
+        options (ScoringOptions): Whether early stopping is used.
+
+    Yields:
+        tuple: The items to score indexed from 0, the tokenized chunk and
+        the resumed items.
+    """
+    for chunk in chunks:
+        with profiling.stage("tokenize"):
+            if tokenizer is None:
+                chunk_tokens = None
+            elif tokenized is None:
+                chunk_tokens = TokenizedCorpus.build(
+                    tokenizer, stimulus_prefixes(chunk), build_stimuli(chunk)
+                    )
+            elif options.early_stopping is not None:
+                chunk_tokens = tokenized.take(stimulus_indices(chunk))
+            else:
+                start = 2 * chunk.index.start
+                chunk_tokens = tokenized.slice(
+                    start, start + 2 * len(chunk.index)
+                    )
+        chunk = chunk.reset_index(drop=True)
+        resumed = chunk.iloc[:0]
+        if completed:
+            is_completed = chunk.item_id.isin(completed)
+            resumed = chunk[is_completed]
+            chunk = chunk[~is_completed]
+        # With early stopping, resumed items count towards stopping
+        if not chunk.empty or options.early_stopping is not None:
+            yield chunk, chunk_tokens, resumed
+
+
+def _write_chunk(writer: ResultWriter, item: tuple) -> None:
+    """
+    Builds the results of a scored chunk and appends them to the sidecar.
+
+    Args:
+        writer (ResultWriter): The writer of the output file.
+        item (tuple): The chunk, its tokenized stimuli, None if it was not
+            tokenized, and their scores.
+    """
+    chunk, chunk_tokens, logprobs = item
+    prefix_lengths = None
+    if chunk_tokens is not None:
+        prefix_lengths = chunk_tokens.prefix_lengths[stimulus_indices(chunk)]
+    with profiling.stage("build_results"):
+        results = build_results(chunk, logprobs, prefix_lengths)
+    with profiling.stage("write"):
+        writer.write(results)
+
+
+def _score_chunks(
+    model: "scorer.IncrementalLMScorer", meta_data: dict, chunks,
+    writer: ResultWriter, options: ScoringOptions
+) -> list:
+    """
+    Scores prepared chunks and writes their results, in a pipeline if
+    requested, until the corpus ends or early stopping stops.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model to evaluate.
+        meta_data (dict): Metadata about the model, receives the pipeline
+            metrics.
+        chunks (iterable): Prepared chunks, see `_prepare_chunks`.
+        writer (ResultWriter): The writer of the output file.
+        options (ScoringOptions): The scoring options.
+
+    Returns:
+        list: The ids of the items scored or resumed with early stopping.
+    """
+    early_stopping = options.early_stopping
+    resumed_correct = {}
+    if early_stopping is not None and options.resume:
+        resumed_correct = {
+            record["item_id"]: record["logprob_of_good_continuation"]
+            > record["logprob_of_bad_continuation"]
+            for record in writer.completed_records()
+        }
+
+    stages = Pipeline() if options.pipeline else None
+    if stages is not None:
+        chunks = stages.prefetch(chunks, "chunks")
+        sink = stages.consume(functools.partial(_write_chunk, writer), "results")
+    else:
+        sink = contextlib.nullcontext(functools.partial(_write_chunk, writer))
+
+    scored_ids = []
+    with sink as put, contextlib.closing(chunks):
+        for chunk, chunk_tokens, resumed in chunks:
+            logprobs = []
+            if not chunk.empty:
+                logprobs = score_items(
+                    model, chunk, meta_data, chunk_tokens, options
+                    )
+                put((chunk, chunk_tokens, logprobs))
+
+            if early_stopping is not None:
+                early_stopping.update(resumed, [
+                    resumed_correct[item_id] for item_id in resumed.item_id
+                ])
+                early_stopping.update(chunk, item_correct(logprobs))
+                scored_ids += resumed.item_id.tolist() + chunk.item_id.tolist()
+                if early_stopping.done():
+                    break
+
+    if stages is not None:
+        meta_data["pipeline"] = stages.metrics()
+
+    return scored_ids
 
 
 def run_experiment(
-    model: scorer.IncrementalLMScorer, dataset: str, meta_data: dict,
-    file_out: str
+    model: "scorer.IncrementalLMScorer", dataset: str, meta_data: dict,
+    file_out: str, options: ScoringOptions = None
 ) -> None:
     """
     Run the experiment for the given model and dataset and save the results to
     a JSON file with metadata.
 
+    Items are streamed from the corpus file ('corpus.csv', '.jsonl' or
+    '.parquet', see `bin.corpus`) and scored in chunks, so memory does not
+    grow with the corpus size. The results of each chunk are appended to a
+    JSONL sidecar of the output file right away, which is turned into the
+    final JSON file once all items are scored.
+
     Args:
-        model (scorer.IncrementalLMScorer): The model to evaluate.
+        model (scorer.IncrementalLMScorer): The model to evaluate, or a
+            DataParallelScorer holding several replicas of it.
         dataset (str): The dataset name.
         meta_data (dict): Metadata about the model and dataset.
         file_out (str): The path to the output file.
+        options (ScoringOptions): Optional: how the stimuli are scored and
+            the results written. By default, each item is scored on its own.
 
     Returns:
         None
     """
-    df = pd.read_csv(f"./data/{dataset}/corpus.csv")
+    options = options or ScoringOptions()
+    context = options.profiler.activate() if options.profiler is not None \
+        else contextlib.nullcontext()
+    with context:
+        corpus_path = find_corpus(dataset)
+        tokenized = _load_tokenized(model, corpus_path, options)
+
+        writer = ResultWriter(
+            file_out, fsync_interval=options.fsync_interval,
+            resume=options.resume
+            )
+        completed = list(writer.completed_ids())
+        if completed:
+            print(
+                f"Resuming: {len(completed)} items already scored in "
+                f"{writer.sidecar}."
+            )
+
+        print(f"Running experiment on dataset: {dataset}...")
+
+        # Stimuli looked up and found in the score cache before this dataset
+        cache_counts = None
+        if options.score_cache is not None and not options.token_logprobs:
+            cache_counts = options.score_cache.lookups, options.score_cache.hits
+
+        # Item ids in corpus order, and those scored with early stopping
+        item_ids = []
+        scored_ids = _score_chunks(
+            model, meta_data, _prepare_chunks(
+                model.tokenizer,
+                _corpus_chunks(corpus_path, options, item_ids),
+                tokenized, completed, options
+            ), writer, options
+        )
+
+        if cache_counts is not None:
+            print(f"Found {options.score_cache.hits - cache_counts[1]} of "
+                  f"{options.score_cache.lookups - cache_counts[0]} scores "
+                  "in the cache.")
+
+    # Update metadata with dataset name
+    meta_data["dataset"] = dataset
+
+    item_ids = np.concatenate(item_ids) if item_ids else np.array([], dtype=int)
+    early_stopping = options.early_stopping
+    if early_stopping is not None:
+        item_ids = item_ids[np.isin(item_ids, scored_ids)]
+        meta_data["n_scored"] = len(scored_ids)
+        meta_data["n_total"] = int(early_stopping.counts.n_total.sum())
+        meta_data["early_stopping"] = early_stopping.summary()
+        print(f"Stopped after {len(scored_ids)} of "
+              f"{meta_data['n_total']} items.")
+
+    if options.profiler is not None:
+        meta_data["profile"] = options.profiler.summary()
+        if options.profiler.trace is not None:
+            options.profiler.export_trace(f"{file_out}.trace.json")
+            print(f"Trace saved to: {file_out}.trace.json")
+
+    writer.finalize(meta_data, item_ids.tolist())
+    print(f"Results saved to: {file_out}")
+
+
+def _model_source(model_name: str, revision: str, options: SweepOptions) -> str:
+    """
+    Returns where a revision is loaded from: the model name, or its weights
+    in the model store, which are converted on first use.
+
+    Args:
+        model_name (str): The name of the model.
+        revision (str): The revision.
+        options (SweepOptions): The model store and precision.
+
+    Returns:
+        str: The model name or the directory of the stored weights.
+    """
+    if options.model_store is None and not options.offline:
+        return model_name
+
+    return ensure_stored(
+        model_name, revision, PRECISIONS[options.model.precision],
+        root=options.model_store or DEFAULT_STORE, offline=options.offline
+        )
+
+
+def _pending_datasets(
+    model_name: str, revisions: list, datasets: list, file_out_template: str,
+    skip_existing: bool
+) -> dict:
+    """
+    Lists the datasets left to score for each revision of a sweep.
+
+    Args:
+        model_name (str): The name of the model.
+        revisions (list): The revisions of the sweep.
+        datasets (list): The datasets to evaluate each revision on.
+        file_out_template (str): Template for output file paths.
+        skip_existing (bool): Leave out datasets whose output file exists,
+            and revisions without any dataset left.
+
+    Returns:
+        dict: The datasets of each revision, in sweep order.
+    """
+    pending = {revision: list(datasets) for revision in revisions}
+    if not skip_existing:
+        return pending
+
+    for output in plan_outputs(
+            model_name, revisions, datasets, file_out_template):
+        if output["exists"]:
+            print(f"Skipping {output['path']}, it already exists.")
+            pending[output["revision"]].remove(output["dataset"])
+
+    return {
+        revision: pending_datasets
+        for revision, pending_datasets in pending.items() if pending_datasets
+    }
+
+
+def _all_cached(context: tuple, datasets: list, scoring: ScoringOptions) -> bool:
+    """
+    Checks whether the score cache holds the scores of all stimuli of the
+    datasets, so that the model need not be loaded.
+
+    Args:
+        context (tuple): The cache context of the model, see `cache_context`.
+        datasets (list): The datasets to score.
+        scoring (ScoringOptions): The score cache and chunk size.
+
+    Returns:
+        bool: Whether every score is cached.
+    """
+    if scoring.score_cache is None or scoring.token_logprobs:
+        return False
+
+    for dataset in datasets:
+        for chunk in iter_corpus(find_corpus(dataset), scoring.chunk_size):
+            stimuli = build_stimuli(chunk)
+            if len(scoring.score_cache.lookup(context, stimuli)) < len(stimuli):
+                return False
+
+    return True
+
+
+def _cached_revision(
+    model_name: str, revision: str, datasets: list, options: SweepOptions
+) -> CachedScorer:
+    """
+    Returns a CachedScorer standing in for a revision if the scores of all
+    its datasets are cached, without importing torch or transformers.
+
+    Args:
+        model_name (str): The name of the model.
+        revision (str): The revision.
+        datasets (list): The datasets the revision is scored on.
+        options (SweepOptions): The sweep options.
+
+    Returns:
+        CachedScorer: The stand-in, None if the revision has to be loaded.
+    """
+    cached = CachedScorer(expected_dtype(options.model))
+    context = cache_context(cached, {"model": model_name, "revision": revision})
+    if not _all_cached(context, datasets, options.scoring or ScoringOptions()):
+        return None
+
+    print(f"All scores of {model_name}@{revision} are cached, not loading "
+          "the model.")
+    return cached
+
+
+def _load_revision(
+    model_name: str, revision: str, tokenizer, options: SweepOptions
+):
+    """
+    Loads a revision of a model, with data-parallel replicas if more than
+    one worker is requested.
+
+    Args:
+        model_name (str): The name of the model.
+        revision (str): The revision to load.
+        tokenizer: The tokenizer shared by all revisions.
+        options (SweepOptions): The sweep options.
+
+    Returns:
+        scorer.IncrementalLMScorer: The model or a DataParallelScorer.
+    """
+    from bin.parallel import DataParallelScorer, default_devices
+
+    source = _model_source(model_name, revision, options)
+    if options.workers > 1:
+        return DataParallelScorer(
+            source, revision, tokenizer, default_devices(options.workers),
+            options=options.model
+            )
+
+    return initialize_model(
+        source, revision, tokenizer=tokenizer, options=options.model
+        )  # minicons IncrementalLMScorer
+
+
+def _revision_scoring(
+    model: "scorer.IncrementalLMScorer", model_name: str, options: SweepOptions
+) -> ScoringOptions:
+    """
+    Returns the scoring options of a revision, with the token budget of its
+    model, dtype and device if batching by tokens.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model, a
+            DataParallelScorer or a CachedScorer.
+        model_name (str): The name of the model.
+        options (SweepOptions): The sweep options.
+
+    Returns:
+        ScoringOptions: The scoring options.
+    """
+    scoring = options.scoring or ScoringOptions()
+    if not options.max_tokens or isinstance(model, CachedScorer):
+        return scoring
+
+    from bin.parallel import DataParallelScorer
+    from bin.token_budget import TokenBudget, budget_key
+
+    if isinstance(model, DataParallelScorer):
+        key = budget_key(model_name, model.dtype, model.devices[0])
+    else:
+        key = budget_key(model_name, model_dtype(model), model.device)
+
+    return replace(scoring, token_budget=TokenBudget(key, options.max_tokens))
+
+
+def _release(model: "scorer.IncrementalLMScorer") -> None:
+    """
+    Stops the workers of a DataParallelScorer, or frees the weights of a
+    model before the next revision is loaded.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model, a
+            DataParallelScorer or a CachedScorer.
+    """
+    if isinstance(model, CachedScorer):
+        return
+
+    from bin.parallel import DataParallelScorer
+
+    if isinstance(model, DataParallelScorer):
+        model.close()
+    else:
+        free_model(model)
+
+
+def _profiler(options: SweepOptions, load_time: float) -> Profiler:
+    """
+    Returns a new profiler for one output file if the sweep is profiled.
+
+    Args:
+        options (SweepOptions): Whether to profile and the trace to write.
+        load_time (float): The load time of the model in seconds.
+
+    Returns:
+        Profiler: The profiler with the model load time, or None.
+    """
+    if not (options.profile or options.profile_trace):
+        return None
+
+    profiler = Profiler(trace=options.profile_trace)
+    profiler.record("model_load", load_time)
+    return profiler
+
+
+def run_sweep(
+    model_name: str, revisions: list, datasets: list, file_out_template: str,
+    options: SweepOptions = None
+) -> list:
+    """
+    Runs the experiments for several revisions of a model in one process.
+    The tokenizer is loaded once and only the weights are swapped between
+    revisions; the previous model is freed before the next one is loaded.
+    Revisions whose scores are all cached load neither, see
+    `CachedScorer`.
+    With a model store, each revision is loaded from local safetensors
+    weights that were converted to the target dtype on first use.
 
-    results = []
+    Args:
+        model_name (str): The name of the model to evaluate.
+        revisions (list): The revisions to evaluate, in order.
+        datasets (list): The datasets to evaluate each revision on.
+        file_out_template (str): Template for output file paths with
+            '{dataset}', '{model}' and '{revision}' placeholders.
+        options (SweepOptions): Optional: how revisions are loaded and
+            scored, and whether existing outputs are skipped.
 
-    print(f"Running experiment on dataset: {dataset}...")
+    Returns:
+        list: Load and scoring time in seconds for each revision.
+    """
+    options = options or SweepOptions()
+    pending = _pending_datasets(
+        model_name, revisions, datasets, file_out_template,
+        options.skip_existing
+        )
+    if not pending:
+        return []
 
-    for _, row in tqdm(list(df.iterrows()), total=len(df.index)):
-        good_instance = f"{row.prefix} {row.good_continuation}"
-        bad_instance = f"{row.prefix} {row.bad_continuation}"
-        stimuli = [good_instance, bad_instance]
+    tokenizer = None
+    timings = []
 
-        # Sequence Log-probability, normalized by number of tokens
-        # reduction = lambda x: x.mean(0).item()
-        # see https://github.com/kanishkamisra/minicons
-        logprobs = model.sequence_score(
-            stimuli, reduction=lambda x: x.mean(0).item()
+    for revision in pending:
+        start = time.perf_counter()
+        # Initialize the model once for all datasets
+        model = _cached_revision(
+            model_name, revision, pending[revision], options
             )
+        if model is None:
+            if tokenizer is None:
+                tokenizer = load_tokenizer(
+                    _model_source(model_name, revision, options)
+                    )
+            model = _load_revision(model_name, revision, tokenizer, options)
+        load_time = time.perf_counter() - start
+        scoring = _revision_scoring(model, model_name, options)
 
-        res = {
-            "item_id": row.item_id,
-            "prefix": row.prefix,
-            "good_continuation": row.good_continuation,
-            "bad_continuation": row.bad_continuation,
-            "logprob_of_good_continuation": logprobs[0],
-            "logprob_of_bad_continuation": logprobs[1],
-            "relation": row.category,
+        meta_data = {
+            "model": model_name,
+            "revision": revision,
+            "precision": options.model.precision,
+            "timestamp": timestamp(),
         }
 
-        # For cases where the dataset has a 'type' column for inter- or intra-
-        # sentential connective continuations
-        if 'type' in row.index:
-            res['type'] = row.type
+        start = time.perf_counter()
+        for dataset in pending[revision]:
+            run_experiment(
+                model, dataset, meta_data, file_out_template.format(
+                    dataset=dataset, model=model_name, revision=revision
+                    ),
+                replace(scoring, profiler=_profiler(options, load_time))
+                )
+        timings.append({
+            "revision": revision,
+            "load_time": load_time,
+            "scoring_time": time.perf_counter() - start,
+        })
 
-        results.append(res)
+        _release(model)
+        del model
 
-    # Update metadata with dataset name
-    meta_data["dataset"] = dataset
-    output = {"meta": meta_data, "results": results}
+        print(
+            f"Revision {revision}: loaded in {load_time:.1f}s, "
+            f"scored in {timings[-1]['scoring_time']:.1f}s."
+        )
 
-    dict2json(output, file_out)
-    print(f"Results saved to: {file_out}")
+    return timings
 
 
-def main() -> None:
+def parse_args(argv: list = None) -> argparse.Namespace:
     """
-    Main function to run the evaluation. It should be called from 'run_eval.py'
-    in the parent directory with following command line arguments:
+    Parses the command line arguments passed on by 'run_eval.py'.
+
+    Args:
+        argv (list): Optional: arguments to parse, defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Run the experiment for one model on several datasets."
+    )
+    parser.add_argument("model_name", type=str)
+    parser.add_argument("revisions", type=parse_revisions)
+    parser.add_argument("datasets", type=str, nargs="+")
+    parser.add_argument("file_out_template", type=str)
+    parser.add_argument("--batch-size", type=int, default=None)
+    batching_group = parser.add_mutually_exclusive_group()
+    batching_group.add_argument("--max-tokens", type=int, default=None)
+    batching_group.add_argument("--prefix-cache", action="store_true")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--refresh", action="store_true")
+    parser.add_argument(
+        "--cache-path", type=str,
+        default=os.path.join(".cache", "scores.sqlite")
+        )
+    parser.add_argument("--cache-size", type=int, default=5_000_000)
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--skip-existing", action="store_true")
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--fsync-interval", type=float, default=30.0)
+    parser.add_argument(
+        "--tokenized-cache", type=str,
+        default=os.path.join(".cache", "tokenized")
+        )
+    parser.add_argument("--token-logprobs", action="store_true")
+    parser.add_argument("--pipeline", action="store_true")
+    parser.add_argument(
+        "--early-stopping", type=float, nargs="?", const=0.1, default=None
+        )
+    parser.add_argument("--early-stopping-threshold", type=float, default=None)
+    parser.add_argument("--early-stopping-min-items", type=int, default=30)
+    parser.add_argument("--early-stopping-step", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument(
+        "--model-store", type=str, nargs="?", const=DEFAULT_STORE, default=None
+        )
+    parser.add_argument("--offline", action="store_true")
+    parser.add_argument(
+        "--precision", type=str, choices=list(PRECISIONS), default="bf16"
+        )
+    parser.add_argument(
+        "--backend", type=str, choices=BACKENDS, default="minicons"
+        )
+    parser.add_argument(
+        "--profile-trace", type=str, choices=["stages", "torch"], default=None
+        )
+
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None) -> None:
+    """
+    Main function to run the evaluation. It is called by 'run_eval.py' in the
+    parent directory, in the same process, with following arguments:
         - model_name: The name of the model to evaluate.
-        - revision: The revision of the model to evaluate.
+        - revisions: The revision(s) of the model to evaluate, as a
+          comma-separated list that may contain ranges, see `bin.sweep`.
         - datasets: Space-separated list of datasets to evaluate the model on.
         - file_out_template: Template for output file path.
+        - --batch-size: Optional: number of stimuli per forward pass.
+        - --max-tokens: Optional: padded tokens per forward pass instead,
+          reduced after out-of-memory errors.
+        - --prefix-cache: Optional: score continuations from a cached prefix.
+        - --no-cache: Optional: do not use the on-disk score cache.
+        - --refresh: Optional: recompute and overwrite cached scores.
+        - --cache-path, --cache-size: Optional: location and maximum number
+          of entries of the score cache.
+        - --resume: Optional: continue from the sidecar of an interrupted run.
+        - --skip-existing: Optional: skip outputs that were already written.
+        - --chunk-size, --fsync-interval: Optional: items scored between two
+          sidecar writes and seconds between two fsync calls.
+        - --tokenized-cache: Optional: directory of the pre-tokenized corpora.
+        - --token-logprobs: Optional: also store per-token log probabilities.
+        - --pipeline: Optional: overlap reading, scoring and writing in
+          threads connected by bounded queues.
+        - --early-stopping: Optional: score items in a seeded random order
+          and stop once every relation and type has a confidence interval of
+          at most this width (0.1 if no width is given), or one entirely
+          above or below --early-stopping-threshold, after at least
+          --early-stopping-min-items items, checked every
+          --early-stopping-step items.
+        - --workers: Optional: number of data-parallel model replicas.
+        - --profile, --profile-trace: Optional: store stage timings in the
+          metadata, and write a 'stages' or 'torch' Chrome trace.
+        - --model-store, --offline: Optional: load revisions from the local
+          model store, see `bin.model_store`, without network access.
+        - --precision: Optional: fp32, bf16 (default), fp16 or int8-dynamic,
+          see `bin.precision` to compare their scores with fp32.
+        - --backend: Optional: 'minicons' (default) or 'target', which only
+          computes the log probabilities of the target tokens.
 
     Args:
-        None
+        argv (list): Optional: arguments to parse, defaults to sys.argv.
 
     Returns:
         None
     """
-    if len(sys.argv) < 5:
-        print(
-            "Usage: Incorrect call. Expected usage:\n"
-            "python run_eval.py <dataset1> [dataset2] ... \
-                <model_name> <revision> <file_out_template>"
-        )
-        sys.exit(1)
+    args = parse_args(argv)
 
-    model_name = sys.argv[1]
-    revision = sys.argv[2]
-    datasets = sys.argv[3:-1]  # Capture all datasets in between
-    file_out_template = sys.argv[-1]
+    score_cache = None
+    if not args.no_cache:
+        score_cache = ScoreCache(
+            args.cache_path, max_entries=args.cache_size, refresh=args.refresh
+            )
 
-    # Initialize the model once for all datasets
-    model = initialize_model(model_name, revision) # minicons IncrementalLMScorer
+    early_stopping = None
+    if args.early_stopping is not None:
+        early_stopping = EarlyStopping(
+            target_width=args.early_stopping,
+            threshold=args.early_stopping_threshold,
+            min_items=args.early_stopping_min_items
+            )
 
-    meta_data = {
-        "model": model_name,
-        "revision": revision,
-        "timestamp": timestamp(),
-    }
+    run_sweep(
+        args.model_name, args.revisions, args.datasets, args.file_out_template,
+        SweepOptions(
+            model=ModelOptions(precision=args.precision, backend=args.backend),
+            workers=args.workers, model_store=args.model_store,
+            offline=args.offline, max_tokens=args.max_tokens,
+            skip_existing=args.skip_existing, profile=args.profile,
+            profile_trace=args.profile_trace, scoring=ScoringOptions(
+                batch_size=args.batch_size, prefix_cache=args.prefix_cache,
+                score_cache=score_cache, token_logprobs=args.token_logprobs,
+                resume=args.resume, chunk_size=args.chunk_size,
+                fsync_interval=args.fsync_interval,
+                tokenized_cache_dir=args.tokenized_cache,
+                pipeline=args.pipeline, early_stopping=early_stopping,
+                early_stopping_step=args.early_stopping_step
+            )
+        )
+    )
 
-    for dataset in datasets:
-        file_out = file_out_template.format(dataset=dataset, model=model_name)
-        run_experiment(model, dataset, meta_data, file_out)
+    if score_cache is not None:
+        score_cache.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,491 @@
+"""
+Module for scheduling evaluation jobs across devices.
+
+A sweep spec lists models, revisions and datasets. Every (model, revision)
+pair becomes one job that scores all of its datasets whose output does not
+exist yet, so the weights are loaded only once per job. The memory each job
+needs is estimated from the parameter count and dtype of the model, and jobs
+are packed onto the available GPUs or CPU slots, largest first. Each job runs
+'bin/run_experiment.py' in its own process, is retried on failure, and is
+recorded with its timings in a JSON manifest.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from bin.io import PRECISIONS, timestamp
+from bin.sweep import parse_revisions
+
+
+DTYPE_BYTES = {"float32": 4, "bfloat16": 2, "float16": 2, "int8": 1}
+# Weights plus activations, the KV cache and the CUDA context
+MEMORY_OVERHEAD = 1.3
+GB = 1024 ** 3
+
+
+def load_spec(path: str) -> dict:
+    """
+    Loads a sweep spec from a JSON or YAML file.
+
+    Example:
+        {
+            "models": ["EleutherAI/pythia-14m", "EleutherAI/pythia-70m"],
+            "revisions": "step1000..step3000:1000,main",
+            "datasets": ["dtfit"],
+            "format": "json",
+            "options": {"batch_size": 64, "prefix_cache": true},
+            "cpu_slots": 2,
+            "retries": 1
+        }
+
+    Args:
+        path (str): The path to the spec file, ending with '.json', '.yaml'
+            or '.yml'.
+
+    Returns:
+        dict: The sweep spec.
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml  # pylint: disable=import-outside-toplevel
+            except ImportError as error:
+                raise ImportError(
+                    "PyYAML is required for YAML sweep specs, use JSON or "
+                    "'pip install pyyaml'."
+                ) from error
+            return yaml.safe_load(file)
+
+        return json.load(file)
+
+
+def count_parameters(model_name: str, revision: str = "main") -> int:
+    """
+    Counts the parameters of a model from its config, without loading the
+    weights.
+
+    Args:
+        model_name (str): The name of the model.
+        revision (str): Optional: the revision of the model.
+
+    Returns:
+        int: The number of parameters.
+    """
+    # pylint: disable=import-outside-toplevel
+    import torch
+    from transformers import AutoConfig, AutoModelForCausalLM
+
+    config = AutoConfig.from_pretrained(model_name, revision=revision)
+    with torch.device("meta"):
+        model = AutoModelForCausalLM.from_config(config)
+
+    return sum(parameter.numel() for parameter in model.parameters())
+
+
+def estimate_memory(n_parameters: int, dtype: str = "bfloat16") -> int:
+    """
+    Estimates the memory a scoring job needs.
+
+    Args:
+        n_parameters (int): The number of parameters of the model.
+        dtype (str): Optional: the dtype of the weights.
+
+    Returns:
+        int: The estimated memory in bytes.
+    """
+    return int(n_parameters * DTYPE_BYTES[dtype] * MEMORY_OVERHEAD)
+
+
+def available_devices(cpu_slots: int = 1) -> list:
+    """
+    Returns the devices jobs can run on: every GPU with its total memory, or
+    the CPU with the available memory and a fixed number of slots.
+
+    Args:
+        cpu_slots (int): Optional: number of jobs run on the CPU at once.
+
+    Returns:
+        list: Devices as dicts with 'name', 'memory' in bytes and 'slots'.
+    """
+    import torch  # pylint: disable=import-outside-toplevel
+
+    if torch.cuda.is_available():
+        return [
+            {
+                "name": f"cuda:{i}",
+                "memory": torch.cuda.get_device_properties(i).total_memory,
+                "slots": None,
+            }
+            for i in range(torch.cuda.device_count())
+        ]
+
+    memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+    return [{"name": "cpu", "memory": memory, "slots": cpu_slots}]
+
+
+def output_path(root: str, dataset: str, model: str, revision: str,
+                spec: dict) -> str:
+    """
+    Returns the output path of one job, in the layout of 'run_eval.py'.
+
+    Args:
+        root (str): The repository directory holding 'data' and 'results'.
+        dataset (str): The dataset name.
+        model (str): The model name in the format 'namespace/modelname'.
+        revision (str): The revision.
+        spec (dict): The sweep spec, whose 'format' ('json' by default) and
+            'precision' option, added to the file name unless it is the
+            default 'bf16', are used.
+
+    Returns:
+        str: The path to the output file.
+    """
+    precision = spec.get("options", {}).get("precision", "bf16")
+    suffix = "" if precision == "bf16" else f"_{precision}"
+    return os.path.join(
+        root, "results", dataset,
+        f"{model.rstrip('/').split('/')[-1]}_{revision}{suffix}"
+        f".{spec.get('format', 'json')}"
+        )
+
+
+def build_jobs(spec: dict, root: str) -> tuple:
+    """
+    Expands a sweep spec into jobs, one per model and revision, leaving out
+    datasets whose output already exists.
+
+    Args:
+        spec (dict): The sweep spec, see `load_spec`.
+        root (str): The repository directory holding 'data' and 'results'.
+
+    Returns:
+        tuple: The jobs to run, and the manifest entries of skipped jobs and
+        of jobs whose model config could not be loaded.
+    """
+    revisions = spec.get("revisions", "main")
+    if isinstance(revisions, list):
+        revisions = ",".join(str(revision) for revision in revisions)
+    revisions = parse_revisions(revisions)
+    precision = spec.get("options", {}).get("precision", "bf16")
+    # Dynamically quantized models are loaded in full precision first
+    dtype = spec.get("dtype", PRECISIONS[precision])
+
+    jobs, entries = [], []
+    for model in spec["models"]:
+        memory = None
+        for revision in revisions:
+            datasets = [
+                dataset for dataset in spec["datasets"]
+                if not os.path.exists(
+                    output_path(root, dataset, model, revision, spec)
+                    )
+            ]
+            if not datasets:
+                entries.append({
+                    "model": model, "revision": revision,
+                    "datasets": spec["datasets"], "status": "skipped",
+                })
+                continue
+
+            if memory is None:
+                try:
+                    memory = estimate_memory(
+                        count_parameters(model, revision), dtype
+                        )
+                except (OSError, ValueError) as error:
+                    print(f"Cannot load the config of {model}@{revision}: "
+                          f"{error}")
+                    entries.append({
+                        "model": model, "revision": revision,
+                        "datasets": datasets, "status": "failed",
+                        "attempts": 0, "error": str(error),
+                    })
+                    continue
+            jobs.append({
+                "model": model, "revision": revision, "datasets": datasets,
+                "memory": memory, "attempts": 0,
+            })
+
+    return jobs, entries
+
+
+def job_command(job: dict, spec: dict, root: str) -> list:
+    """
+    Returns the command that runs one job with 'bin/run_experiment.py'.
+
+    Args:
+        job (dict): The job.
+        spec (dict): The sweep spec, whose 'options' are passed on as flags.
+        root (str): The repository directory holding 'data' and 'results'.
+
+    Returns:
+        list: The command line.
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "run_experiment.py")
+    template = output_path("", "{dataset}", job["model"], "{revision}", spec)
+    command = [sys.executable, script, job["model"], job["revision"],
+               *job["datasets"], template]
+
+    for key, value in spec.get("options", {}).items():
+        flag = f"--{key.replace('_', '-')}"
+        if value is True:
+            command.append(flag)
+        elif value not in (False, None):
+            command += [flag, str(value)]
+
+    # Continue from the sidecar of an interrupted attempt
+    if "resume" not in spec.get("options", {}) and any(
+        os.path.exists(output_path(
+            root, dataset, job["model"], job["revision"], spec
+            ) + ".partial.jsonl")
+        for dataset in job["datasets"]
+    ):
+        command.append("--resume")
+
+    return command
+
+
+def pick_device(job: dict, devices: list, usage: dict) -> dict:
+    """
+    Returns the first device with enough free memory and a free slot for a
+    job.
+
+    Args:
+        job (dict): The job with its estimated 'memory'.
+        devices (list): The devices, see `available_devices`.
+        usage (dict): Memory and number of jobs in use per device name.
+
+    Returns:
+        dict: The device, or None if no device has room right now.
+    """
+    for device in devices:
+        memory, running = usage[device["name"]]
+        if memory + job["memory"] > device["memory"]:
+            continue
+        if device["slots"] is not None and running >= device["slots"]:
+            continue
+        return device
+
+    return None
+
+
+def write_manifest(path: str, spec: dict, entries: list) -> None:
+    """
+    Writes the manifest of a sweep, replacing the previous one atomically.
+
+    Args:
+        path (str): The path to the manifest file.
+        spec (dict): The sweep spec.
+        entries (list): One entry per job.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump({"spec": spec, "jobs": entries}, file, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def _drop_oversized(queue: list, devices: list) -> list:
+    """
+    Removes the jobs that do not fit on any device from the queue.
+
+    Args:
+        queue (list): The jobs to run.
+        devices (list): The devices, see `available_devices`.
+
+    Returns:
+        list: The manifest entries of the removed jobs.
+    """
+    largest = max(device["memory"] for device in devices)
+    entries = []
+    for job in [job for job in queue if job["memory"] > largest]:
+        queue.remove(job)
+        print(f"Job {job['model']}@{job['revision']} does not fit any device.")
+        entries.append({
+            "model": job["model"], "revision": job["revision"],
+            "datasets": job["datasets"], "status": "failed",
+            "memory_gb": job["memory"] / GB, "attempts": 0,
+            "error": "does not fit any device",
+        })
+
+    return entries
+
+
+def _job_env(device: dict) -> dict:
+    """
+    Returns the environment of a job that runs on a device.
+
+    Args:
+        device (dict): The device, see `available_devices`.
+
+    Returns:
+        dict: The environment variables.
+    """
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if device["name"].startswith("cuda:"):
+        env["CUDA_VISIBLE_DEVICES"] = device["name"].split(":")[1]
+    else:
+        env["CUDA_VISIBLE_DEVICES"] = ""
+        threads = max(1, (os.cpu_count() or 1) // (device["slots"] or 1))
+        env["OMP_NUM_THREADS"] = str(threads)
+
+    return env
+
+
+def _start_job(
+    job: dict, device: dict, command: list, root: str, log_dir: str
+) -> subprocess.Popen:
+    """
+    Starts a job in its own process, appending its output to its log file.
+
+    Args:
+        job (dict): The job, whose 'attempts' are counted up.
+        device (dict): The device to run on.
+        command (list): The command line, see `job_command`.
+        root (str): The working directory of the process.
+        log_dir (str): The directory of the log files.
+
+    Returns:
+        subprocess.Popen: The process.
+    """
+    job["attempts"] += 1
+    log_name = f"{job['model'].replace('/', '_')}_{job['revision']}.log"
+    with open(os.path.join(log_dir, log_name), "a", encoding="utf-8") as log:
+        process = subprocess.Popen(  # pylint: disable=consider-using-with
+            command, cwd=root, env=_job_env(device),
+            stdout=log, stderr=subprocess.STDOUT
+            )
+    print(
+        f"Started {job['model']}@{job['revision']} on {device['name']} "
+        f"(attempt {job['attempts']}, ~{job['memory'] / GB:.2f} GB)."
+    )
+
+    return process
+
+
+def _finished_entry(
+    job: dict, device: dict, process: subprocess.Popen, start: float,
+    started_at: str
+) -> dict:
+    """
+    Returns the manifest entry of a job whose process has exited.
+
+    Args:
+        job (dict): The job.
+        device (dict): The device it ran on.
+        process (subprocess.Popen): The exited process.
+        start (float): The `time.perf_counter` value at the start.
+        started_at (str): The timestamp of the start.
+
+    Returns:
+        dict: The manifest entry.
+    """
+    duration = time.perf_counter() - start
+    status = "completed" if process.returncode == 0 else "failed"
+    print(f"Job {job['model']}@{job['revision']} {status} "
+          f"in {duration:.1f}s.")
+
+    return {
+        "model": job["model"], "revision": job["revision"],
+        "datasets": job["datasets"], "status": status,
+        "device": device["name"], "memory_gb": job["memory"] / GB,
+        "attempts": job["attempts"], "started": started_at,
+        "duration": duration, "returncode": process.returncode,
+    }
+
+
+def _reserve(usage: dict, device: dict, job: dict, count: int) -> None:
+    """
+    Adds the memory of a job and the number of jobs to the usage of a device.
+
+    Args:
+        usage (dict): Memory and number of jobs in use per device name.
+        device (dict): The device.
+        job (dict): The job with its estimated 'memory'.
+        count (int): 1 when the job starts, -1 when it exits.
+    """
+    memory, running = usage[device["name"]]
+    usage[device["name"]] = (memory + count * job["memory"], running + count)
+
+
+def run_schedule(
+    spec: dict, root: str = None, manifest: str = None,
+    devices: list = None, poll_interval: float = 1.0
+) -> list:
+    """
+    Runs all jobs of a sweep spec, packing them onto the available devices.
+
+    Jobs are started largest first on the first device with room for them.
+    A failed job is queued again until it has been tried `1 + retries`
+    times. The manifest is rewritten whenever a job finishes.
+
+    Args:
+        spec (dict): The sweep spec, see `load_spec`.
+        root (str): Optional: the directory holding 'data' and 'results',
+            by default the repository directory.
+        manifest (str): Optional: path to the manifest, default is
+            'results/manifest.json' in `root`.
+        devices (list): Optional: devices to use, see `available_devices`.
+        poll_interval (float): Optional: seconds between two checks for
+            finished jobs.
+
+    Returns:
+        list: The manifest entries of all jobs.
+    """
+    root = root or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    manifest = manifest or os.path.join(root, "results", "manifest.json")
+    devices = devices or available_devices(spec.get("cpu_slots", 1))
+    log_dir = os.path.join(os.path.dirname(manifest), "logs")
+    os.makedirs(log_dir, exist_ok=True)
+
+    queue, entries = build_jobs(spec, root)
+    for dataset in spec["datasets"]:
+        os.makedirs(os.path.join(root, "results", dataset), exist_ok=True)
+    queue.sort(key=lambda job: -job["memory"])
+    print(f"{len(queue)} jobs to run, "
+          f"{sum(entry['status'] == 'skipped' for entry in entries)} already done.")
+    entries += _drop_oversized(queue, devices)
+    write_manifest(manifest, spec, entries)
+
+    usage = {device["name"]: (0, 0) for device in devices}
+    running = []
+
+    while queue or running:
+        for job in list(queue):
+            device = pick_device(job, devices, usage)
+            if device is None:
+                continue
+
+            process = _start_job(
+                job, device, job_command(job, spec, root), root, log_dir
+                )
+            _reserve(usage, device, job, 1)
+            running.append((job, device, process, time.perf_counter(),
+                            timestamp()))
+            queue.remove(job)
+
+        time.sleep(poll_interval)
+
+        for item in list(running):
+            job, device, process = item[:3]
+            if process.poll() is None:
+                continue
+
+            running.remove(item)
+            _reserve(usage, device, job, -1)
+
+            if process.returncode != 0 and job["attempts"] <= spec.get("retries", 1):
+                print(
+                    f"Job {job['model']}@{job['revision']} failed with code "
+                    f"{process.returncode}, retrying."
+                )
+                queue.append(job)
+                continue
+
+            entries.append(_finished_entry(*item))
+            write_manifest(manifest, spec, entries)
+
+    return entries
@@ -0,0 +1,148 @@
+"""
+Module for a persistent, content-addressed cache of stimulus scores.
+
+Scores are stored in a SQLite database, keyed by a hash of the model name,
+revision, dtype, reduction and the exact stimulus text. Rerunning an
+experiment after editing a few corpus rows then only scores the changed
+stimuli. The cache is bounded in size and evicts the least recently used
+entries first.
+"""
+
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import time
+
+
+class ScoreCache:
+    """
+    On-disk cache of reduced stimulus scores.
+
+    Args:
+        path (str): The path to the SQLite database file.
+        max_entries (int): The maximum number of cached scores. The least
+            recently used entries are evicted beyond that.
+        refresh (bool): Ignore cached scores and overwrite them with the newly
+            computed ones.
+    """
+
+    # Stay below the SQLite limit on variables per statement
+    CHUNK_SIZE = 500
+
+    def __init__(
+        self, path: str, max_entries: int = 5_000_000, refresh: bool = False
+    ) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.refresh = refresh
+        # Stimuli looked up and found since the cache was opened
+        self.lookups = 0
+        self.hits = 0
+        # Parallel jobs may share the cache, so wait for their writes
+        self.connection = sqlite3.connect(path, timeout=60.0)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "key TEXT PRIMARY KEY, score REAL, last_used REAL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS scores_last_used ON scores (last_used)"
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(context: tuple, stimulus: str) -> str:
+        """
+        Returns the cache key of a stimulus.
+
+        Args:
+            context (tuple): Model name, revision, dtype and reduction name.
+            stimulus (str): The exact stimulus text.
+
+        Returns:
+            str: The hex digest identifying the score.
+        """
+        content = json.dumps([*context, stimulus], ensure_ascii=False)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def lookup(self, context: tuple, stimuli: list) -> dict:
+        """
+        Looks up cached scores and marks them as recently used, counting
+        the stimuli looked up and found in `lookups` and `hits`.
+
+        Args:
+            context (tuple): Model name, revision, dtype and reduction name.
+            stimuli (list): The stimulus strings.
+
+        Returns:
+            dict: The cached score of each stimulus index found in the cache.
+        """
+        self.lookups += len(stimuli)
+        if self.refresh:
+            return {}
+
+        keys = [self.make_key(context, stimulus) for stimulus in stimuli]
+        found = {}
+        for start in range(0, len(keys), self.CHUNK_SIZE):
+            chunk = list(set(keys[start:start + self.CHUNK_SIZE]))
+            placeholders = ",".join("?" * len(chunk))
+            found.update(self.connection.execute(
+                f"SELECT key, score FROM scores WHERE key IN ({placeholders})",
+                chunk
+            ).fetchall())
+            self.connection.executemany(
+                "UPDATE scores SET last_used = ? WHERE key = ?",
+                [(time.time(), key) for key in chunk if key in found]
+            )
+        self.connection.commit()
+
+        # SQLite stores NaN as NULL
+        scores = {
+            i: math.nan if found[key] is None else found[key]
+            for i, key in enumerate(keys) if key in found
+        }
+        self.hits += len(scores)
+
+        return scores
+
+    def store(self, context: tuple, stimuli: list, scores: list) -> None:
+        """
+        Stores newly computed scores and evicts the least recently used
+        entries if the cache grows beyond its size limit.
+
+        Args:
+            context (tuple): Model name, revision, dtype and reduction name.
+            stimuli (list): The stimulus strings.
+            scores (list): The reduced score of each stimulus.
+        """
+        now = time.time()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO scores (key, score, last_used) "
+            "VALUES (?, ?, ?)",
+            [
+                (self.make_key(context, stimulus), score, now)
+                for stimulus, score in zip(stimuli, scores)
+            ]
+        )
+
+        excess = self.connection.execute(
+            "SELECT COUNT(*) FROM scores"
+        ).fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.connection.execute(
+                "DELETE FROM scores WHERE key IN (SELECT key FROM scores "
+                "ORDER BY last_used LIMIT ?)", (excess,)
+            )
+        self.connection.commit()
+
+    def close(self) -> None:
+        """
+        Closes the database connection.
+        """
+        self.connection.close()
@@ -0,0 +1,369 @@
+"""
+Module for scoring the stimuli of corpus items.
+
+Each corpus item is scored as two stimuli, its prefix followed by the good and
+by the bad continuation. This module builds the stimuli, scores them in the
+selected mode, taking scores from the score cache where available, and builds
+the result records of the scored items.
+
+torch, transformers and minicons are only imported once stimuli are scored.
+"""
+
+# pylint: disable=import-outside-toplevel
+import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+import numpy as np
+import pandas as pd
+from bin import profiling
+from bin.early_stopping import EarlyStopping
+from bin.io import model_dtype
+from bin.profiling import Profiler
+from bin.score_cache import ScoreCache
+from bin.tokenized_corpus import TokenizedCorpus
+
+if TYPE_CHECKING:
+    from minicons import scorer
+    from bin.token_budget import TokenBudget
+
+
+@dataclass
+class ScoringOptions:  # pylint: disable=too-many-instance-attributes
+    """
+    How the stimuli of a dataset are scored and their results written.
+
+    Args:
+        batch_size (int): Optional: number of stimuli per forward pass.
+            Stimuli are bucketed by token length within each chunk. By
+            default, each item is scored on its own.
+        prefix_cache (bool): Optional: run each distinct prefix through the
+            model once and score its continuations from the cached
+            past_key_values, batched by `batch_size`.
+        token_budget (TokenBudget): Optional: form batches by a budget of
+            padded tokens instead of `batch_size`, splitting batches that run
+            out of memory, see `bin.token_budget`. Not supported with
+            `prefix_cache`.
+        score_cache (ScoreCache): Optional: on-disk cache of scores; only
+            stimuli missing from it are scored. It only holds mean scores
+            and is not used with `token_logprobs`.
+        token_logprobs (bool): Optional: also store the per-token log
+            probabilities and prefix token counts of both stimuli, so that
+            other reductions can be computed with
+            `analysis_tools.apply_token_reduction`.
+        resume (bool): Optional: skip items already present in the sidecar of
+            an interrupted run.
+        chunk_size (int): Optional: number of items read from the corpus
+            and scored before their results are written to the sidecar.
+        fsync_interval (float): Optional: minimum number of seconds between
+            two fsync calls on the sidecar.
+        tokenized_cache_dir (str): Optional: directory of the pre-tokenized
+            corpora, shared by all models with the same tokenizer. None
+            tokenizes each chunk in memory.
+        pipeline (bool): Optional: read and tokenize the next chunk in a
+            producer thread and build and write the results in a consumer
+            thread while the current chunk is scored, see `bin.pipeline`.
+            The queue metrics are stored in meta_data['pipeline'].
+        early_stopping (EarlyStopping): Optional: score the items in a
+            seeded random order and stop once the accuracy of every relation
+            and type is known precisely enough, see `bin.early_stopping`.
+            Reads the whole corpus into memory. The numbers of scored and of
+            all items are stored in meta_data['n_scored'] and
+            meta_data['n_total'], the final intervals in
+            meta_data['early_stopping'].
+        early_stopping_step (int): Optional: with early stopping, the number
+            of items scored between two checks of the stopping rule, at most
+            `chunk_size`, so that datasets smaller than a chunk can stop
+            early too.
+        profiler (Profiler): Optional: records stage timings, tokens,
+            padding and peak memory into meta_data['profile'], and writes a
+            trace next to the output file if it has one. With a
+            DataParallelScorer, the stages inside the workers are not timed.
+    """
+    batch_size: int = None
+    prefix_cache: bool = False
+    token_budget: "TokenBudget" = None
+    score_cache: ScoreCache = None
+    token_logprobs: bool = False
+    resume: bool = False
+    chunk_size: int = 1024
+    fsync_interval: float = 30.0
+    tokenized_cache_dir: str = os.path.join(".cache", "tokenized")
+    pipeline: bool = False
+    early_stopping: EarlyStopping = None
+    early_stopping_step: int = 64
+    profiler: Profiler = None
+
+    def __post_init__(self) -> None:
+        if self.prefix_cache and self.token_budget is not None:
+            raise ValueError(
+                "A token budget is not supported with the prefix cache, "
+                "whose batches are formed by batch size."
+            )
+
+
+@dataclass
+class CachedScorer:
+    """
+    Stands in for a model whose scores are all in the score cache, so that
+    neither its weights nor its tokenizer are loaded. It cannot score or
+    tokenize stimuli.
+
+    Args:
+        dtype (str): The dtype name the model would score in, see
+            `bin.io.expected_dtype`.
+    """
+    dtype: str
+    tokenizer = None
+
+
+def build_stimuli(df: pd.DataFrame) -> list:
+    """
+    Builds the stimulus strings of a corpus, alternating the good and the bad
+    continuation of each item.
+
+    Args:
+        df (pd.DataFrame): The corpus with 'prefix', 'good_continuation' and
+            'bad_continuation' columns.
+
+    Returns:
+        list: Two stimuli per row, good continuation first.
+    """
+    stimuli = []
+    for prefix, good, bad in zip(
+        df.prefix, df.good_continuation, df.bad_continuation
+    ):
+        stimuli.append(f"{prefix} {good}")
+        stimuli.append(f"{prefix} {bad}")
+
+    return stimuli
+
+
+def stimulus_prefixes(df: pd.DataFrame) -> list:
+    """
+    Returns the prefix of each stimulus of a corpus, see `build_stimuli`.
+
+    Args:
+        df (pd.DataFrame): The corpus with a 'prefix' column.
+
+    Returns:
+        list: Two prefixes per row.
+    """
+    return [prefix for prefix in df.prefix for _ in range(2)]
+
+
+def stimulus_indices(df: pd.DataFrame) -> list:
+    """
+    Returns the indices of the stimuli of corpus items in the tokenized
+    corpus, good continuation first.
+
+    Args:
+        df (pd.DataFrame): Corpus items, indexed by their position in the
+            corpus.
+
+    Returns:
+        list: Two stimulus indices per item.
+    """
+    return [2 * position + which for position in df.index for which in (0, 1)]
+
+
+def item_correct(logprobs: list) -> np.ndarray:
+    """
+    Checks for each item whether the model prefers the good continuation.
+
+    Args:
+        logprobs (list): Two scores per item, see `build_results`.
+
+    Returns:
+        np.ndarray: One boolean per item.
+    """
+    scores = np.array([
+        score[0] if isinstance(score, tuple) else score for score in logprobs
+    ], dtype=float)
+
+    return scores[0::2] > scores[1::2]
+
+
+def score_corpus(
+    model: "scorer.IncrementalLMScorer", token_ids: list, prefix_lengths: list,
+    options: ScoringOptions = None, reduction=None
+) -> list:
+    """
+    Scores pre-tokenized stimuli with the selected scoring mode.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model to evaluate.
+        token_ids (list): The token ids of each stimulus, in good/bad pairs.
+        prefix_lengths (list): The number of prefix tokens of each stimulus.
+        options (ScoringOptions): Optional: the scoring mode, one item per
+            forward pass by default.
+        reduction (callable): Optional: reduces the per-token log
+            probabilities of a stimulus, the mean by default, or
+            `token_reduction` with `options.token_logprobs`.
+
+    Returns:
+        list: The reduced score of each stimulus, in input order.
+    """
+    from bin.batching import mean_reduction, score_token_ids, token_reduction
+    from bin.prefix_cache import score_with_prefix_cache
+    from bin.token_budget import score_token_budget
+
+    options = options or ScoringOptions()
+    if reduction is None:
+        reduction = token_reduction if options.token_logprobs \
+            else mean_reduction
+
+    if options.prefix_cache:
+        return score_with_prefix_cache(
+            model, token_ids, prefix_lengths, reduction=reduction,
+            batch_size=options.batch_size or 2
+            )
+    if options.token_budget is not None:
+        return score_token_budget(
+            model, token_ids, options.token_budget, reduction=reduction
+            )
+    if options.batch_size:
+        return score_token_ids(
+            model, token_ids, options.batch_size, reduction=reduction
+            )
+
+    # One item, i.e. one good/bad pair, per forward pass
+    return score_token_ids(
+        model, token_ids, 2, reduction=reduction, sort_by_length=False
+        )
+
+
+def cache_context(
+    model: "scorer.IncrementalLMScorer", meta_data: dict
+) -> tuple:
+    """
+    Returns the context under which the scores of a model are cached.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model, a
+            DataParallelScorer or a CachedScorer.
+        meta_data (dict): Metadata about the model.
+
+    Returns:
+        tuple: The model name, revision, dtype and reduction.
+    """
+    if isinstance(model, CachedScorer):
+        dtype = model.dtype
+    else:
+        from bin.parallel import DataParallelScorer
+
+        dtype = model.dtype if isinstance(model, DataParallelScorer) \
+            else model_dtype(model)
+
+    # The name of `batching.mean_reduction`, without importing torch
+    return meta_data.get("model"), meta_data.get("revision"), dtype, \
+        "mean_reduction"
+
+
+def score_items(
+    model: "scorer.IncrementalLMScorer", df: pd.DataFrame, meta_data: dict,
+    tokenized: TokenizedCorpus, options: ScoringOptions = None
+) -> list:
+    """
+    Scores the good and the bad stimulus of each corpus item, taking scores
+    from the score cache where available.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model to evaluate.
+        df (pd.DataFrame): The corpus items to score, indexed by their
+            position in `tokenized`.
+        meta_data (dict): Metadata about the model, used as cache context.
+        tokenized (TokenizedCorpus): The tokenized corpus or chunk, None
+            for a CachedScorer.
+        options (ScoringOptions): Optional: the scoring mode, score cache
+            and whether to keep per-token log probabilities.
+
+    Returns:
+        list: Two scores per item, good continuation first.
+    """
+    options = options or ScoringOptions()
+    indices = stimulus_indices(df)
+
+    if options.token_logprobs or options.score_cache is None:
+        return score_corpus(
+            model, tokenized.token_ids(indices),
+            tokenized.prefix_lengths[indices], options
+            )
+
+    stimuli = build_stimuli(df)
+    context = cache_context(model, meta_data)
+    with profiling.stage("cache_lookup"):
+        cached = options.score_cache.lookup(context, stimuli)
+    missing = [i for i in range(len(stimuli)) if i not in cached]
+
+    logprobs = [cached.get(i) for i in range(len(stimuli))]
+    if missing and isinstance(model, CachedScorer):
+        raise RuntimeError(
+            "Scores are missing from the score cache, but the model was not "
+            "loaded because all of them were cached when the run started."
+        )
+    if missing:
+        missing_indices = [indices[i] for i in missing]
+        scores = score_corpus(
+            model, tokenized.token_ids(missing_indices),
+            tokenized.prefix_lengths[missing_indices], options
+            )
+        with profiling.stage("cache_store"):
+            options.score_cache.store(
+                context, [stimuli[i] for i in missing], scores
+                )
+        for i, score in zip(missing, scores):
+            logprobs[i] = score
+
+    return logprobs
+
+
+def build_results(
+    df: pd.DataFrame, logprobs: list, prefix_lengths: list = None
+) -> list:
+    """
+    Builds the result records of scored corpus items.
+
+    Args:
+        df (pd.DataFrame): The scored corpus items.
+        logprobs (list): Two scores per item, good continuation first,
+            either mean log probabilities or tuples from `token_reduction`.
+        prefix_lengths (list): Optional: number of prefix tokens of each
+            stimulus, stored with per-token log probabilities.
+
+    Returns:
+        list: One result record per item.
+    """
+    results = []
+
+    for i, row in enumerate(df.to_dict("records")):
+        good, bad = logprobs[2 * i], logprobs[2 * i + 1]
+        tokens = isinstance(good, tuple)
+        if tokens:
+            (good, good_tokens), (bad, bad_tokens) = good, bad
+
+        res = {
+            "item_id": row["item_id"],
+            "prefix": row["prefix"],
+            "good_continuation": row["good_continuation"],
+            "bad_continuation": row["bad_continuation"],
+            "logprob_of_good_continuation": good,
+            "logprob_of_bad_continuation": bad,
+            "relation": row["category"],
+        }
+
+        # For cases where the dataset has a 'type' column for inter- or intra-
+        # sentential connective continuations
+        if 'type' in row:
+            res['type'] = row['type']
+
+        # Per-token log probabilities; the first token of a stimulus has no
+        # score, so score j belongs to token j + 1
+        if tokens:
+            res["token_logprobs_of_good_continuation"] = good_tokens
+            res["token_logprobs_of_bad_continuation"] = bad_tokens
+            res["prefix_tokens_of_good_continuation"] = int(prefix_lengths[2 * i])
+            res["prefix_tokens_of_bad_continuation"] = int(prefix_lengths[2 * i + 1])
+
+        results.append(res)
+
+    return results
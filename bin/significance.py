@@ -0,0 +1,286 @@
+"""
+Module for significance testing of accuracy differences between revisions.
+
+This module provides paired bootstrap and McNemar tests for the accuracy
+difference between two revisions of a model on the same items. The per-item
+difference of two revisions can only be -1, 0 or 1, so resampling the items
+with replacement is equivalent to drawing the three counts from a
+multinomial distribution, which is done for many revision pairs at once.
+"""
+
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from scipy import stats
+from bin.io import SEED
+from bin.sweep import revision_sort_key
+
+
+def _pair_indices(n_revisions: int, pairs: str) -> tuple:
+    """
+    Returns the indices of the revision pairs to compare.
+
+    Args:
+        n_revisions (int): The number of revisions, in training order.
+        pairs (str): 'consecutive' to compare each revision with the next,
+            'all' to compare all pairs.
+
+    Returns:
+        tuple: The index arrays of the earlier and the later revisions.
+    """
+    if pairs == "consecutive":
+        first = np.arange(n_revisions - 1)
+        return first, first + 1
+    if pairs == "all":
+        return np.triu_indices(n_revisions, k=1)
+
+    raise ValueError(f"Unknown pairs '{pairs}', expected 'consecutive' or 'all'.")
+
+
+@dataclass(frozen=True)
+class Bootstrap:
+    """
+    Settings of a bootstrap.
+
+    Args:
+        n_boot (int): Optional: number of bootstrap samples.
+        confidence (float): Optional: confidence level of the interval.
+        seed (int): Optional: random seed, SEED from 'bin/io.py' by default.
+    """
+    n_boot: int = 10_000
+    confidence: float = 0.95
+    seed: int = SEED
+
+
+def _bootstrap_differences(
+    rng: np.random.Generator, n_items: np.ndarray, n_worse: np.ndarray,
+    n_better: np.ndarray, n_boot: int
+) -> np.ndarray:
+    """
+    Draws bootstrap samples of the accuracy difference of revision pairs.
+
+    Args:
+        rng (np.random.Generator): The random generator.
+        n_items (np.ndarray): Number of items scored by both revisions, each
+            positive.
+        n_worse (np.ndarray): Items correct in the first revision only.
+        n_better (np.ndarray): Items correct in the second revision only.
+        n_boot (int): Number of bootstrap samples per pair.
+
+    Returns:
+        np.ndarray: The differences, of shape (n_boot, number of pairs).
+    """
+    pvals = np.stack(
+        [n_worse, n_items - n_worse - n_better, n_better], axis=1
+        ) / n_items[:, None]
+    counts = rng.multinomial(n_items, pvals, size=(n_boot, len(n_items)))
+
+    return (counts[..., 2] - counts[..., 0]) / n_items
+
+
+def paired_bootstrap(
+    n_items: np.ndarray, n_worse: np.ndarray, n_better: np.ndarray,
+    bootstrap: Bootstrap = Bootstrap(), max_draws: int = 5_000_000
+) -> tuple:
+    """
+    Runs paired bootstrap tests for many pairs of revisions at once.
+
+    Args:
+        n_items (np.ndarray): Number of items scored by both revisions.
+        n_worse (np.ndarray): Items correct in the first revision only.
+        n_better (np.ndarray): Items correct in the second revision only.
+        bootstrap (Bootstrap): Optional: number of samples per pair,
+            confidence level and seed.
+        max_draws (int): Maximum number of multinomial draws held in memory.
+
+    Returns:
+        tuple: Lower and upper bound of the confidence interval of the
+        accuracy difference, and the two-sided bootstrap p-value, per pair.
+    """
+    rng = np.random.default_rng(bootstrap.seed)
+    alpha = (1 - bootstrap.confidence) / 2
+    ci_low, ci_high, p_value = np.full((3, len(n_items)), np.nan)
+
+    valid = np.flatnonzero(n_items > 0)
+    chunk = max(1, max_draws // bootstrap.n_boot)
+    for start in range(0, len(valid), chunk):
+        idx = valid[start:start + chunk]
+        diffs = _bootstrap_differences(
+            rng, n_items[idx], n_worse[idx], n_better[idx], bootstrap.n_boot
+            )
+
+        ci_low[idx], ci_high[idx] = np.quantile(
+            diffs, [alpha, 1 - alpha], axis=0
+            )
+        p_value[idx] = np.minimum(1.0, 2 * np.minimum(
+            (diffs <= 0).mean(axis=0), (diffs >= 0).mean(axis=0)
+            ))
+
+    return ci_low, ci_high, p_value
+
+
+def mcnemar(n_worse: np.ndarray, n_better: np.ndarray) -> tuple:
+    """
+    Runs exact McNemar tests on the discordant item counts of revision pairs.
+
+    Args:
+        n_worse (np.ndarray): Items correct in the first revision only.
+        n_better (np.ndarray): Items correct in the second revision only.
+
+    Returns:
+        tuple: The chi-squared statistic with continuity correction and the
+        exact two-sided p-value, per pair.
+    """
+    discordant = n_worse + n_better
+    with np.errstate(divide="ignore", invalid="ignore"):
+        statistic = np.where(
+            discordant > 0,
+            (np.abs(n_worse - n_better) - 1).clip(min=0) ** 2 / discordant,
+            0.0
+            )
+    p_value = np.minimum(
+        1.0, 2 * stats.binom.cdf(np.minimum(n_worse, n_better), discordant, 0.5)
+        )
+
+    return statistic, p_value
+
+
+def _pair_counts(
+    revision: np.ndarray, item_codes: np.ndarray, correct: np.ndarray,
+    pairs: str
+) -> dict:
+    """
+    Counts the items of each pair of revisions of one group that both
+    revisions scored, and how many of them each got right.
+
+    Args:
+        revision (np.ndarray): The revision of each result of the group.
+        item_codes (np.ndarray): The item of each result of the group.
+        correct (np.ndarray): Whether each result is correct, as 0/1.
+        pairs (str): The revision pairs to compare, see `_pair_indices`.
+
+    Returns:
+        dict: The 'revision_a' and 'revision_b' of each pair, the number of
+        shared items, of items only the first ('n_worse') or only the
+        second ('n_better') got right, and of correct items of each.
+    """
+    revisions = sorted(set(revision), key=revision_sort_key)
+    rev_codes = pd.Categorical(revision, categories=revisions).codes
+    items, item_index = np.unique(item_codes, return_inverse=True)
+
+    # Revisions x items, -1 where a revision did not score an item
+    matrix = np.full((len(revisions), len(items)), -1, dtype=np.int8)
+    matrix[rev_codes, item_index] = correct
+
+    first, second = _pair_indices(len(revisions), pairs)
+    before, after = matrix[first], matrix[second]
+    both = (before >= 0) & (after >= 0)
+
+    return {
+        "revision_a": np.array(revisions, dtype=object)[first],
+        "revision_b": np.array(revisions, dtype=object)[second],
+        "n_items": both.sum(axis=1),
+        "n_worse": (both & (before == 1) & (after == 0)).sum(axis=1),
+        "n_better": (both & (before == 0) & (after == 1)).sum(axis=1),
+        "accuracy_a": np.where(both, before, 0).sum(axis=1),
+        "accuracy_b": np.where(both, after, 0).sum(axis=1),
+    }
+
+
+def _add_tests(result: pd.DataFrame, bootstrap: Bootstrap) -> pd.DataFrame:
+    """
+    Adds the accuracies, their difference and the tests of each revision
+    pair to its item counts.
+
+    Args:
+        result (pd.DataFrame): The counts of each pair, see `_pair_counts`.
+        bootstrap (Bootstrap): The settings of the paired bootstrap, None to
+            skip it.
+
+    Returns:
+        pd.DataFrame: The pairs with accuracies and test results.
+    """
+    n_items = result["n_items"].to_numpy(dtype=np.int64)
+    n_worse = result["n_worse"].to_numpy(dtype=np.int64)
+    n_better = result["n_better"].to_numpy(dtype=np.int64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result["accuracy_a"] = result["accuracy_a"] / n_items
+        result["accuracy_b"] = result["accuracy_b"] / n_items
+    result["difference"] = result["accuracy_b"] - result["accuracy_a"]
+    if bootstrap is None:
+        result["ci_low"] = result["ci_high"] = result["p_bootstrap"] = np.nan
+    else:
+        (
+            result["ci_low"], result["ci_high"], result["p_bootstrap"]
+        ) = paired_bootstrap(n_items, n_worse, n_better, bootstrap)
+    result["mcnemar_statistic"], result["p_mcnemar"] = mcnemar(
+        n_worse, n_better
+        )
+
+    return result
+
+
+def compare_revisions(
+    df: pd.DataFrame, by: list = None, pairs: str = "consecutive",
+    bootstrap: Bootstrap = Bootstrap()
+) -> pd.DataFrame:
+    """
+    Tests whether the accuracy changes between revisions of each model, on
+    the items both revisions were evaluated on.
+
+    Args:
+        df (pd.DataFrame): DataFrame with log probabilities, as returned by
+            the readers in `analysis_tools`, with 'model', 'revision' and
+            'item_id' columns.
+        by (list): Optional: columns defining the groups in which revisions
+            are compared, default is 'model'.
+        pairs (str): Optional: 'consecutive' to compare each revision with the
+            next one in training order, 'all' to compare all pairs.
+        bootstrap (Bootstrap): Optional: number of bootstrap samples per
+            pair, confidence level of the interval and seed. None skips the
+            bootstrap and leaves its columns empty.
+
+    Returns:
+        pd.DataFrame: One row per revision pair and group with the accuracy
+        of both revisions, their difference with bootstrap confidence
+        interval and p-value, and the McNemar statistic and p-value.
+    """
+    by = ["model"] if by is None else list(by)
+    for col in by + ["revision", "item_id"]:
+        if col not in df.columns:
+            raise ValueError(f"Column '{col}' is missing in the dataset.")
+
+    item_keys = ["item_id"] + [
+        col for col in ["dataset", "relation", "type"]
+        if col in df.columns and col not in by
+    ]
+    correct = (
+        df["logprob_of_good_continuation"].to_numpy(dtype=float)
+        > df["logprob_of_bad_continuation"].to_numpy(dtype=float)
+    ).astype(np.int8)
+
+    revision = df["revision"].astype(str).to_numpy()
+    # Keys may be missing, e.g. the type of untyped datasets
+    item_codes = df.groupby(
+        item_keys, observed=True, sort=False, dropna=False
+        ).ngroup().to_numpy()
+
+    rows = []
+    groups = df.groupby(by, observed=True, sort=True).indices
+    for keys, positions in groups.items():
+        keys = keys if isinstance(keys, tuple) else (keys,)
+        rows.append(pd.DataFrame({
+            **dict(zip(by, keys)),
+            **_pair_counts(
+                revision[positions], item_codes[positions],
+                correct[positions], pairs
+                ),
+        }))
+
+    columns = by + ["revision_a", "revision_b", "n_items", "n_worse",
+                    "n_better", "accuracy_a", "accuracy_b"]
+    result = pd.concat(rows, ignore_index=True) if rows \
+        else pd.DataFrame(columns=columns)
+
+    return _add_tests(result, bootstrap)
@@ -0,0 +1,119 @@
+"""
+Module for parsing and ordering checkpoint sweeps over model revisions.
+
+A sweep is given as a comma-separated list of revisions, where each entry is
+either a single revision (e.g. 'step1000' or 'main') or a range of the form
+'<prefix><start>..<prefix><stop>:<step>' (e.g. 'step1000..step5000:1000'),
+which includes both ends.
+"""
+
+import os
+import re
+
+
+REVISION_RANGE = re.compile(
+    r"^(?P<prefix>[^\d.]*)(?P<start>\d+)\.\.(?P=prefix)?(?P<stop>\d+)"
+    r"(?::(?P<step>\d+))?$"
+)
+
+
+def parse_revisions(spec: str) -> list:
+    """
+    Parses a sweep specification into a list of revisions.
+
+    Args:
+        spec (str): Comma-separated revisions and revision ranges, e.g.
+            'step0,step1000..step3000:1000,main'.
+
+    Returns:
+        list: The revisions in the given order, without duplicates.
+    """
+    revisions = []
+
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        match = REVISION_RANGE.match(entry)
+        if ".." not in entry:
+            expanded = [entry]
+        elif match is None or match.group("step") is None:
+            raise ValueError(
+                f"Invalid revision range '{entry}'. Expected a range like "
+                "'step1000..step5000:1000'."
+            )
+        else:
+            start, stop, step = (
+                int(match.group(key)) for key in ["start", "stop", "step"]
+            )
+            if step < 1 or stop < start:
+                raise ValueError(f"Empty revision range '{entry}'.")
+            expanded = [
+                f"{match.group('prefix')}{number}"
+                for number in range(start, stop + 1, step)
+            ]
+
+        for revision in expanded:
+            if revision not in revisions:
+                revisions.append(revision)
+
+    if not revisions:
+        raise ValueError("No revisions given.")
+
+    return revisions
+
+
+def revision_sort_key(revision: str) -> tuple:
+    """
+    Returns a key that sorts revisions by training step, e.g. 'step1000'
+    before 'step20000' and 'step20000-tokens84B', with the final 'main'
+    revision last and other names in between.
+
+    Args:
+        revision (str): The revision name.
+
+    Returns:
+        tuple: The sort key.
+    """
+    match = re.match(r"^step(\d+)", revision)
+    if match:
+        return (0, int(match.group(1)), revision)
+    if revision == "main":
+        return (2, 0, revision)
+
+    return (1, 0, revision)
+
+
+def plan_outputs(
+    model_name: str, revisions: list, datasets: list, file_out_template: str
+) -> list:
+    """
+    Lists the output file of every revision and dataset of a sweep, and
+    whether it has already been written.
+
+    Args:
+        model_name (str): The name of the model.
+        revisions (list): The revisions of the sweep.
+        datasets (list): The datasets each revision is evaluated on.
+        file_out_template (str): Template for output file paths with
+            '{dataset}', '{model}' and '{revision}' placeholders.
+
+    Returns:
+        list: Dicts with 'revision', 'dataset', 'path' and 'exists', ordered
+        by revision.
+    """
+    outputs = []
+    for revision in revisions:
+        for dataset in datasets:
+            path = file_out_template.format(
+                dataset=dataset, model=model_name, revision=revision
+                )
+            outputs.append({
+                "revision": revision,
+                "dataset": dataset,
+                "path": path,
+                "exists": os.path.exists(path),
+            })
+
+    return outputs
@@ -0,0 +1,169 @@
+"""
+Module for a scoring backend that only computes the log probabilities of the
+target tokens.
+
+`IncrementalLMScorer.compute_stats` runs the full model and normalizes the
+logits over the whole vocabulary at every position, materializing a
+(batch, length, vocabulary) tensor that dominates peak memory for small
+models with large vocabularies. The TargetScorer instead runs the model
+without its output layer, keeps only the positions that predict a real
+token, and computes their logits in chunks of the vocabulary with a running
+logsumexp. Only the logits of the target tokens are kept, so batches can be
+much larger. The scores match those of minicons up to floating point error.
+"""
+
+import torch
+from minicons import scorer
+
+
+class TargetScorer(scorer.IncrementalLMScorer):
+    """
+    An IncrementalLMScorer computing only the log probabilities of the
+    target tokens, see the module docstring. Accepts the same arguments.
+    Requests the minicons path does not support this way, such as ranks,
+    fall back to it.
+    """
+
+    # Vocabulary entries per chunk of the output layer
+    VOCAB_CHUNK = 8192
+    # Positions per chunk when the output layer is not a plain linear layer,
+    # e.g. after dynamic quantization
+    POSITION_CHUNK = 1024
+
+    def _supports_target_scores(self) -> bool:
+        config = self.model.config
+        # Logits that are rescaled after the output layer
+        return not (getattr(config, "final_logit_softcapping", None)
+                    or getattr(config, "logit_scale", None))
+
+    def _chunked_positions(
+        self, head, hidden: torch.Tensor, targets: torch.Tensor
+    ) -> torch.Tensor:
+        """
+        Normalizes the logits of the target tokens with an output layer that
+        is not a plain linear layer, a chunk of positions at a time.
+
+        Args:
+            head (torch.nn.Module): The output layer.
+            hidden (torch.Tensor): Last hidden states of shape (n, hidden).
+            targets (torch.Tensor): The target token ids of shape (n,).
+
+        Returns:
+            torch.Tensor: The float32 log probability of each target.
+        """
+        scores = [hidden.new_empty(0, dtype=torch.float32)]
+        for start in range(0, len(targets), self.POSITION_CHUNK):
+            chunk = slice(start, start + self.POSITION_CHUNK)
+            logprobs = torch.log_softmax(head(hidden[chunk]).float(), -1)
+            scores.append(
+                logprobs.gather(-1, targets[chunk, None]).squeeze(-1)
+                )
+
+        return torch.cat(scores)
+
+    def _chunked_vocabulary(
+        self, head: torch.nn.Linear, hidden: torch.Tensor,
+        targets: torch.Tensor
+    ) -> torch.Tensor:
+        """
+        Normalizes the logits of the target tokens with a linear output
+        layer, a chunk of the vocabulary at a time with a running logsumexp.
+
+        Args:
+            head (torch.nn.Linear): The output layer.
+            hidden (torch.Tensor): Last hidden states of shape (n, hidden).
+            targets (torch.Tensor): The target token ids of shape (n,).
+
+        Returns:
+            torch.Tensor: The float32 log probability of each target.
+        """
+        rows = torch.arange(len(targets), device=hidden.device)
+        lse = torch.full((len(targets),), float("-inf"), device=hidden.device)
+        target_logits = torch.empty(len(targets), device=hidden.device)
+        for start in range(0, head.out_features, self.VOCAB_CHUNK):
+            end = min(start + self.VOCAB_CHUNK, head.out_features)
+            bias = None if head.bias is None else head.bias[start:end]
+            logits = torch.nn.functional.linear(
+                hidden, head.weight[start:end], bias
+                ).float()
+            lse = torch.logaddexp(lse, logits.logsumexp(-1))
+            in_chunk = (targets >= start) & (targets < end)
+            target_logits[in_chunk] = logits[
+                rows[in_chunk], targets[in_chunk] - start
+            ]
+
+        return target_logits - lse
+
+    def _target_logprobs(
+        self, hidden: torch.Tensor, targets: torch.Tensor
+    ) -> torch.Tensor:
+        """
+        Normalizes the logits of the target tokens over the vocabulary.
+
+        Args:
+            hidden (torch.Tensor): Last hidden states of shape (n, hidden).
+            targets (torch.Tensor): The target token ids of shape (n,).
+
+        Returns:
+            torch.Tensor: The float32 log probability of each target.
+        """
+        head = self.model.get_output_embeddings()
+        if not isinstance(head, torch.nn.Linear):
+            return self._chunked_positions(
+                head, hidden, targets.to(hidden.device)
+                )
+
+        device = head.weight.device
+        return self._chunked_vocabulary(
+            head, hidden.to(device), targets.to(device)
+            )
+
+    # The signature is that of IncrementalLMScorer.compute_stats
+    def compute_stats(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self, batch, rank: bool = False, prob: bool = False,
+        base_two: bool = False, return_tensors: bool = False,
+        bow_correction: bool = False
+    ):
+        """
+        Computes the log probability of each token after the first one of
+        each right-padded sequence, like `IncrementalLMScorer.compute_stats`.
+
+        Args:
+            batch (tuple): The encoded batch and the number of leading
+                tokens of each sequence not to score.
+            rank, prob, base_two, bow_correction (bool): Optional: handled
+                by the minicons path.
+            return_tensors (bool): Optional: return tensors instead of lists.
+
+        Returns:
+            list: The float32 log probabilities of each sequence.
+        """
+        if rank or prob or base_two or bow_correction \
+                or not self._supports_target_scores():
+            return super().compute_stats(
+                batch, rank=rank, prob=prob, base_two=base_two,
+                return_tensors=return_tensors, bow_correction=bow_correction
+                )
+
+        encoded, offsets = batch
+        if self.device != "auto":
+            encoded = encoded.to(self.device)
+        input_ids = encoded["input_ids"]
+        mask = encoded["attention_mask"].bool()
+
+        # Position i predicts token i + 1, from offset on
+        scored = mask[:, 1:] & mask[:, :-1]
+        positions = torch.arange(scored.shape[1], device=scored.device)
+        scored &= positions >= torch.tensor(offsets, device=scored.device)[:, None]
+
+        with torch.no_grad():
+            hidden = self.model.base_model(**encoded).last_hidden_state
+            scores = self._target_logprobs(
+                hidden[:, :-1][scored], input_ids[:, 1:][scored]
+                )
+
+        scores = list(scores.split(scored.sum(1).tolist()))
+        if not return_tensors:
+            scores = [score.tolist() for score in scores]
+
+        return scores
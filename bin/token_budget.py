@@ -0,0 +1,423 @@
+"""
+Module for batching by a token budget with out-of-memory backoff.
+
+Instead of a fixed number of stimuli, each batch holds as many length-sorted
+stimuli as fit into a budget of padded tokens, so short items are scored in
+large batches and long ones in small batches. A batch that runs out of
+memory is split in half and retried. On CPU, where running out of memory
+usually kills the process instead of raising an error, the memory each
+batch adds to the resident set size is measured per padded token, and a
+batch estimated to bring the process close to the memory limit is split
+before it runs.
+
+The budget that proved safe is remembered per model, dtype and device in a
+small JSON file, so that later runs start at the right size. Budgets only
+lowered by the CPU estimate are not remembered.
+"""
+
+import gc
+import json
+import os
+import weakref
+import torch
+from bin.batching import map_batches, mean_reduction, score_batch
+from bin.profiling import peak_rss
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+DEFAULT_PATH = os.path.join(".cache", "token_budgets.json")
+# Share of the memory limit the resident set size may reach on CPU
+RSS_LIMIT_FRACTION = 0.9
+
+# Per model scored on CPU: the resident set size before its first batch,
+# right after the weights were loaded, and the largest memory increase per
+# padded token measured for one of its batches
+_CPU_MEMORY = weakref.WeakKeyDictionary()
+
+
+def memory_limit(device: str = "cpu") -> int:
+    """
+    Returns the memory available to a device.
+
+    Args:
+        device (str): Optional: the device, e.g. 'cpu' or 'cuda:0'.
+
+    Returns:
+        int: The memory of the GPU, or on CPU the smallest of the physical
+        memory, the cgroup limit and the address space limit, in bytes. None
+        if no limit is known, e.g. on Windows.
+    """
+    device = torch.device(device)
+    if device.type == "cuda":
+        return torch.cuda.get_device_properties(device.index or 0).total_memory
+
+    limits = []
+    if hasattr(os, "sysconf"):
+        limits.append(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES"))
+    for path in ["/sys/fs/cgroup/memory.max",
+                 "/sys/fs/cgroup/memory/memory.limit_in_bytes"]:
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                limits.append(int(file.read().strip()))
+        except (OSError, ValueError):
+            pass  # No limit, or no cgroup of this version
+    if resource is not None:
+        soft, _ = resource.getrlimit(resource.RLIMIT_AS)
+        if soft != resource.RLIM_INFINITY:
+            limits.append(soft)
+
+    return min(limits, default=None)
+
+
+def current_rss() -> int:
+    """
+    Returns the current resident set size of this process.
+
+    Returns:
+        int: The memory in bytes, or the peak where the current size is not
+        available, None if neither is.
+    """
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+def is_out_of_memory(error: BaseException) -> bool:
+    """
+    Checks whether an error was raised because memory ran out.
+
+    Args:
+        error (BaseException): The error.
+
+    Returns:
+        bool: Whether the error is a CUDA or CPU out-of-memory error.
+    """
+    if isinstance(error, (torch.cuda.OutOfMemoryError, MemoryError)):
+        return True
+
+    message = str(error).lower()
+    return isinstance(error, RuntimeError) and (
+        "out of memory" in message or "can't allocate memory" in message
+    )
+
+
+def device_name(device) -> str:
+    """
+    Describes a device for the budget cache, so that budgets are only reused
+    on devices with the same memory.
+
+    Args:
+        device: The device of the model, e.g. 'cpu' or torch.device('cuda').
+
+    Returns:
+        str: The GPU model or 'cpu', with its memory limit if known.
+    """
+    if str(device) == "auto":
+        device = "cuda:0"
+    device = torch.device(device)
+    limit = memory_limit(device)
+    if limit is None:
+        return "cpu"
+
+    gigabytes = limit / 1024 ** 3
+    if device.type == "cuda":
+        return f"{torch.cuda.get_device_name(device.index or 0)} ({gigabytes:.0f} GB)"
+
+    return f"cpu ({gigabytes:.0f} GB)"
+
+
+def token_budget_batches(lengths: list, max_tokens: int) -> list:
+    """
+    Groups stimulus indices into length-sorted batches of at most
+    `max_tokens` padded tokens. A stimulus longer than the budget gets a
+    batch of its own.
+
+    Args:
+        lengths (list): Token length of each stimulus.
+        max_tokens (int): Maximum number of stimuli times the length of the
+            longest stimulus per batch.
+
+    Returns:
+        list: A list of batches, each a list of stimulus indices.
+    """
+    if max_tokens < 1:
+        raise ValueError("Token budget must be a positive integer.")
+
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+
+    batches, batch = [], []
+    for i in order:
+        # Sorted by length, so stimulus i is the longest of the batch
+        if batch and (len(batch) + 1) * lengths[i] > max_tokens:
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def padded_tokens(token_ids: list) -> int:
+    """
+    Returns the number of input positions of a batch after padding.
+
+    Args:
+        token_ids (list): The token ids of each stimulus in the batch.
+
+    Returns:
+        int: The number of stimuli times the longest length.
+    """
+    return len(token_ids) * max((len(ids) for ids in token_ids), default=0)
+
+
+def estimated_rss(model, n_tokens: int) -> float:
+    """
+    Estimates the resident set size of this process while a model scores a
+    batch on CPU: the size right after the weights were loaded plus the
+    increase per padded token measured for earlier batches.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model used for scoring.
+        n_tokens (int): The padded size of the batch.
+
+    Returns:
+        float: The estimate in bytes, or None before any batch of the model
+        was measured.
+    """
+    memory = _CPU_MEMORY.get(model)
+    if memory is None or not memory["bytes_per_token"]:
+        return None
+
+    return memory["baseline"] + memory["bytes_per_token"] * n_tokens
+
+
+def _score_measured(model, token_ids: list, reduction) -> list:
+    """
+    Scores one batch on CPU, measuring the memory it adds to the resident
+    set size. The increase is only known when the batch raises the peak of
+    the process; otherwise it stayed below an earlier peak and the estimate
+    is kept.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model used for scoring.
+        token_ids (list): The token ids of each stimulus in the batch.
+        reduction (callable): Reduces the per-token log probabilities of a
+            stimulus.
+
+    Returns:
+        list: The reduced score of each stimulus.
+    """
+    before = current_rss()
+    peak_before = peak_rss()
+    if before is None or peak_before is None:
+        # Memory cannot be measured, e.g. on Windows
+        return score_batch(model, token_ids, reduction)
+    memory = _CPU_MEMORY.setdefault(
+        model, {"baseline": before, "bytes_per_token": 0.0}
+        )
+
+    scores = score_batch(model, token_ids, reduction)
+
+    peak = peak_rss()
+    if peak > peak_before:
+        memory["bytes_per_token"] = max(
+            memory["bytes_per_token"], (peak - before) / padded_tokens(token_ids)
+            )
+
+    return scores
+
+
+def _score_halves(model, token_ids: list, reduction) -> tuple:
+    """
+    Scores the two halves of a batch separately, see `score_batch_safely`.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model used for scoring.
+        token_ids (list): The token ids of each stimulus in the batch.
+        reduction (callable): Reduces the per-token log probabilities of a
+            stimulus.
+
+    Returns:
+        tuple: The results of both halves, concatenated.
+    """
+    middle = len(token_ids) // 2
+    first = score_batch_safely(model, token_ids[:middle], reduction)
+    second = score_batch_safely(model, token_ids[middle:], reduction)
+
+    return tuple(a + b for a, b in zip(first, second))
+
+
+def score_batch_safely(model, token_ids: list, reduction=mean_reduction) -> tuple:
+    """
+    Scores one batch, splitting it in half and retrying whenever it runs out
+    of memory. On CPU, a batch estimated to leave too little memory is split
+    before it runs. Runs in the worker processes of a `DataParallelScorer`,
+    too.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model used for scoring.
+        token_ids (list): The token ids of each stimulus in the batch.
+        reduction (callable): Reduces the per-token log probabilities of a
+            stimulus.
+
+    Returns:
+        tuple: The reduced score of each stimulus, the padded sizes of the
+        batches that ran out of memory, and the padded sizes of the batches
+        split by the CPU memory estimate.
+    """
+    on_cpu = str(getattr(model, "device", "cpu")) == "cpu"
+    if on_cpu and len(token_ids) > 1:
+        estimate = estimated_rss(model, padded_tokens(token_ids))
+        limit = memory_limit("cpu")
+        if estimate is not None and limit is not None \
+                and estimate > RSS_LIMIT_FRACTION * limit:
+            scores, failed, estimated = _score_halves(model, token_ids, reduction)
+            return scores, failed, [padded_tokens(token_ids)] + estimated
+
+    try:
+        if on_cpu:
+            return _score_measured(model, token_ids, reduction), [], []
+        return score_batch(model, token_ids, reduction), [], []
+    except Exception as error:  # pylint: disable=broad-except
+        if not is_out_of_memory(error) or len(token_ids) == 1:
+            raise
+        del error
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    scores, failed, estimated = _score_halves(model, token_ids, reduction)
+    return scores, [padded_tokens(token_ids)] + failed, estimated
+
+
+class TokenBudget:
+    """
+    The token budget of one model, dtype and device, remembered across runs
+    in a JSON file once it had to be reduced.
+
+    Args:
+        key (str): Identifies the model, dtype and device, see `budget_key`.
+        max_tokens (int): The requested budget of padded tokens per batch.
+        path (str): Optional: the JSON file of safe budgets, None to not
+            remember them.
+    """
+
+    def __init__(self, key: str, max_tokens: int, path: str = DEFAULT_PATH) -> None:
+        if max_tokens < 1:
+            raise ValueError("Token budget must be a positive integer.")
+
+        self.key = key
+        self.path = path
+        self.max_tokens = max_tokens
+
+        safe = self._read().get(key)
+        if safe is not None and safe < max_tokens:
+            print(f"Starting from the safe token budget {safe} of {key}.")
+            self.max_tokens = safe
+
+    def _read(self) -> dict:
+        if self.path is None or not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def reduce(self, failed_sizes: list, save: bool = True) -> None:
+        """
+        Lowers the budget below the smallest batch that was too large.
+
+        Args:
+            failed_sizes (list): Padded sizes of batches that were too large.
+            save (bool): Optional: remember the lowered budget as the safe
+                budget of later runs. False for batches that were only
+                estimated to be too large.
+        """
+        if not failed_sizes:
+            return
+
+        max_tokens = max(1, min(failed_sizes) // 2)
+        if max_tokens >= self.max_tokens:
+            return
+        print(f"Out of memory: reducing the token budget to {max_tokens}.")
+        self.max_tokens = max_tokens
+        if save:
+            self.save()
+
+    def save(self) -> None:
+        """
+        Remembers the current budget as the safe budget of its key, unless
+        a lower one is remembered already.
+        """
+        if self.path is None:
+            return
+        budgets = self._read()
+        budgets[self.key] = min(
+            self.max_tokens, budgets.get(self.key, self.max_tokens)
+            )
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(budgets, file, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def budget_key(model_name: str, dtype: str, device) -> str:
+    """
+    Returns the key of a token budget.
+
+    Args:
+        model_name (str): The name of the model.
+        dtype (str): The dtype name, see `bin.io.model_dtype`.
+        device: The device of the model, see `device_name`.
+
+    Returns:
+        str: The key.
+    """
+    return f"{model_name} | {dtype} | {device_name(device)}"
+
+
+def score_token_budget(
+    model, token_ids: list, token_budget: TokenBudget, reduction=mean_reduction
+) -> list:
+    """
+    Scores pre-tokenized stimuli in batches formed by a token budget,
+    reducing the budget after out-of-memory errors.
+
+    Args:
+        model (scorer.IncrementalLMScorer): The model used for scoring, or a
+            DataParallelScorer.
+        token_ids (list): The token ids of each stimulus.
+        token_budget (TokenBudget): The budget, lowered if batches run out of
+            memory or are estimated to on CPU.
+        reduction (callable): Reduces the per-token log probabilities of a
+            stimulus, same as in `sequence_score`.
+
+    Returns:
+        list: The reduced score of each stimulus, in input order.
+    """
+    batches = token_budget_batches(
+        [len(ids) for ids in token_ids], token_budget.max_tokens
+        )
+
+    results = map_batches(model, score_batch_safely, [
+        ([token_ids[i] for i in batch], reduction) for batch in batches
+    ])
+
+    scores = [None] * len(token_ids)
+    failed_sizes, estimated_sizes = [], []
+    for batch, (batch_scores, failed, estimated) in zip(batches, results):
+        failed_sizes += failed
+        estimated_sizes += estimated
+        for i, score in zip(batch, batch_scores):
+            scores[i] = score
+    token_budget.reduce(failed_sizes)
+    # The estimate only applies to this process, so it is not remembered
+    token_budget.reduce(estimated_sizes, save=False)
+
+    return scores
@@ -0,0 +1,291 @@
+"""
+Module for pre-tokenized corpora.
+
+A corpus is tokenized once per tokenizer and stored as compact arrays: the
+token ids of all stimuli in one flat array, the offsets of each stimulus into
+it, and the number of leading tokens each stimulus shares with the
+tokenization of its prefix. The arrays are cached on disk, keyed by a hash of
+the tokenizer and the corpus file, and memory-mapped when loaded, so all
+checkpoints of a model suite sharing one tokenizer reuse the same file.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+
+def tokenizer_hash(tokenizer) -> str:
+    """
+    Returns a hash identifying the behavior of a tokenizer.
+
+    Args:
+        tokenizer (transformers.PreTrainedTokenizerBase): The tokenizer.
+
+    Returns:
+        str: The hex digest of the tokenizer's full serialization, or of its
+        vocabulary and special tokens for tokenizers without a fast backend.
+    """
+    digest = hashlib.sha256(type(tokenizer).__name__.encode("utf-8"))
+
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        digest.update(backend.to_str().encode("utf-8"))
+    else:
+        digest.update(json.dumps(
+            sorted(tokenizer.get_vocab().items()), ensure_ascii=False
+            ).encode("utf-8"))
+    digest.update(json.dumps(
+        tokenizer.special_tokens_map, sort_keys=True, default=str
+        ).encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+def file_hash(path: str) -> str:
+    """
+    Returns the SHA-256 hash of a file's content.
+
+    Args:
+        path (str): The path to the file.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+class TokenizedCorpus:
+    """
+    Token ids of the stimuli of a corpus, two per item with the good
+    continuation first, in corpus order.
+
+    Args:
+        ids (np.ndarray): The token ids of all stimuli, concatenated.
+        offsets (np.ndarray): Start of each stimulus in `ids`, plus the end
+            of the last one.
+        prefix_lengths (np.ndarray): Number of leading tokens of each
+            stimulus that are the tokenization of its prefix, or -1 if the
+            tokenization of the stimulus does not start with it.
+    """
+
+    FILES = ["ids", "offsets", "prefix_lengths"]
+
+    def __init__(
+        self, ids: np.ndarray, offsets: np.ndarray, prefix_lengths: np.ndarray
+    ) -> None:
+        self.ids = ids
+        self.offsets = offsets
+        self.prefix_lengths = prefix_lengths
+
+    def __len__(self) -> int:
+        return len(self.prefix_lengths)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """
+        Returns the number of tokens of each stimulus.
+
+        Returns:
+            np.ndarray: The token counts.
+        """
+        return np.diff(self.offsets)
+
+    def token_ids(self, indices) -> list:
+        """
+        Returns the token ids of the given stimuli.
+
+        Args:
+            indices: The stimulus indices.
+
+        Returns:
+            list: One list of token ids per stimulus.
+        """
+        return [
+            self.ids[self.offsets[i]:self.offsets[i + 1]].tolist()
+            for i in indices
+        ]
+
+    @classmethod
+    def build(cls, tokenizer, prefixes: list, stimuli: list) -> "TokenizedCorpus":
+        """
+        Tokenizes the stimuli of a corpus.
+
+        Args:
+            tokenizer (transformers.PreTrainedTokenizerBase): The tokenizer.
+            prefixes (list): The prefix of each stimulus.
+            stimuli (list): The stimulus strings, each starting with its
+                prefix.
+
+        Returns:
+            TokenizedCorpus: The tokenized corpus.
+        """
+        full_ids = tokenizer(stimuli)["input_ids"] if stimuli else []
+        unique_prefixes = list(dict.fromkeys(prefixes))
+        prefix_ids = dict(zip(
+            unique_prefixes,
+            tokenizer(unique_prefixes)["input_ids"] if unique_prefixes else []
+            ))
+
+        prefix_lengths = np.full(len(stimuli), -1, dtype=np.int32)
+        for i, (prefix, ids) in enumerate(zip(prefixes, full_ids)):
+            prefix_tokens = prefix_ids[prefix]
+            if (prefix_tokens and len(ids) > len(prefix_tokens)
+                    and ids[:len(prefix_tokens)] == prefix_tokens):
+                prefix_lengths[i] = len(prefix_tokens)
+
+        offsets = np.zeros(len(stimuli) + 1, dtype=np.int64)
+        np.cumsum([len(ids) for ids in full_ids], out=offsets[1:])
+        ids = np.fromiter(
+            (token for tokens in full_ids for token in tokens),
+            dtype=np.int32, count=offsets[-1]
+            )
+
+        return cls(ids, offsets, prefix_lengths)
+
+    def slice(self, start: int, stop: int) -> "TokenizedCorpus":
+        """
+        Copies a contiguous range of stimuli into memory.
+
+        Args:
+            start (int): The first stimulus.
+            stop (int): The stimulus after the last one.
+
+        Returns:
+            TokenizedCorpus: The stimuli, indexed from 0.
+        """
+        return TokenizedCorpus(
+            np.array(self.ids[self.offsets[start]:self.offsets[stop]]),
+            np.array(self.offsets[start:stop + 1]) - self.offsets[start],
+            np.array(self.prefix_lengths[start:stop])
+            )
+
+    def take(self, indices) -> "TokenizedCorpus":
+        """
+        Copies the given stimuli into memory, in the given order.
+
+        Args:
+            indices: The stimulus indices.
+
+        Returns:
+            TokenizedCorpus: The stimuli, indexed from 0.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        starts = self.offsets[indices]
+        lengths = self.offsets[indices + 1] - starts
+
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # Position of each token in `ids`
+        positions = np.repeat(starts - offsets[:-1], lengths) \
+            + np.arange(offsets[-1])
+
+        return TokenizedCorpus(
+            np.array(self.ids[positions]), offsets,
+            np.array(self.prefix_lengths[indices])
+            )
+
+    @classmethod
+    def concatenate(cls, parts: list) -> "TokenizedCorpus":
+        """
+        Joins consecutive parts of a corpus tokenized separately.
+
+        Args:
+            parts (list): The tokenized parts, in corpus order.
+
+        Returns:
+            TokenizedCorpus: The tokenized corpus.
+        """
+        if not parts:
+            return cls(
+                np.zeros(0, dtype=np.int32), np.zeros(1, dtype=np.int64),
+                np.zeros(0, dtype=np.int32)
+                )
+
+        starts = np.cumsum([0] + [part.offsets[-1] for part in parts[:-1]])
+        offsets = np.concatenate(
+            [parts[0].offsets[:1]]
+            + [part.offsets[1:] + start for part, start in zip(parts, starts)]
+            )
+
+        return cls(
+            np.concatenate([part.ids for part in parts]), offsets,
+            np.concatenate([part.prefix_lengths for part in parts])
+            )
+
+    def save(self, directory: str) -> None:
+        """
+        Saves the arrays to a directory, replacing it atomically.
+
+        Args:
+            directory (str): The target directory.
+        """
+        tmp_directory = f"{directory}.tmp-{os.getpid()}"
+        os.makedirs(tmp_directory, exist_ok=True)
+        for name in self.FILES:
+            np.save(os.path.join(tmp_directory, f"{name}.npy"), getattr(self, name))
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.replace(tmp_directory, directory)
+
+    @classmethod
+    def load(cls, directory: str) -> "TokenizedCorpus":
+        """
+        Memory-maps the arrays saved in a directory.
+
+        Args:
+            directory (str): The directory written by `save`.
+
+        Returns:
+            TokenizedCorpus: The tokenized corpus.
+        """
+        return cls(*[
+            np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in cls.FILES
+        ])
+
+
+def load_tokenized_corpus(
+    corpus_path: str, tokenizer, chunks,
+    cache_dir: str = os.path.join(".cache", "tokenized")
+) -> TokenizedCorpus:
+    """
+    Loads the tokenized corpus from the cache, tokenizing and caching it
+    first if the corpus file or the tokenizer changed.
+
+    Args:
+        corpus_path (str): The path to the corpus file, used as cache key.
+        tokenizer (transformers.PreTrainedTokenizerBase): The tokenizer.
+        chunks: Iterable of (prefixes, stimuli) pairs of consecutive parts of
+            the corpus, with the prefix of each stimulus and the stimulus
+            strings built from the corpus file, tokenized one part at a
+            time. Only consumed if the corpus is not in the cache yet.
+        cache_dir (str): Optional: cache directory, None to disable caching.
+
+    Returns:
+        TokenizedCorpus: The tokenized corpus.
+    """
+    def build() -> TokenizedCorpus:
+        return TokenizedCorpus.concatenate([
+            TokenizedCorpus.build(tokenizer, chunk_prefixes, chunk_stimuli)
+            for chunk_prefixes, chunk_stimuli in chunks
+        ])
+
+    if cache_dir is None:
+        return build()
+
+    key = hashlib.sha256(
+        f"{tokenizer_hash(tokenizer)}:{file_hash(corpus_path)}".encode("utf-8")
+        ).hexdigest()
+    directory = os.path.join(cache_dir, key)
+
+    if not os.path.isdir(directory):
+        build().save(directory)
+
+    return TokenizedCorpus.load(directory)
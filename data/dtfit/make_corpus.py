@@ -1,11 +1,17 @@
 """
 This module processes the input data from a CSV file and creates a corpus
 with cleaned and structured data for event plausibility analysis.
+
+Run from the repository root:
+    python -m data.dtfit.make_corpus
 """
 
+import os
 import pandas as pd
+from bin.corpus_builder import build_corpus, build_corpus_file
+
 
-df = pd.read_csv("clean_DTFit_human_dat.csv")
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 def create_corpus(corpus_csv: pd.DataFrame) -> pd.DataFrame:
@@ -13,37 +19,31 @@ def create_corpus(corpus_csv: pd.DataFrame) -> pd.DataFrame:
     Processes the DataFrame to create a structured corpus.
 
     Args:
-        df (pd.DataFrame): The input data frame containing the raw data.
+        corpus_csv (pd.DataFrame): The input data frame containing the raw
+            data.
 
     Returns:
         pd.DataFrame: A DataFrame containing the structured corpus.
     """
-    data = []
-    for item_num in sorted(corpus_csv.ItemNum.unique()):
-        rows = corpus_csv[corpus_csv.ItemNum == item_num]
-        good = rows[rows.Plausibility == "Plausible"].squeeze()
-        bad = rows[rows.Plausibility == "Implausible"].squeeze()
-
-        good_sentence = good.Sentence
-        bad_sentence = bad.Sentence
-        prefix = " ".join(good_sentence.split(" ")[:-1])
-        good_continuation = good_sentence.split(" ")[-1].replace(".", "")
-        bad_continuation = bad_sentence.split(" ")[-1].replace(".", "")
-
-        data.append(
-            {
-                "item_id": item_num,
-                "prefix": prefix,
-                "good_continuation": good_continuation,
-                "bad_continuation": bad_continuation,
-                "category": "event_plausibility",
-                "good_human_score": good.Score,
-                "bad_human_score": bad.Score,
-            }
-        )
-
-    return pd.DataFrame(data)
-
-
-clean_df = create_corpus(df)
-clean_df.to_csv("corpus.csv", index=False)
+    return build_corpus(corpus_csv, category="event_plausibility")
+
+
+def main() -> None:
+    """
+    Writes 'corpus.csv' from 'clean_DTFit_human_dat.csv' next to this file.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    build_corpus_file(
+        os.path.join(DATA_DIR, "clean_DTFit_human_dat.csv"),
+        os.path.join(DATA_DIR, "corpus.csv"),
+        category="event_plausibility"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,31 +2,41 @@
 Module for running evaluation scripts with specified datasets and model.
 
 This script takes command line arguments for one or more datasets, a model,
-and an optional revision, constructs the necessary paths, checks if the dataset
-directories exist, sets up the environment variables, and runs the experiment
-using the provided arguments.
+and an optional revision or sweep of revisions, constructs the necessary paths,
+checks if the dataset directories exist, and runs the experiment using the
+provided arguments in the same process.
+
+torch, transformers and minicons are only imported once there is something to
+score, so that '--help', argument errors, '--dry-run' and runs whose outputs
+all exist return within a fraction of a second.
 """
 
 import argparse
 import os
-import subprocess
 import sys
+from bin.io import BACKENDS, PRECISIONS
+from bin.sweep import parse_revisions, plan_outputs
 
 
-def main() -> None:
-    """
-    Run the evaluation script with specified datasets and model.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-    This function takes command line arguments for one or more datasets, model,
-    and optional revision. It constructs the necessary paths, checks if the
-    dataset directories exist, and sets up the environment variables. Finally,
-    it runs the experiment using the provided arguments.
+# Options passed on to 'bin/run_experiment.py' when they differ from their
+# default
+FORWARDED_OPTIONS = [
+    "batch_size", "max_tokens", "prefix_cache", "model_store", "offline",
+    "workers", "precision", "backend", "no_cache", "refresh", "resume",
+    "skip_existing", "token_logprobs", "pipeline", "early_stopping",
+    "early_stopping_min_items", "early_stopping_threshold",
+    "early_stopping_step", "profile", "profile_trace",
+]
 
-    Args:
-        None
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the parser of the command line arguments.
 
     Returns:
-        None
+        argparse.ArgumentParser: The parser.
     """
     parser = argparse.ArgumentParser(
         description="Run evaluation script with specified datasets and model."
@@ -44,36 +54,262 @@ def main() -> None:
         help="Huggingface model to be used in the format 'namespace/modelname'\
               e.g., 'EleutherAI/pythia-14m'.",
     )
-    parser.add_argument(
+    revision_group = parser.add_mutually_exclusive_group()
+    revision_group.add_argument(
         "--revision",
         type=str,
         default="main",
         help="Optional: model revision or specific checkpoint, default is\
               'main'. Check model-specific revision naming on Huggingface.",
     )
+    revision_group.add_argument(
+        "--revisions",
+        type=str,
+        default=None,
+        help="Optional: sweep over several revisions in one process, as a\
+              comma-separated list that may contain ranges, e.g.\
+              'step1000,step2000' or 'step1000..step5000:1000'.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Optional: number of stimuli scored per forward pass. Stimuli\
+              are sorted by token length to reduce padding. By default, each\
+              item is scored on its own.",
+    )
+    batching_group = parser.add_mutually_exclusive_group()
+    batching_group.add_argument(
+        "--max-tokens",
+        type=int,
+        default=None,
+        help="Optional: form batches by a budget of padded tokens instead of\
+              a number of stimuli, so that short items are scored in larger\
+              batches. Batches that run out of memory are split and retried,\
+              and the reduced budget is remembered per model, dtype and\
+              device in '.cache/token_budgets.json'.",
+    )
+    batching_group.add_argument(
+        "--prefix-cache",
+        action="store_true",
+        help="Optional: run each distinct prefix through the model once and\
+              score both continuations from its cached past_key_values.\
+              Batches by --batch-size, not with --max-tokens.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Optional: number of model replicas scoring in parallel worker\
+              processes, one per GPU if available, otherwise each on its\
+              share of the CPU cores. Results are identical to a single\
+              worker.",
+    )
+    parser.add_argument(
+        "--model-store",
+        type=str,
+        nargs="?",
+        const=os.path.join(".cache", "models"),
+        default=None,
+        help="Optional: load each revision from a local store of safetensors\
+              weights already converted to the target dtype, converting it\
+              on first use. Default store is '.cache/models'.",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Optional: only use revisions already in the model store,\
+              without network access.",
+    )
+    parser.add_argument(
+        "--precision",
+        type=str,
+        choices=list(PRECISIONS),
+        default="bf16",
+        help="Optional: precision of the model weights, default is 'bf16'.\
+              'int8-dynamic' quantizes the linear layers to int8, which is\
+              usually fastest on CPU. Results of other precisions than\
+              'bf16' get the precision as suffix of their file name.",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=BACKENDS,
+        default="minicons",
+        help="Optional: scoring backend, default is 'minicons'. 'target'\
+              only computes the log probabilities of the observed tokens,\
+              with a chunked logsumexp over the vocabulary, which needs much\
+              less memory per batch and allows larger batches.",
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=["json", "parquet"],
+        default="json",
+        help="Optional: output file format, default is 'json'. Parquet files\
+              can be read with 'analysis_tools.read_parquet_dataset'.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Optional: continue an interrupted run, skipping items already\
+              written to the '.partial.jsonl' sidecar of its output file.",
+    )
+    parser.add_argument(
+        "--skip-existing",
+        action="store_true",
+        help="Optional: skip revisions and datasets whose output file already\
+              exists. Nothing is loaded if all of them exist.",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Optional: instead of evaluating all revisions of '--revisions',\
+              evaluate a coarse grid of them and bisect only the intervals in\
+              which the accuracy of some dataset, relation or type changes\
+              significantly. Existing outputs are reused.",
+    )
+    parser.add_argument(
+        "--initial-points",
+        type=int,
+        default=5,
+        help="Optional: number of evenly spaced revisions evaluated first by\
+              '--adaptive', default is 5.",
+    )
+    parser.add_argument(
+        "--resolution",
+        type=int,
+        default=0,
+        help="Optional: stop refining intervals whose revisions are at most\
+              this many training steps apart. By default, intervals are\
+              refined until no revision of the sweep is left between them.",
+    )
+    parser.add_argument(
+        "--alpha",
+        type=float,
+        default=0.05,
+        help="Optional: significance level of the McNemar test between\
+              neighbouring revisions, default is 0.05.",
+    )
+    parser.add_argument(
+        "--max-evaluations",
+        type=int,
+        default=None,
+        help="Optional: maximum number of revisions '--adaptive' evaluates.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Optional: only list the planned runs and their output files,\
+              without loading any model.",
+    )
+    parser.add_argument(
+        "--token-logprobs",
+        action="store_true",
+        help="Optional: also store the per-token log probabilities of each\
+              stimulus, so that other reductions than the mean can be\
+              computed with 'analysis_tools.apply_token_reduction'. Bypasses\
+              the score cache.",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Optional: read and tokenize the next chunk of items and write\
+              the results of the previous one in background threads while\
+              the current chunk is scored. Queue depths are stored in the\
+              'pipeline' entry of the output metadata.",
+    )
+    parser.add_argument(
+        "--early-stopping",
+        type=float,
+        nargs="?",
+        const=0.1,
+        default=None,
+        help="Optional: score items in a random order, seeded with SEED, and\
+              stop a dataset once the Wilson confidence interval of the\
+              accuracy of every relation and type is at most this wide,\
+              default width is 0.1. The numbers of scored and of all items\
+              are stored as 'n_scored' and 'n_total' in the metadata.",
+    )
+    parser.add_argument(
+        "--early-stopping-threshold",
+        type=float,
+        default=None,
+        help="Optional: with --early-stopping, also stop groups whose\
+              interval lies entirely above or below this accuracy, e.g. 0.5.",
+    )
+    parser.add_argument(
+        "--early-stopping-min-items",
+        type=int,
+        default=30,
+        help="Optional: with --early-stopping, the number of items each\
+              group needs before it may stop, default is 30.",
+    )
+    parser.add_argument(
+        "--early-stopping-step",
+        type=int,
+        default=64,
+        help="Optional: with --early-stopping, the number of items scored\
+              between two checks of the stopping rule, default is 64.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Optional: store per-stage timings, tokens, padding ratio, peak\
+              memory and model load time in the 'profile' entry of the\
+              output metadata.",
+    )
+    parser.add_argument(
+        "--profile-trace",
+        type=str,
+        choices=["stages", "torch"],
+        default=None,
+        help="Optional: also write a Chrome trace next to each output file,\
+              of the stages or of the torch profiler.",
+    )
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Optional: do not read or write the on-disk score cache in\
+              '.cache/scores.sqlite'.",
+    )
+    cache_group.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Optional: recompute all scores and overwrite them in the cache.",
+    )
 
-    args = parser.parse_args()
+    return parser
 
-    datasets = args.dataset
-    model = args.model
-    revision = args.revision
 
-    if "/" in model:
-        save_name = model.split("/")[-1]
-    else:
-        print("Error: MODEL should be in the format 'namespace/modelname'.")
-        sys.exit(1)
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """
+    Parses the command line arguments.
 
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    env = os.environ.copy()
-    env["PYTHONPATH"] = script_dir
+    Args:
+        argv (list): Optional: arguments to parse, defaults to sys.argv.
 
-    python_script = os.path.join(script_dir, "bin", "run_experiment.py")
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    return build_parser().parse_args(argv)
 
-    # Verify dataset existence before running the experiment
-    valid_datasets = []
+
+def valid_datasets(datasets: list) -> list:
+    """
+    Returns the datasets with a directory in the 'data' folder, warning about
+    the others.
+
+    Args:
+        datasets (list): The dataset names.
+
+    Returns:
+        list: The datasets that exist.
+    """
+    valid = []
     for dataset in datasets:
-        dataset_dir = os.path.join(script_dir, "data", dataset)
+        dataset_dir = os.path.join(SCRIPT_DIR, "data", dataset)
 
         if not os.path.isdir(dataset_dir):
             print(
@@ -81,28 +317,192 @@ def main() -> None:
                   Skipping this dataset."
             )
         else:
-            valid_datasets.append(dataset)
+            valid.append(dataset)
+
+    return valid
+
+
+def plan_run(args: argparse.Namespace) -> dict:
+    """
+    Checks the arguments and lists the output files of the run. Exits on
+    invalid arguments. With '--adaptive', only the initial grid is planned
+    and existing outputs are always skipped.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        dict: The 'revisions' of the sweep, the 'datasets' that exist, the
+        output 'template', the 'planned' revisions, and all 'outputs' and
+        the 'pending' ones, see `sweep.plan_outputs`.
+    """
+    try:
+        revisions = parse_revisions(args.revisions or args.revision)
+    except ValueError as error:
+        print(f"Error: {error}")
+        sys.exit(1)
 
-            # Create results directory if it doesn't exist
-            result_dir = os.path.join(script_dir, "results", dataset)
-            os.makedirs(result_dir, exist_ok=True)
+    if args.adaptive and len(revisions) < 2:
+        print("Error: --adaptive needs at least two revisions in --revisions.")
+        sys.exit(1)
 
-    if not valid_datasets:
+    if "/" not in args.model:
+        print("Error: MODEL should be in the format 'namespace/modelname'.")
+        sys.exit(1)
+
+    # Verify dataset existence before running the experiment
+    datasets = valid_datasets(args.dataset)
+    if not datasets:
         print("Error: No valid dataset directories found. Exiting.")
         sys.exit(1)
 
-    # Output paths with placeholders for dataset names
-    output_template = os.path.join(
-        "results", "{dataset}", f"{save_name}_{revision}.json"
+    # Output paths with placeholders for dataset names and revisions
+    suffix = "" if args.precision == "bf16" else f"_{args.precision}"
+    template = os.path.join(
+        "results", "{dataset}",
+        f"{args.model.split('/')[-1]}_{{revision}}{suffix}.{args.format}"
         )
 
-    command = ["python", python_script, model, revision, \
-               *valid_datasets, output_template]
+    planned = revisions
+    if args.adaptive:
+        # pylint: disable-next=import-outside-toplevel
+        from bin.adaptive_search import initial_grid
+
+        # Only the coarse grid is known in advance; existing outputs are reused
+        args.skip_existing = True
+        planned = initial_grid(revisions, args.initial_points)
+
+    outputs = plan_outputs(args.model, planned, datasets, template)
+    return {
+        "revisions": revisions,
+        "datasets": datasets,
+        "template": template,
+        "planned": planned,
+        "outputs": outputs,
+        "pending": [
+            output for output in outputs
+            if not (args.skip_existing and output["exists"])
+        ],
+    }
+
+
+def print_plan(args: argparse.Namespace, plan: dict) -> None:
+    """
+    Lists the planned output files and whether they are written, for
+    '--dry-run'.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+        plan (dict): The plan, see `plan_run`.
+    """
+    for output in plan["outputs"]:
+        if output not in plan["pending"]:
+            status = "exists, skipped"
+        elif output["exists"]:
+            status = "exists, overwritten"
+        else:
+            status = "planned"
+        print(f"{args.model}@{output['revision']} on {output['dataset']}: "
+              f"{output['path']} ({status})")
+    print(f"{len(plan['pending'])} of {len(plan['outputs'])} outputs to write.")
+    if args.adaptive:
+        print(f"The initial grid of {len(plan['planned'])} of "
+              f"{len(plan['revisions'])} revisions is refined where the "
+              "accuracy changes.")
+
 
-    subprocess.run(command, env=env, check=True)
+def forwarded_options(args: argparse.Namespace) -> list:
+    """
+    Builds the options of `FORWARDED_OPTIONS` passed on to
+    'bin/run_experiment.py', leaving out those with their default value.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        list: The command line options.
+    """
+    parser = build_parser()
+    command = []
+    for dest in FORWARDED_OPTIONS:
+        value = getattr(args, dest)
+        if value == parser.get_default(dest):
+            continue
+        flag = f"--{dest.replace('_', '-')}"
+        command += [flag] if value is True else [flag, str(value)]
+
+    return command
+
+
+def run(args: argparse.Namespace, plan: dict) -> None:
+    """
+    Runs the experiments of a plan, or the adaptive search over its
+    revisions, in the same process.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+        plan (dict): The plan, see `plan_run`.
+    """
+    for dataset in plan["datasets"]:
+        # Create results directory if it doesn't exist
+        result_dir = os.path.join(SCRIPT_DIR, "results", dataset)
+        os.makedirs(result_dir, exist_ok=True)
+
+    options = [*plan["datasets"], plan["template"], *forwarded_options(args)]
+
+    # Imported only now, as it loads torch, transformers and minicons
+    # pylint: disable-next=import-outside-toplevel
+    from bin.run_experiment import main as run_experiment
+
+    if args.adaptive:
+        # pylint: disable-next=import-outside-toplevel
+        from bin.adaptive_search import SearchSettings, adaptive_search
+
+        adaptive_search(
+            args.model, plan["revisions"], plan["datasets"],
+            lambda batch: run_experiment(
+                [args.model, ",".join(batch), *options]
+                ),
+            SearchSettings(
+                plan["template"], initial_points=args.initial_points,
+                resolution=args.resolution, alpha=args.alpha,
+                max_evaluations=args.max_evaluations
+            )
+        )
+    else:
+        run_experiment([args.model, args.revisions or args.revision, *options])
 
     print("All experiments completed successfully.")
 
 
+def main(argv: list = None) -> None:
+    """
+    Run the evaluation script with specified datasets and model.
+
+    This function takes command line arguments for one or more datasets, model,
+    and optional revision. It constructs the necessary paths, checks if the
+    dataset directories exist, and lists or skips the planned outputs if asked
+    to. Finally, it runs the experiment using the provided arguments.
+
+    Args:
+        argv (list): Optional: arguments to parse, defaults to sys.argv.
+
+    Returns:
+        None
+    """
+    args = parse_args(argv)
+    plan = plan_run(args)
+
+    if args.dry_run:
+        print_plan(args, plan)
+        return
+
+    if not plan["pending"] and not args.adaptive:
+        print("All outputs already exist. Nothing to do.")
+        return
+
+    run(args, plan)
+
+
 if __name__ == "__main__":
     main()
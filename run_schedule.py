@@ -0,0 +1,87 @@
+"""
+Module for running a sweep of evaluation jobs from a spec file.
+
+This script takes a JSON or YAML sweep spec with models, revisions and
+datasets, and runs every (model, revision) job that has not been evaluated
+yet, packing the jobs onto the available GPUs or CPU slots. Completed jobs
+and their timings are recorded in a manifest.
+"""
+
+import argparse
+import os
+import sys
+from bin.scheduler import load_spec, run_schedule
+
+
+def main() -> None:
+    """
+    Run all jobs of a sweep spec.
+
+    This function takes the path to a sweep spec and optional settings for
+    the manifest and the scheduling, checks that the datasets exist, and
+    runs the jobs. It exits with an error code if any job failed.
+
+    Args:
+        None
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(
+        description="Run a sweep of evaluation jobs from a spec file."
+    )
+    parser.add_argument(
+        "spec",
+        type=str,
+        help="Sweep spec in JSON or YAML with 'models', 'revisions' and\
+              'datasets', and optionally 'format', 'options' (flags of\
+              'bin/run_experiment.py'), 'dtype', 'cpu_slots' and 'retries'.",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="Optional: path to the manifest of the sweep, default is\
+              'results/manifest.json'.",
+    )
+    parser.add_argument(
+        "--cpu-slots",
+        type=int,
+        default=None,
+        help="Optional: number of jobs run on the CPU at once when no GPU is\
+              available, overrides 'cpu_slots' in the spec.",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=None,
+        help="Optional: number of times a failed job is retried, overrides\
+              'retries' in the spec.",
+    )
+
+    args = parser.parse_args()
+
+    spec = load_spec(args.spec)
+    if args.cpu_slots is not None:
+        spec["cpu_slots"] = args.cpu_slots
+    if args.retries is not None:
+        spec["retries"] = args.retries
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    for dataset in spec["datasets"]:
+        if not os.path.isdir(os.path.join(script_dir, "data", dataset)):
+            print(f"Error: Dataset directory for '{dataset}' does not exist.")
+            sys.exit(1)
+
+    entries = run_schedule(spec, root=script_dir, manifest=args.manifest)
+
+    failed = [entry for entry in entries if entry["status"] == "failed"]
+    if failed:
+        print(f"Error: {len(failed)} jobs failed, see the manifest for details.")
+        sys.exit(1)
+
+    print("All jobs completed successfully.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Shared fixtures for the test suite.
+
+Provides a tiny, randomly initialized GPT-NeoX model with a word-level
+tokenizer saved to a temporary directory, so that scoring can be tested
+offline, and a small minimal pair dataset in the layout of the 'data' folder.
+"""
+
+import pandas as pd
+import pytest
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+from transformers import (
+    GPTNeoXConfig, GPTNeoXForCausalLM, PreTrainedTokenizerFast
+)
+from minicons import scorer
+
+
+CORPUS = pd.DataFrame({
+    "item_id": [1, 2, 3, 4, 5, 6],
+    "prefix": [
+        "the actor won the", "the anchorman told the", "the animal found the",
+        "the actor won the", "a very old animal slowly found the", "the",
+    ],
+    "good_continuation": ["award", "news", "food", "prize", "food", "news"],
+    "bad_continuation": [
+        "battle", "parable", "map", "old map", "map", "the actor"
+    ],
+    "category": ["plausibility"] * 6,
+})
+
+# Size of the tiny GPT-NeoX model
+TINY_CONFIG = {
+    "hidden_size": 32, "num_hidden_layers": 2, "num_attention_heads": 4,
+    "intermediate_size": 64, "max_position_embeddings": 64,
+}
+
+
+@pytest.fixture(scope="session", name="tiny_model_dir")
+def fixture_tiny_model_dir(tmp_path_factory):
+    """
+    Saves a tiny GPT-NeoX model and its tokenizer to a temporary directory.
+
+    Args:
+        tmp_path_factory: Pytest factory for session-scoped temporary paths.
+
+    Returns:
+        str: The path to the saved model, loadable like a Huggingface model.
+    """
+    words = sorted({
+        word for column in ["prefix", "good_continuation", "bad_continuation"]
+        for text in CORPUS[column] for word in text.split()
+    })
+    vocab = {"<|endoftext|>": 0}
+    vocab.update({word: i + 1 for i, word in enumerate(words)})
+
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="<|endoftext|>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.decoder = decoders.WordPiece()
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, eos_token="<|endoftext|>",
+        bos_token="<|endoftext|>", unk_token="<|endoftext|>"
+    )
+
+    torch.manual_seed(0)
+    model = GPTNeoXForCausalLM(GPTNeoXConfig.from_dict(
+        {**TINY_CONFIG, "vocab_size": len(vocab)}
+    ))
+
+    model_dir = tmp_path_factory.mktemp("tiny-model")
+    model.save_pretrained(model_dir)
+    tokenizer.save_pretrained(model_dir)
+
+    return str(model_dir)
+
+
+@pytest.fixture
+def tiny_scorer(tiny_model_dir):
+    """
+    Loads the tiny model as a minicons scorer in full precision on CPU.
+
+    Args:
+        tiny_model_dir (str): Path to the saved tiny model.
+
+    Returns:
+        scorer.IncrementalLMScorer: The scorer.
+    """
+    return scorer.IncrementalLMScorer(tiny_model_dir, device="cpu")
+
+
+@pytest.fixture
+def tiny_dataset(tmp_path, monkeypatch):
+    """
+    Creates a 'data/tiny/corpus.csv' dataset in a temporary working directory.
+
+    Args:
+        tmp_path (pathlib.Path): Temporary directory provided by pytest.
+        monkeypatch: Pytest fixture used to change the working directory.
+
+    Returns:
+        str: The dataset name.
+    """
+    dataset_dir = tmp_path / "data" / "tiny"
+    dataset_dir.mkdir(parents=True)
+    CORPUS.to_csv(dataset_dir / "corpus.csv", index=False)
+    monkeypatch.chdir(tmp_path)
+
+    return "tiny"
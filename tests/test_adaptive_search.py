@@ -0,0 +1,161 @@
+"""
+Test suite for the adaptive search module.
+
+This module contains tests for refining a coarse grid of revisions where the
+accuracy changes, on synthetic outputs and with a tiny model.
+"""
+
+import json
+from unittest.mock import patch
+from bin import adaptive_search as search, significance
+from bin.adaptive_search import (
+    SearchSettings, adaptive_search, initial_grid, training_step
+)
+from bin.run_experiment import SweepOptions, run_sweep
+from bin.scoring import ScoringOptions
+
+
+REVISIONS = [f"step{step}" for step in range(0, 33000, 1000)]
+
+
+def write_outputs(template: str, revisions: list) -> None:
+    """
+    Writes synthetic outputs whose accuracy on relation 'a' jumps from 0.1 to
+    0.9 at step 21000, while relation 'b' stays the same.
+
+    Args:
+        template (str): Template for output file paths.
+        revisions (list): The revisions to write.
+    """
+    for revision in revisions:
+        learned = training_step(revision) >= 21000
+        results = [
+            {
+                "item_id": i,
+                "relation": "a" if i < 100 else "b",
+                "logprob_of_good_continuation":
+                    float(learned == (i % 10 != 0)) if i < 100 else 1.0,
+                "logprob_of_bad_continuation": 0.5,
+            }
+            for i in range(150)
+        ]
+        with open(template.format(dataset="synthetic", revision=revision),
+                  "w", encoding="utf-8") as file:
+            json.dump({"meta": {"revision": revision}, "results": results}, file)
+
+
+def test_initial_grid():
+    """
+    Test that the grid is evenly spaced and includes both ends.
+    """
+    assert initial_grid(REVISIONS, 5) == [
+        "step0", "step8000", "step16000", "step24000", "step32000"
+    ]
+    assert initial_grid(REVISIONS[:3], 5) == REVISIONS[:3]
+    assert training_step("step1000-tokens4B") == 1000
+    assert training_step("main") is None
+
+
+def test_adaptive_search_finds_change(tmp_path):
+    """
+    Test that only the interval with the change is bisected down to
+    neighbouring revisions, and that existing outputs are reused.
+    """
+    template = str(tmp_path / "{dataset}_{revision}.json")
+    write_outputs(template, ["step0"])
+    calls = []
+
+    def evaluate(revisions):
+        calls.append(revisions)
+        write_outputs(template, revisions)
+
+    tested = []
+
+    def compare_revisions(df, **kwargs):
+        tested.append(tuple(sorted(df.revision.unique(), key=training_step)))
+        return significance.compare_revisions(df, **kwargs)
+
+    with patch.object(search, "compare_revisions", compare_revisions):
+        report = adaptive_search(
+            "model", REVISIONS[::-1], ["synthetic"], evaluate,
+            SearchSettings(template)
+            )
+
+    assert calls == [
+        ["step8000", "step16000", "step24000", "step32000"],
+        ["step20000"], ["step22000"], ["step21000"],
+    ]
+    assert report["reused"] == ["step0"]
+    assert report["saved"] == len(REVISIONS) - 8
+    changes = report["changes"]
+    assert changes[["revision_a", "revision_b", "relation"]].values.tolist() \
+        == [["step20000", "step21000", "a"]]
+    assert changes.accuracy_a[0] == 0.1 and changes.accuracy_b[0] == 0.9
+    # Each pair of neighbouring revisions is tested once
+    assert len(tested) == len(set(tested)) == 4 + 3 * 2
+
+    # A second search evaluates nothing
+    calls.clear()
+    report = adaptive_search(
+        "model", REVISIONS, ["synthetic"], evaluate, SearchSettings(template)
+        )
+    assert not calls
+    assert report["rounds"] == 0
+
+
+def test_adaptive_search_resolution(tmp_path):
+    """
+    Test that intervals at most `resolution` steps apart are not refined.
+    """
+    template = str(tmp_path / "{dataset}_{revision}.json")
+
+    report = adaptive_search(
+        "model", REVISIONS, ["synthetic"],
+        lambda revisions: write_outputs(template, revisions),
+        SearchSettings(template, resolution=4000)
+    )
+
+    assert report["evaluated"] == [
+        "step0", "step8000", "step16000", "step20000", "step24000",
+        "step32000"
+    ]
+    assert report["changes"][["revision_a", "revision_b"]].values.tolist() \
+        == [["step20000", "step24000"]]
+
+
+def test_adaptive_search_max_evaluations(tmp_path):
+    """
+    Test that the search stops after the given number of evaluations.
+    """
+    template = str(tmp_path / "{dataset}_{revision}.json")
+
+    report = adaptive_search(
+        "model", REVISIONS, ["synthetic"],
+        lambda revisions: write_outputs(template, revisions),
+        SearchSettings(template, max_evaluations=6)
+    )
+
+    assert len(report["evaluated"]) == 6
+    assert report["changes"][["revision_a", "revision_b"]].values.tolist() \
+        == [["step20000", "step24000"]]
+
+
+def test_adaptive_search_run_sweep(tiny_model_dir, tiny_dataset, tmp_path):
+    """
+    Test that a search evaluating with `run_sweep` stops after the initial
+    grid when the accuracy does not change.
+    """
+    template = str(tmp_path / "{dataset}_{revision}.json")
+
+    report = adaptive_search(
+        tiny_model_dir, ["step1", "step2", "step3"], [tiny_dataset],
+        lambda revisions: run_sweep(
+            tiny_model_dir, revisions, [tiny_dataset], template,
+            SweepOptions(scoring=ScoringOptions(batch_size=4))
+            ),
+        SearchSettings(template, initial_points=2)
+    )
+
+    assert report["evaluated"] == ["step1", "step3"]
+    assert report["saved"] == 1
+    assert report["changes"].empty
@@ -7,11 +7,20 @@ and plot_accuracy.
 """
 
 import json
+import os
+import warnings
 import pytest
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 from bin.analysis_tools import (
-    read_data_from_folder, compute_accuracy, plot_bar_charts
+    read_data_from_folder, compute_accuracy, plot_bar_charts,
+    read_parquet_dataset, read_results, aggregate_metrics,
+    reduce_token_logprobs, apply_token_reduction, parse_result_file_name,
+    ResultFilter
 )
+from bin.result_writer import ResultWriter
+from bin.significance import Bootstrap
 
 
 @pytest.fixture
@@ -138,3 +147,246 @@ def test_plot_bar_charts_invalid_order(mocker):
 
     with pytest.raises(ValueError):
         plot_bar_charts(df, model_order)
+
+
+def test_read_parquet_dataset(tmp_path):
+    """
+    Tests the read_parquet_dataset function for column projection and
+    filtering on model and revision.
+    """
+    for model, revision in [("ns/m1", "main"), ("ns/m1", "step1"),
+                            ("ns/m2", "main")]:
+        writer = ResultWriter(str(tmp_path / f"{model[3:]}_{revision}.parquet"))
+        writer.write([
+            {"item_id": 1, "logprob_of_good_continuation": -1.0},
+            {"item_id": 2, "logprob_of_good_continuation": -2.0},
+        ])
+        writer.finalize({"model": model, "revision": revision}, [1, 2])
+
+    df = read_parquet_dataset(str(tmp_path))
+    assert df.shape[0] == 6
+    assert set(df["model"]) == {"m1", "m2"}
+
+    df_filtered = read_parquet_dataset(
+        str(tmp_path), columns=["item_id", "model"], models=["ns/m1"],
+        final_chkpt_only=True
+    )
+    assert list(df_filtered.columns) == ["item_id", "model"]
+    assert df_filtered.shape[0] == 2
+    assert isinstance(df_filtered["model"].dtype, pd.CategoricalDtype)
+
+
+def write_result_files(folder) -> None:
+    """
+    Writes JSON result files for two models and two revisions.
+
+    Args:
+        folder (pathlib.Path): The folder to write the files to.
+    """
+    for model, revision in [("ns/m1", "main"), ("ns/m1", "step1"),
+                            ("ns/m2", "main")]:
+        data = {
+            "meta": {"model": model, "revision": revision, "dataset": "d",
+                     "profile": {"wall_time": 1.0}, "warnings": ["w"]},
+            "results": [
+                {"item_id": 1, "relation": "X",
+                 "logprob_of_good_continuation": -1.0,
+                 "logprob_of_bad_continuation": -2.0},
+                {"item_id": 2, "relation": "Y",
+                 "logprob_of_good_continuation": -3.0,
+                 "logprob_of_bad_continuation": -2.0},
+            ],
+        }
+        file_name = f"{model.rsplit('/', maxsplit=1)[-1]}_{revision}.json"
+        with open(folder / file_name, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+
+
+def test_read_results(tmp_path):
+    """
+    Tests that read_results returns the same data as read_data_from_folder,
+    with categorical metadata columns without list and dict entries, and
+    filters files by name.
+    """
+    write_result_files(tmp_path)
+
+    df = read_results(str(tmp_path), max_workers=2)
+    expected = read_data_from_folder(str(tmp_path))
+    sort_keys = ["model", "revision", "item_id"]
+    pd.testing.assert_frame_equal(
+        df.astype({"model": str, "revision": str, "dataset": str,
+                   "relation": str}).sort_values(sort_keys)
+          .reset_index(drop=True),
+        expected.sort_values(sort_keys).reset_index(drop=True),
+        check_like=True, check_dtype=False
+    )
+    assert isinstance(df["revision"].dtype, pd.CategoricalDtype)
+    assert not {"profile", "warnings"} & set(df.columns)
+
+    df_filtered = read_results(
+        str(tmp_path), ResultFilter(models=["m1"], final_chkpt_only=True)
+    )
+    assert df_filtered.shape[0] == 2
+    assert set(df_filtered["model"]) == {"m1"}
+    assert set(df_filtered["revision"]) == {"main"}
+
+    df_datasets = read_results(str(tmp_path.parent), datasets=[tmp_path.name])
+    assert df_datasets.shape[0] == 6
+
+
+def test_parse_result_file_name():
+    """
+    Tests that the precision suffix is not taken for the revision, so that
+    results of other precisions than bf16 pass the name filters.
+    """
+    assert parse_result_file_name("pythia-14m_main.json") \
+        == ("pythia-14m", "main")
+    assert parse_result_file_name("pythia-14m_step1000_fp32.json") \
+        == ("pythia-14m", "step1000")
+    assert parse_result_file_name("pythia-14m_main_int8-dynamic.json") \
+        == ("pythia-14m", "main")
+    assert parse_result_file_name("results.json") == (None, None)
+
+    keep = ResultFilter(models=["pythia-14m"], final_chkpt_only=True)
+    assert keep.keeps_file("pythia-14m_main_fp32.json")
+    assert not keep.keeps_file("pythia-14m_step1000_fp32.json")
+
+
+def test_read_results_index(tmp_path):
+    """
+    Tests that unchanged files are read from the index instead of being
+    parsed again, and that changed files are parsed again.
+    """
+    write_result_files(tmp_path)
+    read_results(str(tmp_path), max_workers=1)
+
+    # Same size and modification time: the stale rows of the index are read
+    path = tmp_path / "m2_main.json"
+    stat = os.stat(path)
+    text = path.read_text(encoding="utf-8")
+    path.write_text(text.replace("-1.0", "-9.0"), encoding="utf-8")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    df = read_results(str(tmp_path), max_workers=1)
+    assert df.shape[0] == 6
+    assert -9.0 not in df.logprob_of_good_continuation.values
+
+    with open(path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    data["results"] = data["results"][:1]
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+
+    df = read_results(str(tmp_path), max_workers=1)
+    assert df.shape[0] == 5
+    assert -9.0 in df.logprob_of_good_continuation.values
+
+
+def test_aggregate_metrics():
+    """
+    Tests aggregate_metrics against pandas reference computations and checks
+    that the input DataFrame is not modified.
+    """
+    rng = np.random.default_rng(0)
+    n_items = 50
+    df = pd.DataFrame({
+        "model": ["m1"] * (2 * n_items),
+        "revision": ["step1"] * n_items + ["main"] * n_items,
+        "relation": "X",
+        "item_id": list(range(n_items)) * 2,
+        "logprob_of_good_continuation": rng.normal(size=2 * n_items),
+        "logprob_of_bad_continuation": rng.normal(size=2 * n_items),
+        "good_human_score": rng.normal(size=2 * n_items),
+        "bad_human_score": rng.normal(size=2 * n_items),
+    })
+    original = df.copy()
+
+    result = aggregate_metrics(df, bootstrap=Bootstrap(n_boot=200))
+
+    pd.testing.assert_frame_equal(df, original)
+    assert list(result["revision"]) == ["main", "step1"]
+
+    margin = df["logprob_of_good_continuation"] \
+        - df["logprob_of_bad_continuation"]
+    human = df["good_human_score"] - df["bad_human_score"]
+    grouped = df.assign(margin=margin, human=human, correct=margin > 0) \
+        .groupby("revision")
+    np.testing.assert_allclose(
+        result["accuracy"], grouped["correct"].mean().to_numpy()
+    )
+    np.testing.assert_allclose(
+        result["mean_margin"], grouped["margin"].mean().to_numpy()
+    )
+    np.testing.assert_allclose(
+        result["human_correlation"],
+        grouped[["margin", "human"]].corr().xs("margin", level=1)["human"]
+        .to_numpy()
+    )
+    assert (result["accuracy_ci_low"] <= result["accuracy"]).all()
+    assert (result["accuracy"] <= result["accuracy_ci_high"]).all()
+
+    # With two revisions, an item is in agreement with the consensus in both
+    # revisions if their preferences match; otherwise ties count as correct.
+    correct = (margin > 0).to_numpy().reshape(2, n_items)
+    same = correct[0] == correct[1]
+    np.testing.assert_allclose(
+        result["agreement"],
+        [(same | correct[1]).mean(), (same | correct[0]).mean()]
+    )
+
+
+def test_aggregate_metrics_constant_human_scores():
+    """
+    Tests that groups without human scores or with constant ones get no
+    correlation, without RuntimeWarnings.
+    """
+    df = pd.DataFrame({
+        "model": "m1",
+        "revision": ["empty"] * 3 + ["constant"] * 3,
+        "item_id": [1, 2, 3] * 2,
+        "logprob_of_good_continuation": [-1.0, -2.0, -3.0] * 2,
+        "logprob_of_bad_continuation": -2.0,
+        "good_human_score": [np.nan] * 3 + [1.0] * 3,
+        "bad_human_score": 0.0,
+    })
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        result = aggregate_metrics(df, metrics=["human_correlation"])
+
+    assert result["human_correlation"].isna().all()
+
+
+def test_reduce_token_logprobs():
+    """
+    Test the token reductions on Python lists and Arrow list arrays, including
+    empty stimuli and stimuli without a valid prefix.
+    """
+    token_logprobs = [[-1.0, -2.0, -3.0], [], [-4.0, -5.0], [-6.0]]
+    prefix_tokens = [2, 1, -1, 1]
+    expected = {
+        "mean": [-2.0, np.nan, -4.5, -6.0],
+        "sum": [-6.0, 0.0, -9.0, -6.0],
+        "last": [-3.0, np.nan, -5.0, -6.0],
+        "continuation_mean": [-2.5, np.nan, np.nan, -6.0],
+        "continuation_sum": [-5.0, 0.0, np.nan, -6.0],
+    }
+
+    for values in [token_logprobs, pa.array(token_logprobs, pa.list_(pa.float32()))]:
+        for reduction, scores in expected.items():
+            np.testing.assert_allclose(
+                reduce_token_logprobs(values, prefix_tokens, reduction), scores
+                )
+
+    with pytest.raises(ValueError):
+        reduce_token_logprobs(token_logprobs, reduction="median")
+
+    df = pd.DataFrame({
+        "token_logprobs_of_good_continuation": token_logprobs[:2],
+        "token_logprobs_of_bad_continuation": token_logprobs[2:],
+        "prefix_tokens_of_good_continuation": prefix_tokens[:2],
+        "prefix_tokens_of_bad_continuation": prefix_tokens[2:],
+    })
+    reduced = apply_token_reduction(df, "sum")
+    assert reduced["logprob_of_good_continuation"].tolist() == [-6.0, 0.0]
+    assert reduced["logprob_of_bad_continuation"].tolist() == [-9.0, -6.0]
+    assert "logprob_of_good_continuation" not in df.columns
@@ -0,0 +1,47 @@
+"""
+Test suite for the benchmarks module.
+
+This module contains a smoke test of the benchmark suite on a very small
+synthetic corpus.
+"""
+
+import pytest
+from benchmarks.run_benchmarks import (
+    BenchmarkSettings, compare_reports, make_corpus, run_benchmarks
+)
+
+
+def test_make_corpus():
+    """
+    Test that synthetic items share prefixes of the requested length.
+    """
+    corpus = make_corpus(5, prefix_length=3, items_per_prefix=2)
+
+    assert corpus.item_id.tolist() == [1, 2, 3, 4, 5]
+    assert corpus.prefix.nunique() == 3
+    assert all(len(prefix.split()) == 3 for prefix in corpus.prefix)
+
+
+def test_run_benchmarks():
+    """
+    Test that a report holds throughput and memory for each architecture and
+    mode, and that two reports can be compared.
+    """
+    report = run_benchmarks(
+        ["gpt_neox", "gpt2"],
+        BenchmarkSettings(items=8, prefix_length=4, batch_size=4),
+        modes=["batched", "score_cache"]
+    )
+
+    results = report["results"]
+    assert [(res["architecture"], res["mode"]) for res in results] == [
+        ("gpt_neox", "batched"), ("gpt_neox", "score_cache"),
+        ("gpt2", "batched"), ("gpt2", "score_cache"),
+    ]
+    for res in results:
+        assert res["items_per_second"] > 0
+        assert res["tokens"] > res["items"]
+        assert res["peak_rss_mb"] > 0
+
+    comparison = compare_reports(report, report)
+    assert comparison.speedup.tolist() == pytest.approx([1.0] * 4)
@@ -0,0 +1,93 @@
+"""
+Test suite for the corpus module.
+
+This module contains tests for streaming corpora in chunks from CSV, JSONL
+and Parquet files, and for running experiments on them.
+"""
+
+import json
+import pandas as pd
+import pytest
+from bin.corpus import find_corpus, iter_corpus, read_corpus
+from bin.run_experiment import run_experiment
+from bin.scoring import ScoringOptions
+from tests.conftest import CORPUS
+
+
+def write_corpus(df: pd.DataFrame, path: str) -> None:
+    """
+    Writes a corpus in the format given by the file extension.
+
+    Args:
+        df (pd.DataFrame): The corpus.
+        path (str): The corpus file.
+    """
+    if path.endswith(".csv"):
+        df.to_csv(path, index=False)
+    elif path.endswith(".jsonl"):
+        df.to_json(path, orient="records", lines=True)
+    else:
+        df.to_parquet(path, index=False)
+
+
+@pytest.mark.parametrize("file_format", ["csv", "jsonl", "parquet"])
+def test_iter_corpus(tmp_path, file_format):
+    """
+    Test that all formats yield the same typed chunks, indexed by row
+    position, with the optional 'type' column and without extra columns.
+    """
+    df = CORPUS.assign(
+        type=["inter", "intra"] * 3, human_score=range(6),
+        bad_continuation=["battle", "NA", "map", "null", "map", "the actor"]
+        )
+    path = str(tmp_path / f"corpus.{file_format}")
+    write_corpus(df, path)
+
+    chunks = list(iter_corpus(path, chunk_size=4))
+
+    assert [len(chunk.index) for chunk in chunks] == [4, 2]
+    assert list(chunks[1].index) == [4, 5]
+    corpus = pd.concat(chunks)
+    assert list(corpus.columns) == [
+        "item_id", "prefix", "good_continuation", "bad_continuation",
+        "category", "type"
+    ]
+    pd.testing.assert_frame_equal(
+        corpus, df.drop(columns="human_score"), check_dtype=False
+        )
+
+
+def test_iter_corpus_missing_column(tmp_path):
+    """
+    Test that a corpus without a required column is rejected.
+    """
+    path = str(tmp_path / "corpus.jsonl")
+    write_corpus(CORPUS.drop(columns="category"), path)
+
+    with pytest.raises(ValueError, match="category"):
+        read_corpus(path)
+
+
+def test_run_experiment_streams_corpus(tiny_scorer, tiny_dataset, tmp_path):
+    """
+    Test that a Parquet corpus read in small chunks gives the same results as
+    the CSV corpus.
+    """
+    run_experiment(
+        tiny_scorer, tiny_dataset, {"model": "tiny"},
+        str(tmp_path / "csv.json"), ScoringOptions(batch_size=4)
+        )
+
+    (tmp_path / "data" / tiny_dataset / "corpus.csv").unlink()
+    write_corpus(CORPUS, str(tmp_path / "data" / tiny_dataset / "corpus.parquet"))
+    assert find_corpus(tiny_dataset).endswith("corpus.parquet")
+    run_experiment(
+        tiny_scorer, tiny_dataset, {"model": "tiny"},
+        str(tmp_path / "parquet.json"),
+        ScoringOptions(batch_size=4, chunk_size=4)
+        )
+
+    with open(tmp_path / "csv.json", "r", encoding="utf-8") as file:
+        expected = json.load(file)["results"]
+    with open(tmp_path / "parquet.json", "r", encoding="utf-8") as file:
+        assert json.load(file)["results"] == expected
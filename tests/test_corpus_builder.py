@@ -0,0 +1,110 @@
+"""
+Test suite for the corpus builder module.
+
+This module contains tests for pairing sentence-level source data into
+minimal pair corpora, in memory and streamed from files.
+"""
+
+import os
+import pandas as pd
+import pytest
+from bin.corpus import read_corpus
+from bin.corpus_builder import build_corpus, build_corpus_file
+
+
+DTFIT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "dtfit"
+)
+SOURCE = pd.DataFrame({
+    "ItemNum": [2, 1, 3, 1, 2, 3],
+    "Sentence": [
+        "The anchorman told the news.", "The actor won the battle.",
+        "NA", "The actor won the award.", "The anchorman told the parable.",
+        "null.",
+    ],
+    "Plausibility": [
+        "Plausible", "Implausible", "Implausible", "Plausible",
+        "Implausible", "Plausible",
+    ],
+    "Score": [6.75, 2.6, 1, 5.8, 3, 2],
+})
+
+
+def test_build_corpus_matches_dtfit(tmp_path):
+    """
+    Test that the dtfit corpus is rebuilt exactly, in memory and from the
+    source file.
+    """
+    expected = pd.read_csv(os.path.join(DTFIT_DIR, "corpus.csv"))
+    source = pd.read_csv(os.path.join(DTFIT_DIR, "clean_DTFit_human_dat.csv"))
+
+    corpus = build_corpus(source, "event_plausibility")
+    pd.testing.assert_frame_equal(corpus, expected, check_dtype=False)
+
+    path = str(tmp_path / "corpus.csv")
+    assert build_corpus_file(
+        os.path.join(DTFIT_DIR, "clean_DTFit_human_dat.csv"), path,
+        "event_plausibility", chunk_size=7
+    ) == len(expected.index)
+    with open(path, "r", encoding="utf-8") as file, \
+            open(os.path.join(DTFIT_DIR, "corpus.csv"), "r",
+                 encoding="utf-8") as expected_file:
+        assert file.read() == expected_file.read()
+
+
+@pytest.mark.parametrize("file_format", ["csv", "parquet"])
+def test_build_corpus_file_chunks(tmp_path, file_format):
+    """
+    Test that items split across chunks are paired, and that the corpus is
+    read back by `read_corpus` like the one built in memory.
+    """
+    source_path = str(tmp_path / "source.jsonl")
+    SOURCE.to_json(source_path, orient="records", lines=True)
+    path = str(tmp_path / f"corpus.{file_format}")
+
+    build_corpus_file(source_path, path, "test", chunk_size=2)
+
+    corpus = read_corpus(path).sort_values("item_id", ignore_index=True)
+    expected = build_corpus(SOURCE, "test")
+    assert expected.bad_continuation.tolist() == ["battle", "parable", "NA"]
+    assert expected.prefix.tolist()[2] == ""
+    pd.testing.assert_frame_equal(
+        corpus, expected.drop(columns=["good_human_score", "bad_human_score"]),
+        check_dtype=False
+        )
+
+
+@pytest.mark.parametrize("source, message", [
+    (SOURCE.drop(columns="Score"), "missing the columns Score"),
+    (SOURCE.replace("Implausible", "Bad"), "Unknown labels Bad"),
+    (SOURCE.assign(ItemNum=[2, 1, 3, 1, 2, 1]), "Duplicate item_ids"),
+    (SOURCE.iloc[:-1], "Items 3 lack"),
+])
+def test_build_corpus_validation(tmp_path, source, message):
+    """
+    Test that missing columns, unknown labels, duplicate items and items
+    without a pair are rejected, without leaving a corpus file behind.
+    """
+    with pytest.raises(ValueError, match=message):
+        build_corpus(source, "test")
+
+    source_path = str(tmp_path / "source.csv")
+    source.to_csv(source_path, index=False)
+    path = str(tmp_path / "corpus.parquet")
+    with pytest.raises(ValueError, match=message):
+        build_corpus_file(source_path, path, "test", chunk_size=2)
+    assert os.listdir(tmp_path) == ["source.csv"]
+
+
+def test_build_corpus_file_repeated_item(tmp_path):
+    """
+    Test that an item reappearing after it was written is rejected.
+    """
+    source = pd.concat([SOURCE.sort_values("ItemNum"), SOURCE.iloc[[1]]])
+    source_path = str(tmp_path / "source.csv")
+    source.to_csv(source_path, index=False)
+
+    with pytest.raises(ValueError, match="Duplicate item_ids .*1"):
+        build_corpus_file(
+            source_path, str(tmp_path / "corpus.csv"), "test", chunk_size=2
+            )
@@ -0,0 +1,205 @@
+"""
+Test suite for the early stopping module.
+
+This module contains tests for the Wilson intervals, the stopping rule and
+early-stopped experiments, including resumed ones.
+"""
+
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from bin.analysis_tools import aggregate_metrics
+from bin.corpus import read_corpus
+from bin.early_stopping import EarlyStopping, wilson_interval
+from bin.run_experiment import run_experiment
+from bin.scoring import ScoringOptions
+from tests.conftest import CORPUS
+
+
+def write_large_corpus(dataset_dir) -> pd.DataFrame:
+    """
+    Writes 240 items to 'corpus.csv', in two relations.
+
+    Args:
+        dataset_dir (pathlib.Path): The dataset directory.
+
+    Returns:
+        pd.DataFrame: The corpus.
+    """
+    corpus = pd.concat([
+        CORPUS.assign(category="a" if i % 2 else "b") for i in range(40)
+    ], ignore_index=True)
+    corpus["item_id"] = np.arange(1, len(corpus.index) + 1)
+    corpus.to_csv(dataset_dir / "corpus.csv", index=False)
+
+    return corpus
+
+
+def test_wilson_interval():
+    """
+    Test the interval against known values, and for groups without items.
+    """
+    low, high = wilson_interval([5, 0, 0], [10, 10, 0])
+
+    assert low.tolist() == pytest.approx([0.2366, 0.0, 0.0], abs=1e-4)
+    assert high.tolist() == pytest.approx([0.7634, 0.2775, 1.0], abs=1e-4)
+
+
+def test_early_stopping_rule():
+    """
+    Test that the order is a seeded permutation, and that groups stop when
+    their interval is narrow, clear of the threshold, or complete.
+    """
+    corpus = pd.DataFrame({
+        "item_id": range(300), "category": ["a"] * 200 + ["b"] * 100
+    })
+    stopping = EarlyStopping(target_width=0.1, threshold=0.5, min_items=10)
+
+    order = stopping.order(corpus)
+    assert sorted(order.index) == list(range(300))
+    assert order.index.tolist() \
+        == EarlyStopping().order(corpus).index.tolist()
+    assert order.index.tolist() != list(range(300))
+
+    # 'a' is clearly above chance, 'b' undecided after 20 items
+    stopping.update(corpus.iloc[:20], np.ones(20, dtype=bool))
+    stopping.update(corpus.iloc[200:220], np.arange(20) % 2 == 0)
+    assert stopping.groups().done.tolist() == [True, False]
+    assert not stopping.done()
+
+    # All items of 'b' scored
+    stopping.update(corpus.iloc[220:], np.arange(80) % 2 == 0)
+    assert stopping.done()
+    summary = stopping.summary()
+    assert [group["relation"] for group in summary["groups"]] == ["a", "b"]
+    assert summary["groups"][1]["n_scored"] == summary["groups"][1]["n_total"]
+
+
+def test_run_experiment_early_stopping(tiny_scorer, tiny_dataset, tmp_path):
+    """
+    Test that an early-stopped experiment scores a seeded random subset of
+    the items, with the scores of a full run, in corpus order.
+    """
+    corpus = write_large_corpus(tmp_path / "data" / tiny_dataset)
+    run_experiment(
+        tiny_scorer, tiny_dataset, {}, str(tmp_path / "full.json"),
+        ScoringOptions(batch_size=4)
+        )
+
+    meta = {}
+    run_experiment(
+        tiny_scorer, tiny_dataset, meta, str(tmp_path / "early.json"),
+        ScoringOptions(
+            batch_size=4, chunk_size=16,
+            early_stopping=EarlyStopping(target_width=0.5, min_items=10)
+        )
+    )
+
+    with open(tmp_path / "full.json", "r", encoding="utf-8") as file:
+        expected = {res["item_id"]: res for res in json.load(file)["results"]}
+    with open(tmp_path / "early.json", "r", encoding="utf-8") as file:
+        output = json.load(file)
+
+    assert output["meta"]["n_total"] == len(corpus.index)
+    n_scored = output["meta"]["n_scored"]
+    assert 0 < n_scored < len(corpus.index) and n_scored % 16 == 0
+    assert [group["relation"] for group in
+            output["meta"]["early_stopping"]["groups"]] == ["a", "b"]
+
+    item_ids = [res["item_id"] for res in output["results"]]
+    order = EarlyStopping().order(read_corpus(str(
+        tmp_path / "data" / tiny_dataset / "corpus.csv"
+        )))
+    assert item_ids == sorted(order.item_id[:n_scored])
+    for res in output["results"]:
+        assert res["logprob_of_good_continuation"] == pytest.approx(
+            expected[res["item_id"]]["logprob_of_good_continuation"], abs=1e-5
+            )
+
+
+def test_run_experiment_early_stopping_within_chunk(
+    tiny_scorer, tiny_dataset, tmp_path
+):
+    """
+    Test that a corpus smaller than one chunk stops early, checking the rule
+    every early_stopping_step items.
+    """
+    corpus = write_large_corpus(tmp_path / "data" / tiny_dataset)
+    assert len(corpus.index) < ScoringOptions().chunk_size
+
+    meta = {}
+    run_experiment(
+        tiny_scorer, tiny_dataset, meta, str(tmp_path / "early.json"),
+        ScoringOptions(
+            batch_size=4, early_stopping_step=16,
+            early_stopping=EarlyStopping(target_width=0.5, min_items=10)
+        )
+    )
+
+    assert 0 < meta["n_scored"] < len(corpus.index)
+    assert meta["n_scored"] % 16 == 0
+
+
+def test_run_experiment_early_stopping_resume(
+    tiny_scorer, tiny_dataset, tmp_path
+):
+    """
+    Test that a resumed early-stopped experiment counts the items of the
+    interrupted run and stops at the same point.
+    """
+    write_large_corpus(tmp_path / "data" / tiny_dataset)
+    file_out = str(tmp_path / "early.json")
+    options = {"batch_size": 4, "chunk_size": 16}
+
+    run_experiment(
+        tiny_scorer, tiny_dataset, {}, file_out, ScoringOptions(
+            early_stopping=EarlyStopping(target_width=0.5, min_items=10),
+            **options
+        )
+    )
+    with open(file_out, "r", encoding="utf-8") as file:
+        expected = json.load(file)
+
+    # An interrupted run that wrote the first chunk
+    first_chunk = set(EarlyStopping().order(read_corpus(str(
+        tmp_path / "data" / tiny_dataset / "corpus.csv"
+        ))).item_id[:16])
+    with open(f"{file_out}.partial.jsonl", "w", encoding="utf-8") as file:
+        for res in expected["results"]:
+            if res["item_id"] in first_chunk:
+                file.write(json.dumps(res) + "\n")
+
+    run_experiment(
+        tiny_scorer, tiny_dataset, {}, file_out, ScoringOptions(
+            resume=True,
+            early_stopping=EarlyStopping(target_width=0.5, min_items=10),
+            **options
+        )
+    )
+    with open(file_out, "r", encoding="utf-8") as file:
+        output = json.load(file)
+
+    assert output["meta"]["n_scored"] == expected["meta"]["n_scored"]
+    assert [res["item_id"] for res in output["results"]] \
+        == [res["item_id"] for res in expected["results"]]
+
+
+def test_aggregate_metrics_weights_early_stopped():
+    """
+    Test that pooled accuracies weight early-stopped items by the share of
+    items that was scored.
+    """
+    df = pd.DataFrame({
+        "model": "m",
+        "logprob_of_good_continuation": [1.0, 0.0, 1.0, 1.0, 1.0, 0.0],
+        "logprob_of_bad_continuation": 0.5,
+        # 2 of 20 items scored, and a dataset scored completely
+        "n_scored": [2, 2, np.nan, np.nan, np.nan, np.nan],
+        "n_total": [20, 20, np.nan, np.nan, np.nan, np.nan],
+    })
+
+    result = aggregate_metrics(df, by=["model"], metrics=["accuracy"])
+
+    assert result.accuracy[0] == pytest.approx((10 + 3) / (20 + 4))
+    assert result.n_items[0] == 6
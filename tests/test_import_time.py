@@ -0,0 +1,51 @@
+"""
+Test suite for the import time benchmark.
+
+This module contains tests guarding that the command line entry points start
+without importing torch, transformers or minicons.
+"""
+
+import pytest
+from benchmarks.import_time import (
+    COMMANDS, imported_packages, measure_startup, parse_import_times
+)
+
+
+def test_parse_import_times():
+    """
+    Test that only top-level imports are timed, by their cumulative time,
+    while nested imports count as imported packages.
+    """
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       100 |        100 |     torch._C\n"
+        "import time:       200 |        300 |   torch\n"
+        "import time:        50 |        350 | bin.io\n"
+        "Some other output\n"
+    )
+
+    assert parse_import_times(stderr) == pytest.approx({"bin.io": 350e-6})
+    assert imported_packages(stderr) == {"torch", "bin"}
+
+
+@pytest.mark.parametrize("name", list(COMMANDS))
+def test_entry_points_skip_heavy_imports(name):
+    """
+    Test that importing bin.io or bin.corpus, '--help', '--dry-run',
+    argument errors and fully cached sweeps do not import torch,
+    transformers or minicons.
+    """
+    result = measure_startup(COMMANDS[name])
+
+    assert result["heavy"] == []
+    assert result["returncode"] == (1 if "invalid" in name else 0)
+
+
+def test_heavy_imports_are_detected():
+    """
+    Test that a heavy library imported by a module of an entry point is
+    reported.
+    """
+    result = measure_startup(["-c", "import bin.parallel"])
+
+    assert result["heavy"] == ["torch"]
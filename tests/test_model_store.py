@@ -0,0 +1,63 @@
+"""
+Test suite for the model_store module.
+
+This module contains tests for converting models into the local store and
+loading revisions from it.
+"""
+
+import json
+import os
+from unittest.mock import patch
+import pytest
+from safetensors import safe_open
+from bin.model_store import ensure_stored, store_path
+from bin.run_experiment import SweepOptions, run_sweep
+
+
+def test_ensure_stored(tiny_model_dir, tmp_path):
+    """
+    Test that a revision is converted to bfloat16 safetensors once, reused
+    afterwards, and required to exist in offline mode.
+    """
+    root = str(tmp_path / "store")
+
+    with pytest.raises(FileNotFoundError):
+        ensure_stored(tiny_model_dir, "main", root=root, offline=True)
+
+    path = ensure_stored(tiny_model_dir, "main", root=root)
+    assert path == store_path(tiny_model_dir, "main", "bfloat16", root)
+    with safe_open(os.path.join(path, "model.safetensors"), "pt") as file:
+        tensor = file.get_tensor(next(iter(file.keys())))
+    assert str(tensor.dtype) == "torch.bfloat16"
+    assert os.path.exists(os.path.join(path, "tokenizer.json"))
+
+    with patch("bin.model_store.convert_model") as convert_model:
+        assert ensure_stored(tiny_model_dir, "main", root=root, offline=True) \
+            == path
+    convert_model.assert_not_called()
+
+
+def test_run_sweep_model_store(tiny_model_dir, tiny_dataset, tmp_path):
+    """
+    Test that a sweep loading from the model store gives the same results
+    as loading the original weights.
+    """
+    template = str(tmp_path / "{dataset}_{revision}.json")
+    store = str(tmp_path / "store")
+
+    run_sweep(tiny_model_dir, ["main"], [tiny_dataset], template)
+    with open(template.format(dataset=tiny_dataset, revision="main"),
+              "r", encoding="utf-8") as file:
+        expected = json.load(file)["results"]
+
+    run_sweep(
+        tiny_model_dir, ["main"], [tiny_dataset], template,
+        SweepOptions(model_store=store)
+        )
+    run_sweep(
+        tiny_model_dir, ["main"], [tiny_dataset], template,
+        SweepOptions(model_store=store, offline=True)
+        )
+    with open(template.format(dataset=tiny_dataset, revision="main"),
+              "r", encoding="utf-8") as file:
+        assert json.load(file)["results"] == expected
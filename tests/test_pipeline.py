@@ -0,0 +1,88 @@
+"""
+Test suite for the pipeline module.
+
+This module contains tests for the threaded producer and consumer stages and
+for running experiments in pipelined mode.
+"""
+
+import json
+import time
+import pytest
+from bin.pipeline import Pipeline
+from bin.run_experiment import run_experiment
+from bin.scoring import ScoringOptions
+
+
+def test_pipeline_order_and_metrics():
+    """
+    Test that items pass through both stages in order and that the queues
+    record their depth within capacity.
+    """
+    stages = Pipeline(queue_size=2)
+    handled = []
+
+    def slow_write(item):
+        time.sleep(0.01)
+        handled.append(item)
+
+    with stages.consume(slow_write, "results") as put:
+        for item in stages.prefetch(range(10), "chunks"):
+            put(item * 2)
+
+    assert handled == [2 * i for i in range(10)]
+    metrics = stages.metrics()
+    assert set(metrics) == {"chunks", "results"}
+    for name in metrics:
+        assert metrics[name]["items"] == 10
+        assert 1 <= metrics[name]["max_depth"] <= 2
+    # The slow consumer makes the main thread wait for space
+    assert metrics["results"]["put_wait_seconds"] > 0
+
+
+def test_pipeline_errors():
+    """
+    Test that exceptions of the producer and consumer threads are raised in
+    the main thread.
+    """
+    def failing_items():
+        yield 1
+        raise KeyError("producer")
+
+    with pytest.raises(KeyError, match="producer"):
+        list(Pipeline().prefetch(failing_items(), "chunks"))
+
+    def failing_write(item):
+        raise ValueError(f"consumer {item}")
+
+    with pytest.raises(ValueError, match="consumer 0"):
+        with Pipeline().consume(failing_write, "results") as put:
+            for item in range(5):
+                put(item)
+
+
+@pytest.mark.parametrize("tokenized_cache_dir", [None, ".cache/tokenized"])
+def test_pipelined_matches_sequential(
+    tiny_scorer, tiny_dataset, tmp_path, tokenized_cache_dir
+):
+    """
+    Test that a pipelined run writes the results of a sequential run and
+    stores the queue metrics.
+    """
+    for name, pipeline in [("sequential", False), ("pipelined", True)]:
+        run_experiment(
+            tiny_scorer, tiny_dataset, {}, str(tmp_path / f"{name}.json"),
+            ScoringOptions(
+                batch_size=4, chunk_size=2, pipeline=pipeline,
+                tokenized_cache_dir=tokenized_cache_dir
+            )
+        )
+
+    with open(tmp_path / "sequential.json", "r", encoding="utf-8") as file:
+        sequential = json.load(file)
+    with open(tmp_path / "pipelined.json", "r", encoding="utf-8") as file:
+        pipelined = json.load(file)
+
+    assert pipelined["results"] == sequential["results"]
+    assert "pipeline" not in sequential["meta"]
+    assert pipelined["meta"]["pipeline"]["chunks"]["items"] == 3
+    assert pipelined["meta"]["pipeline"]["results"]["items"] == 3
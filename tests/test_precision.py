@@ -0,0 +1,58 @@
+"""
+Test suite for the precision module.
+
+This module contains tests for loading the tiny test model in reduced
+precision and comparing its scores with the fp32 reference.
+"""
+
+import pytest
+import torch
+from bin.io import ModelOptions, initialize_model, model_dtype
+from bin.precision import PrecisionRun, compare_precisions
+
+
+def test_initialize_model_int8_dynamic(tiny_model_dir):
+    """
+    Test that int8-dynamic quantizes the linear layers on CPU and is told
+    apart from fp32 by its dtype name.
+    """
+    model = initialize_model(
+        tiny_model_dir, "main", device="cpu",
+        options=ModelOptions(precision="int8-dynamic")
+        )
+
+    assert not any(
+        type(module) is torch.nn.Linear  # pylint: disable=unidiomatic-typecheck
+        for module in model.model.modules()
+    )
+    assert model_dtype(model) == "torch.float32+int8-dynamic"
+
+    reference = initialize_model(tiny_model_dir, "main", device="cpu",
+                                 options=ModelOptions(precision="fp32"))
+    assert model_dtype(reference) == "torch.float32"
+
+    with pytest.raises(ValueError):
+        ModelOptions(precision="int4")
+
+
+def test_compare_precisions(tiny_model_dir, tiny_dataset):
+    """
+    Test that the comparison reports no drift for fp32, small drift for the
+    reduced precisions and one drift row per item and precision.
+    """
+    summary, items = compare_precisions(
+        PrecisionRun(tiny_model_dir, batch_size=4), tiny_dataset,
+        ["bf16", "int8-dynamic"]
+        )
+
+    summary = summary.set_index("precision")
+    assert list(summary.index) == ["fp32", "bf16", "int8-dynamic"]
+    assert summary.loc["fp32", "max_abs_drift"] == 0
+    assert summary.loc["fp32", "accuracy_change"] == 0
+    assert 0 < summary.loc["bf16", "max_abs_drift"] < 0.5
+    assert 0 < summary.loc["int8-dynamic", "max_abs_drift"] < 0.5
+
+    assert len(items) == 2 * 6
+    assert set(items.precision) == {"bf16", "int8-dynamic"}
+    assert (items.groupby("precision").flipped.sum()
+            == summary.loc[["bf16", "int8-dynamic"], "flipped_items"]).all()
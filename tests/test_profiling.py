@@ -0,0 +1,62 @@
+"""
+Test suite for the profiling module.
+
+This module contains tests for the Profiler and its integration with
+run_experiment.
+"""
+
+import json
+from bin import profiling
+from bin.profiling import Profiler
+from bin.run_experiment import run_experiment
+from bin.scoring import ScoringOptions
+
+
+def test_stage_without_profiler():
+    """
+    Test that stages and token counts are no-ops without an active profiler.
+    """
+    with profiling.stage("forward"):
+        profiling.add_tokens(3, 4)
+
+    profiler = Profiler()
+    with profiler.activate():
+        with profiling.stage("forward"):
+            profiling.add_tokens(3, 4)
+    with profiling.stage("forward"):
+        profiling.add_tokens(5, 5)
+
+    summary = profiler.summary()
+    assert summary["stages"]["forward"]["calls"] == 1
+    assert summary["tokens"] == 3
+    assert summary["padding_ratio"] == 0.25
+
+
+def test_run_experiment_profile(tiny_scorer, tiny_dataset, tmp_path):
+    """
+    Test that a profiled experiment stores its stage timings in the metadata
+    and writes a Chrome trace.
+    """
+    file_out = str(tmp_path / "out.json")
+    profiler = Profiler(trace="stages")
+    profiler.record("model_load", 1.5)
+
+    run_experiment(
+        tiny_scorer, tiny_dataset, {}, file_out,
+        ScoringOptions(batch_size=4, profiler=profiler)
+        )
+
+    with open(file_out, "r", encoding="utf-8") as file:
+        profile = json.load(file)["meta"]["profile"]
+    assert profile["model_load_time"] == 1.5
+    for name in ["read_corpus", "tokenize", "pad", "forward", "reduction",
+                 "build_results", "write"]:
+        assert profile["stages"][name]["seconds"] >= 0
+    assert profile["stages"]["forward"]["calls"] == 3
+    assert profile["tokens"] > 0
+    assert 0 <= profile["padding_ratio"] < 1
+    assert profile["peak_rss_mb"] > 0
+
+    with open(f"{file_out}.trace.json", "r", encoding="utf-8") as file:
+        events = json.load(file)["traceEvents"]
+    assert {event["name"] for event in events} >= {"forward", "write"}
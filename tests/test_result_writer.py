@@ -0,0 +1,107 @@
+"""
+Test suite for the result_writer module.
+
+This module contains tests for the ResultWriter class and resuming an
+interrupted run_experiment call.
+"""
+
+import json
+import os
+from unittest.mock import patch
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bin.result_writer import ResultWriter
+from bin.run_experiment import run_experiment
+from bin.scoring import ScoringOptions
+
+
+def test_finalize_orders_results(tmp_path):
+    """
+    Test that the final output file lists results in corpus order and that
+    the sidecar is removed.
+    """
+    file_out = str(tmp_path / "out.json")
+    writer = ResultWriter(file_out)
+    writer.write([{"item_id": 2, "score": -2.0}, {"item_id": 1, "score": -1.0}])
+    writer.finalize({"model": "test_model/v1"}, [1, 2])
+
+    with open(file_out, "r", encoding="utf-8") as file:
+        output = json.load(file)
+
+    assert output == {
+        "meta": {"model": "test_model/v1"},
+        "results": [
+            {"item_id": 1, "score": -1.0}, {"item_id": 2, "score": -2.0}
+        ],
+    }
+    assert not os.path.exists(writer.sidecar)
+
+
+def test_resume_drops_truncated_record(tmp_path):
+    """
+    Test that resuming keeps complete records and drops a record cut off by
+    a crash.
+    """
+    file_out = str(tmp_path / "out.json")
+    with open(f"{file_out}.partial.jsonl", "w", encoding="utf-8") as file:
+        file.write('{"item_id": 1}\n{"item_id": 2}\n{"item_i')
+
+    writer = ResultWriter(file_out, resume=True)
+    assert writer.completed_ids() == {1, 2}
+
+    writer.write([{"item_id": 3}])
+    writer.finalize({}, [1, 2, 3])
+
+    with open(file_out, "r", encoding="utf-8") as file:
+        assert [res["item_id"] for res in json.load(file)["results"]] == [1, 2, 3]
+
+
+def test_run_experiment_resume(tiny_scorer, tiny_dataset, tmp_path):
+    """
+    Test that a resumed experiment only scores the remaining items and
+    produces the same output as an uninterrupted run.
+    """
+    complete = str(tmp_path / "complete.json")
+    resumed = str(tmp_path / "resumed.json")
+    run_experiment(tiny_scorer, tiny_dataset, {}, complete)
+
+    with open(complete, "r", encoding="utf-8") as file:
+        expected = json.load(file)
+    with open(f"{resumed}.partial.jsonl", "w", encoding="utf-8") as file:
+        for res in expected["results"][:4]:
+            file.write(json.dumps(res) + "\n")
+
+    with patch.object(
+        tiny_scorer, "compute_stats", wraps=tiny_scorer.compute_stats
+    ) as compute_stats:
+        run_experiment(
+            tiny_scorer, tiny_dataset, {}, resumed, ScoringOptions(resume=True)
+            )
+
+    assert compute_stats.call_count == 2
+    with open(resumed, "r", encoding="utf-8") as file:
+        assert json.load(file) == expected
+
+
+def test_run_experiment_parquet(tiny_scorer, tiny_dataset, tmp_path):
+    """
+    Test that Parquet output holds the same results as JSON output, with the
+    metadata as dictionary-encoded columns and file-level metadata.
+    """
+    meta_data = {"model": "test_model/v1", "revision": "main"}
+    run_experiment(
+        tiny_scorer, tiny_dataset, dict(meta_data), str(tmp_path / "out.json")
+        )
+    run_experiment(
+        tiny_scorer, tiny_dataset, dict(meta_data),
+        str(tmp_path / "out.parquet")
+        )
+
+    table = pq.read_table(tmp_path / "out.parquet")
+    with open(tmp_path / "out.json", "r", encoding="utf-8") as file:
+        expected = json.load(file)
+
+    assert json.loads(table.schema.metadata[b"meta"]) == expected["meta"]
+    assert pa.types.is_dictionary(table.schema.field("revision").type)
+    records = table.drop_columns(["model", "revision", "dataset"]).to_pylist()
+    assert records == expected["results"]
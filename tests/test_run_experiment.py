@@ -0,0 +1,345 @@
+"""
+Test suite for the run_experiment and batching modules.
+
+This module contains tests for run_experiment and the batched scoring path,
+using a tiny randomly initialized model.
+"""
+
+import json
+from unittest.mock import patch
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from bin.analysis_tools import apply_token_reduction, read_parquet_dataset
+from bin.batching import length_sorted_batches, pad_batch
+from bin.io import ModelOptions, initialize_model
+from bin import prefix_cache
+from bin.parallel import DataParallelScorer
+from bin.run_experiment import SweepOptions, run_experiment, run_sweep
+from bin.score_cache import ScoreCache
+from bin.scoring import (
+    ScoringOptions, build_stimuli, score_corpus, stimulus_prefixes
+)
+from bin.sweep import parse_revisions
+from bin.tokenized_corpus import TokenizedCorpus
+from tests.conftest import CORPUS
+
+
+def read_results(file_out: str) -> list:
+    """
+    Reads the 'results' list of an output file.
+
+    Args:
+        file_out (str): The path to the output file.
+
+    Returns:
+        list: The result records.
+    """
+    with open(file_out, "r", encoding="utf-8") as file:
+        return json.load(file)["results"]
+
+
+def test_length_sorted_batches():
+    """
+    Test that batches group stimuli of similar length and cover all indices.
+    """
+    batches = length_sorted_batches([5, 2, 7, 2, 3], batch_size=2)
+
+    assert batches == [[1, 3], [4, 0], [2]]
+
+    with pytest.raises(ValueError):
+        length_sorted_batches([1], batch_size=0)
+
+
+def test_pad_batch_matches_tokenizer(tiny_scorer):
+    """
+    Test that padding the token ids directly gives the input the tokenizer
+    builds, also for read-only arrays such as a memory-mapped corpus.
+    """
+    token_ids = tiny_scorer.tokenizer(
+        ["the actor won the award", "the actor won", "the"]
+        )["input_ids"]
+    expected = tiny_scorer.tokenizer.pad(
+        {"input_ids": token_ids}, return_tensors="pt"
+        )
+
+    arrays = [np.array(ids, dtype=np.int32) for ids in token_ids]
+    for array in arrays:
+        array.flags.writeable = False
+    for ids in [token_ids, arrays]:
+        encoded = pad_batch(tiny_scorer, ids)
+        assert encoded["input_ids"].tolist() == expected["input_ids"].tolist()
+        assert encoded["attention_mask"].tolist() \
+            == expected["attention_mask"].tolist()
+
+
+@pytest.mark.parametrize("options", [
+    ScoringOptions(), ScoringOptions(batch_size=5),
+    ScoringOptions(prefix_cache=True),
+])
+def test_score_corpus_matches_minicons(tiny_scorer, options):
+    """
+    Test that scoring from token ids gives the mean log probabilities of
+    minicons' sequence_score, in every scoring mode.
+    """
+    stimuli = build_stimuli(CORPUS)
+    tokenized = TokenizedCorpus.build(
+        tiny_scorer.tokenizer, stimulus_prefixes(CORPUS), stimuli
+        )
+    indices = list(range(len(stimuli)))
+
+    scores = score_corpus(
+        tiny_scorer, tokenized.token_ids(indices), tokenized.prefix_lengths,
+        options
+        )
+    expected = tiny_scorer.sequence_score(
+        stimuli, reduction=lambda x: x.mean(0).item()
+        )
+
+    assert scores == pytest.approx(expected, abs=1e-5)
+
+
+def test_batched_matches_unbatched(tiny_scorer, tiny_dataset, tmp_path):
+    """
+    Test that batched scoring returns the unbatched logprobs in item order.
+    """
+    unbatched = tmp_path / "unbatched.json"
+    batched = tmp_path / "batched.json"
+
+    run_experiment(tiny_scorer, tiny_dataset, {}, str(unbatched))
+    run_experiment(
+        tiny_scorer, tiny_dataset, {}, str(batched), ScoringOptions(batch_size=5)
+        )
+
+    expected = read_results(unbatched)
+    actual = read_results(batched)
+
+    assert [res["item_id"] for res in actual] == [1, 2, 3, 4, 5, 6]
+    for exp, act in zip(expected, actual):
+        for key in ["logprob_of_good_continuation",
+                    "logprob_of_bad_continuation"]:
+            assert act[key] == pytest.approx(exp[key], abs=1e-5)
+
+
+def test_prefix_cache_matches_unbatched(tiny_scorer, tiny_dataset, tmp_path):
+    """
+    Test that scoring continuations from a cached prefix returns the same
+    logprobs as scoring the full stimuli.
+    """
+    unbatched = tmp_path / "unbatched.json"
+    cached = tmp_path / "cached.json"
+
+    run_experiment(tiny_scorer, tiny_dataset, {}, str(unbatched))
+    run_experiment(
+        tiny_scorer, tiny_dataset, {}, str(cached),
+        ScoringOptions(prefix_cache=True)
+        )
+
+    expected = read_results(unbatched)
+    actual = read_results(cached)
+
+    assert [res["item_id"] for res in actual] == [1, 2, 3, 4, 5, 6]
+    for exp, act in zip(expected, actual):
+        for key in ["logprob_of_good_continuation",
+                    "logprob_of_bad_continuation"]:
+            assert act[key] == pytest.approx(exp[key], abs=1e-5)
+
+
+def test_prefix_cache_splits_large_groups(tiny_scorer):
+    """
+    Test that the continuations of a common prefix are scored in groups of
+    at most the batch size, with the scores of a single group.
+    """
+    prefix = "the actor won the"
+    stimuli = [f"{prefix} {word}" for word in
+               ["award", "prize", "game", "race", "cup", "title", "match"]]
+    tokenized = TokenizedCorpus.build(
+        tiny_scorer.tokenizer, [prefix] * len(stimuli), stimuli
+        )
+    token_ids = tokenized.token_ids(list(range(len(stimuli))))
+
+    expected = prefix_cache.score_with_prefix_cache(
+        tiny_scorer, token_ids, tokenized.prefix_lengths, batch_size=16
+        )
+    with patch.object(
+        prefix_cache, "score_prefix_group",
+        wraps=prefix_cache.score_prefix_group
+    ) as score_group:
+        scores = prefix_cache.score_with_prefix_cache(
+            tiny_scorer, token_ids, tokenized.prefix_lengths, batch_size=3
+            )
+
+    assert [len(call.args[2]) for call in score_group.call_args_list] \
+        == [3, 3, 1]
+    assert scores == pytest.approx(expected, abs=1e-5)
+
+
+def test_parse_revisions():
+    """
+    Test that revision lists and ranges are expanded in order without
+    duplicates, and that malformed ranges are rejected.
+    """
+    assert parse_revisions("main") == ["main"]
+    assert parse_revisions("step0, step1000..step3000:1000,step2000,main") == [
+        "step0", "step1000", "step2000", "step3000", "main"
+    ]
+    assert parse_revisions("step1..4:2") == ["step1", "step3"]
+
+    with pytest.raises(ValueError):
+        parse_revisions("step1000..step5000")
+    with pytest.raises(ValueError):
+        parse_revisions("step5000..step1000:1000")
+
+
+def test_run_sweep(tiny_model_dir, tiny_dataset, tmp_path):
+    """
+    Test that a sweep writes one output file per revision and reports load
+    and scoring times.
+    """
+    template = str(tmp_path / "{dataset}_{revision}.json")
+
+    timings = run_sweep(
+        tiny_model_dir, ["main", "step1"], [tiny_dataset], template,
+        SweepOptions(scoring=ScoringOptions(batch_size=4))
+    )
+
+    assert [timing["revision"] for timing in timings] == ["main", "step1"]
+    for revision in ["main", "step1"]:
+        with open(template.format(dataset=tiny_dataset, revision=revision),
+                  "r", encoding="utf-8") as file:
+            output = json.load(file)
+        assert output["meta"]["revision"] == revision
+        assert len(output["results"]) == 6
+
+
+def test_run_sweep_skip_existing(tiny_model_dir, tiny_dataset, tmp_path):
+    """
+    Test that a sweep skipping existing outputs only loads the revisions
+    with outputs left to write, and nothing once all of them exist.
+    """
+    template = str(tmp_path / "{dataset}_{revision}.json")
+    run_sweep(tiny_model_dir, ["main"], [tiny_dataset], template)
+
+    timings = run_sweep(
+        tiny_model_dir, ["main", "step1"], [tiny_dataset], template,
+        SweepOptions(skip_existing=True)
+    )
+    assert [timing["revision"] for timing in timings] == ["step1"]
+
+    assert not run_sweep(
+        tiny_model_dir, ["main", "step1"], [tiny_dataset], template,
+        SweepOptions(skip_existing=True)
+    )
+
+
+def test_run_sweep_all_cached(tiny_model_dir, tiny_dataset, tmp_path):
+    """
+    Test that a revision whose scores are all cached is not loaded, and
+    that its outputs hold the cached scores.
+    """
+    template = str(tmp_path / "{dataset}_{revision}.json")
+    cache = ScoreCache(str(tmp_path / "scores.sqlite"))
+    options = SweepOptions(
+        model=ModelOptions(precision="fp32"),
+        scoring=ScoringOptions(score_cache=cache)
+        )
+
+    try:
+        run_sweep(tiny_model_dir, ["main"], [tiny_dataset], template, options)
+        expected = read_results(template.format(
+            dataset=tiny_dataset, revision="main"
+            ))
+
+        with patch("bin.run_experiment.initialize_model") as load:
+            run_sweep(
+                tiny_model_dir, ["main"], [tiny_dataset], template, options
+                )
+        load.assert_not_called()
+    finally:
+        cache.close()
+
+    assert read_results(template.format(
+        dataset=tiny_dataset, revision="main"
+        )) == expected
+
+
+def test_data_parallel_matches_single_worker(
+    tiny_model_dir, tiny_dataset, tmp_path
+):
+    """
+    Test that scoring with two CPU workers gives exactly the results of a
+    single model in every scoring mode.
+    """
+    single = initialize_model(tiny_model_dir, "main", device="cpu")
+    parallel = DataParallelScorer(
+        tiny_model_dir, "main", single.tokenizer, ["cpu", "cpu"]
+        )
+
+    try:
+        assert parallel.dtype == str(single.model.dtype)
+        for name, options in [
+            ("unbatched", {}), ("batched", {"batch_size": 3}),
+            ("prefix", {"prefix_cache": True}),
+        ]:
+            run_experiment(
+                single, tiny_dataset, {}, str(tmp_path / f"{name}_1.json"),
+                ScoringOptions(**options)
+                )
+            run_experiment(
+                parallel, tiny_dataset, {}, str(tmp_path / f"{name}_2.json"),
+                ScoringOptions(**options)
+                )
+            assert read_results(tmp_path / f"{name}_2.json") \
+                == read_results(tmp_path / f"{name}_1.json")
+    finally:
+        parallel.close()
+
+
+def test_token_logprobs(tiny_scorer, tiny_dataset, tmp_path):
+    """
+    Test that per-token log probabilities are stored as float32 lists and
+    reduce to the scores of a regular run.
+    """
+    run_experiment(tiny_scorer, tiny_dataset, {}, str(tmp_path / "mean.json"))
+    (tmp_path / "results").mkdir()
+    run_experiment(
+        tiny_scorer, tiny_dataset, {"model": "tiny", "revision": "main"},
+        str(tmp_path / "results" / "tiny_main.parquet"),
+        ScoringOptions(token_logprobs=True, prefix_cache=True)
+        )
+
+    table = pq.read_table(tmp_path / "results" / "tiny_main.parquet")
+    assert table.schema.field("token_logprobs_of_good_continuation").type \
+        == pa.list_(pa.float32())
+
+    df = read_parquet_dataset(str(tmp_path / "results"))
+    expected = read_results(tmp_path / "mean.json")
+    for reduction in ["mean", "sum", "continuation_mean"]:
+        reduced = apply_token_reduction(df, reduction)
+        for exp, good, bad, length in zip(
+            expected, reduced.logprob_of_good_continuation,
+            reduced.logprob_of_bad_continuation,
+            df.token_logprobs_of_good_continuation.map(len)
+        ):
+            if reduction == "mean":
+                assert good == pytest.approx(
+                    exp["logprob_of_good_continuation"], abs=1e-5
+                    )
+                assert bad == pytest.approx(
+                    exp["logprob_of_bad_continuation"], abs=1e-5
+                    )
+            elif reduction == "sum":
+                assert good == pytest.approx(
+                    exp["logprob_of_good_continuation"] * length, abs=1e-4
+                    )
+            else:
+                assert np.isfinite(good)
+
+    # The first item has a one-token continuation after a four-token prefix
+    first = df.iloc[0]
+    assert first.prefix_tokens_of_good_continuation == 4
+    assert apply_token_reduction(df, "continuation_sum") \
+        .logprob_of_good_continuation.iloc[0] == pytest.approx(
+            first.token_logprobs_of_good_continuation[-1]
+            )
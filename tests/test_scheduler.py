@@ -0,0 +1,108 @@
+"""
+Test suite for the scheduler module.
+
+This module contains tests for memory estimates, device packing and running
+a sweep spec with the tiny test model on CPU slots.
+"""
+
+import json
+import os
+import pytest
+from bin.scheduler import (
+    GB, build_jobs, count_parameters, estimate_memory, pick_device,
+    run_schedule
+)
+
+
+def test_pick_device():
+    """
+    Test that jobs go to the first device with enough free memory and a free
+    slot.
+    """
+    devices = [
+        {"name": "cuda:0", "memory": 8 * GB, "slots": None},
+        {"name": "cpu", "memory": 64 * GB, "slots": 1},
+    ]
+    job = {"memory": 6 * GB}
+
+    usage = {"cuda:0": (0, 0), "cpu": (0, 0)}
+    assert pick_device(job, devices, usage)["name"] == "cuda:0"
+
+    usage = {"cuda:0": (4 * GB, 1), "cpu": (0, 0)}
+    assert pick_device(job, devices, usage)["name"] == "cpu"
+
+    usage = {"cuda:0": (4 * GB, 1), "cpu": (1 * GB, 1)}
+    assert pick_device(job, devices, usage) is None
+
+
+def test_estimate_memory(tiny_model_dir):
+    """
+    Test that the memory estimate scales with the parameter count and dtype.
+    """
+    n_parameters = count_parameters(tiny_model_dir)
+
+    assert n_parameters > 0
+    assert estimate_memory(n_parameters, "float32") \
+        == pytest.approx(2 * estimate_memory(n_parameters, "bfloat16"), abs=1)
+
+
+def test_build_jobs_missing_model(tiny_model_dir, tmp_path):
+    """
+    Test that a model whose config cannot be loaded is recorded as failed
+    without stopping the other jobs.
+    """
+    spec = {
+        "models": [str(tmp_path / "missing"), tiny_model_dir],
+        "revisions": "main",
+        "datasets": ["tiny"],
+    }
+
+    jobs, entries = build_jobs(spec, str(tmp_path))
+
+    assert [job["model"] for job in jobs] == [tiny_model_dir]
+    assert len(entries) == 1
+    assert entries[0]["model"] == str(tmp_path / "missing")
+    assert entries[0]["status"] == "failed"
+    assert entries[0]["error"]
+
+
+def test_run_schedule(tiny_model_dir, tiny_dataset, tmp_path):
+    """
+    Test that a sweep runs every job once, skips finished jobs on a rerun,
+    retries failing jobs and records all of them in the manifest.
+    """
+    spec = {
+        "models": [tiny_model_dir],
+        "revisions": "main,step1",
+        "datasets": [tiny_dataset],
+        "options": {"no_cache": True, "batch_size": 4},
+        "cpu_slots": 2,
+        "retries": 1,
+    }
+    manifest = str(tmp_path / "results" / "manifest.json")
+
+    entries = run_schedule(
+        spec, root=str(tmp_path), manifest=manifest, poll_interval=0.1
+        )
+
+    assert sorted(entry["status"] for entry in entries) == ["completed"] * 2
+    name = os.path.basename(tiny_model_dir)
+    for revision in ["main", "step1"]:
+        assert os.path.exists(
+            tmp_path / "results" / tiny_dataset / f"{name}_{revision}.json"
+            )
+    with open(manifest, "r", encoding="utf-8") as file:
+        assert json.load(file)["jobs"] == entries
+    assert all(entry["duration"] > 0 for entry in entries)
+
+    entries = run_schedule(
+        spec, root=str(tmp_path), manifest=manifest, poll_interval=0.1
+        )
+    assert [entry["status"] for entry in entries] == ["skipped"] * 2
+
+    spec.update(revisions="main", datasets=["missing"])
+    entries = run_schedule(
+        spec, root=str(tmp_path), manifest=manifest, poll_interval=0.1
+        )
+    assert entries[0]["status"] == "failed"
+    assert entries[0]["attempts"] == 2
@@ -0,0 +1,92 @@
+"""
+Test suite for the score_cache module.
+
+This module contains tests for the ScoreCache class and its use in
+run_experiment.
+"""
+
+import math
+from unittest.mock import patch
+from bin.score_cache import ScoreCache
+from bin.run_experiment import run_experiment
+from bin.scoring import ScoringOptions
+from tests.conftest import CORPUS
+
+CONTEXT = ("test_model/v1", "main", "torch.float32", "mean_reduction")
+
+
+def test_lookup_and_store(tmp_path):
+    """
+    Test that stored scores are found again only for the same context.
+    """
+    cache = ScoreCache(str(tmp_path / "cache" / "scores.sqlite"))
+    cache.store(CONTEXT, ["a b", "a c"], [-1.5, math.nan])
+
+    found = cache.lookup(CONTEXT, ["a c", "a d", "a b"])
+    assert found[2] == -1.5
+    assert math.isnan(found[0])
+    assert 1 not in found
+
+    assert not cache.lookup(("test_model/v1", "step1", *CONTEXT[2:]), ["a b"])
+    cache.close()
+
+
+def test_eviction_and_refresh(tmp_path):
+    """
+    Test that the least recently used entries are evicted beyond the size
+    limit and that refresh mode ignores cached scores.
+    """
+    path = str(tmp_path / "scores.sqlite")
+    cache = ScoreCache(path, max_entries=2)
+    cache.store(CONTEXT, ["a"], [-1.0])
+    cache.store(CONTEXT, ["b"], [-2.0])
+    cache.lookup(CONTEXT, ["a"])
+    cache.store(CONTEXT, ["c"], [-3.0])
+
+    assert sorted(cache.lookup(CONTEXT, ["a", "b", "c"])) == [0, 2]
+    cache.close()
+
+    refreshing = ScoreCache(path, max_entries=2, refresh=True)
+    assert not refreshing.lookup(CONTEXT, ["a"])
+    refreshing.close()
+
+
+def test_run_experiment_scores_only_misses(
+    tiny_scorer, tiny_dataset, tmp_path, capsys
+):
+    """
+    Test that a rerun after editing one corpus row only scores the changed
+    stimulus, and reports the cache hits once for the whole dataset.
+    """
+    cache = ScoreCache(str(tmp_path / "scores.sqlite"))
+    meta_data = {"model": "tiny", "revision": "main"}
+
+    run_experiment(
+        tiny_scorer, tiny_dataset, meta_data, str(tmp_path / "first.json"),
+        ScoringOptions(score_cache=cache)
+        )
+
+    corpus = CORPUS.copy()
+    corpus.loc[0, "good_continuation"] = "news"
+    corpus.to_csv(tmp_path / "data" / tiny_dataset / "corpus.csv", index=False)
+
+    with patch.object(
+        tiny_scorer, "compute_stats", wraps=tiny_scorer.compute_stats
+    ) as compute_stats:
+        capsys.readouterr()
+        run_experiment(
+            tiny_scorer, tiny_dataset, meta_data,
+            str(tmp_path / "second.json"),
+            ScoringOptions(score_cache=cache, chunk_size=2)
+            )
+
+    compute_stats.assert_called_once()
+    encoded = compute_stats.call_args.args[0][0]
+    assert encoded["input_ids"].tolist() == [
+        tiny_scorer.tokenizer("the actor won the news")["input_ids"]
+    ]
+    assert [
+        line for line in capsys.readouterr().out.splitlines()
+        if "in the cache" in line
+    ] == ["Found 11 of 12 scores in the cache."]
+    cache.close()
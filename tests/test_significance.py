@@ -0,0 +1,114 @@
+"""
+Test suite for the significance module.
+
+This module contains tests for the paired bootstrap and McNemar tests and
+compare_revisions.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+from bin.significance import (
+    Bootstrap, compare_revisions, mcnemar, paired_bootstrap
+)
+
+
+def make_results(correct: dict) -> pd.DataFrame:
+    """
+    Builds a results DataFrame from per-revision correctness of items.
+
+    Args:
+        correct (dict): Maps each revision to a list of 0/1 per item.
+
+    Returns:
+        pd.DataFrame: Results with log probabilities encoding correctness.
+    """
+    rows = []
+    for revision, values in correct.items():
+        for item_id, value in enumerate(values):
+            rows.append({
+                "model": "m1", "revision": revision, "item_id": item_id,
+                "logprob_of_good_continuation": -1.0 if value else -3.0,
+                "logprob_of_bad_continuation": -2.0,
+            })
+
+    return pd.DataFrame(rows)
+
+
+def test_mcnemar_matches_exact_binomial_test():
+    """
+    Test that the McNemar p-value equals the exact binomial test on the
+    discordant pairs.
+    """
+    statistic, p_value = mcnemar(np.array([3, 0]), np.array([12, 0]))
+
+    assert p_value[0] == pytest.approx(stats.binomtest(3, 15).pvalue)
+    assert statistic[0] == pytest.approx((9 - 1) ** 2 / 15)
+    assert p_value[1] == 1.0
+
+
+def test_paired_bootstrap():
+    """
+    Test that the bootstrap interval covers the observed difference, that a
+    large improvement is significant and that results are reproducible.
+    """
+    args = (np.array([100, 100]), np.array([2, 10]), np.array([30, 12]))
+
+    low, high, p_value = paired_bootstrap(*args, Bootstrap(n_boot=2000))
+
+    assert low[0] <= 0.28 <= high[0]
+    assert p_value[0] < 0.01
+    assert p_value[1] > 0.05
+    np.testing.assert_array_equal(
+        p_value, paired_bootstrap(*args, Bootstrap(n_boot=2000))[2]
+    )
+
+
+def test_compare_revisions():
+    """
+    Test that revisions are compared in training order on shared items.
+    """
+    df = make_results({
+        "main": [1, 1, 1, 1],
+        "step10": [0, 1, 0, 1],
+        "step2": [0, 0, 0],
+    })
+
+    result = compare_revisions(df, bootstrap=Bootstrap(n_boot=500))
+
+    assert list(result["revision_a"]) == ["step2", "step10"]
+    assert list(result["revision_b"]) == ["step10", "main"]
+    assert list(result["n_items"]) == [3, 4]
+    assert list(result["n_better"]) == [1, 2]
+    assert result["difference"].tolist() == pytest.approx([1 / 3, 0.5])
+
+    assert len(compare_revisions(
+        df, pairs="all", bootstrap=Bootstrap(n_boot=10)
+    ).index) == 3
+    without_bootstrap = compare_revisions(df, bootstrap=None)
+    assert without_bootstrap["p_bootstrap"].isna().all()
+    assert without_bootstrap["p_mcnemar"].tolist() \
+        == pytest.approx(result["p_mcnemar"].tolist())
+    with pytest.raises(ValueError):
+        compare_revisions(df, pairs="none")
+
+
+def test_compare_revisions_untyped_items():
+    """
+    Test that items without a type are kept apart when typed and untyped
+    datasets are pooled.
+    """
+    typed = make_results({"step1": [0] * 50, "step2": [1] * 50}).assign(
+        dataset="typed", type="t"
+        )
+    untyped = make_results({"step1": [1] * 50, "step2": [0] * 50}).assign(
+        dataset="untyped", type=np.nan
+        )
+    df = pd.concat([typed, untyped], ignore_index=True)
+
+    result = compare_revisions(df, bootstrap=None)
+
+    assert list(result["n_items"]) == [100]
+    assert list(result["n_better"]) == [50]
+    assert list(result["n_worse"]) == [50]
@@ -0,0 +1,75 @@
+"""
+Test suite for the target scorer module.
+
+This module contains tests comparing the target-only log probabilities with
+those of minicons.
+"""
+
+from unittest.mock import patch
+import pytest
+import torch
+from bin.batching import pad_batch, score_token_ids
+from bin.io import ModelOptions, initialize_model, model_dtype
+from bin.target_scorer import TargetScorer
+
+
+STIMULI = [
+    "the actor won the award", "the actor won the battle",
+    "a very old animal slowly found the map", "the anchorman told the news",
+]
+
+
+@pytest.mark.parametrize("precision", ["fp32", "bf16", "int8-dynamic"])
+def test_target_scorer_matches_minicons(tiny_model_dir, precision):
+    """
+    Test that the per-token log probabilities of a padded batch match the
+    minicons path, also with vocabulary chunks that do not divide the
+    vocabulary and with a quantized output layer.
+    """
+    minicons_model = initialize_model(
+        tiny_model_dir, "main", device="cpu",
+        options=ModelOptions(precision=precision)
+        )
+    target_model = initialize_model(
+        tiny_model_dir, "main", device="cpu",
+        options=ModelOptions(precision=precision, backend="target")
+        )
+    assert isinstance(target_model, TargetScorer)
+    assert model_dtype(target_model).endswith("+target")
+
+    encoded = pad_batch(
+        minicons_model, minicons_model.tokenizer(STIMULI)["input_ids"]
+        )
+    expected = minicons_model.compute_stats(
+        (encoded, [0] * len(STIMULI)), return_tensors=True
+        )
+    # minicons normalizes bf16 logits in bf16, the target scorer in float32
+    tolerance = 1e-5 if precision != "bf16" else 0.05
+
+    for vocab_chunk in [TargetScorer.VOCAB_CHUNK, 7]:
+        with patch.object(TargetScorer, "VOCAB_CHUNK", vocab_chunk):
+            scores = target_model.compute_stats(
+                (encoded, [0] * len(STIMULI)), return_tensors=True
+                )
+        for score, exp in zip(scores, expected):
+            assert score.dtype == torch.float32
+            assert score.tolist() == pytest.approx(
+                exp.float().tolist(), abs=tolerance
+                )
+
+    # Offsets skip leading tokens; lists are returned by default
+    scores = target_model.compute_stats((encoded, [2] * len(STIMULI)))
+    assert [len(score) for score in scores] \
+        == [len(exp) - 2 for exp in expected]
+
+
+def test_target_scorer_batched_scores(tiny_model_dir, tiny_scorer):
+    """
+    Test that batched mean scores match the unbatched minicons scores.
+    """
+    target_model = TargetScorer(tiny_model_dir, device="cpu")
+    token_ids = tiny_scorer.tokenizer(STIMULI)["input_ids"]
+
+    assert score_token_ids(target_model, token_ids, 3) == pytest.approx(
+        score_token_ids(tiny_scorer, token_ids, 1), abs=1e-5
+        )
@@ -0,0 +1,169 @@
+"""
+Test suite for the token budget module.
+
+This module contains tests for batching by a budget of padded tokens and for
+backing off when batches run out of memory.
+"""
+
+import json
+import os
+from unittest.mock import patch
+import pytest
+import torch
+from bin import token_budget
+from bin.batching import score_batch, score_token_ids
+from bin.run_experiment import run_experiment
+from bin.scoring import ScoringOptions
+from bin.token_budget import (
+    TokenBudget, estimated_rss, padded_tokens, score_batch_safely,
+    score_token_budget, token_budget_batches
+)
+
+
+def test_token_budget_batches():
+    """
+    Test that batches stay within the budget of padded tokens, and that a
+    stimulus longer than the budget is scored on its own.
+    """
+    lengths = [3, 10, 2, 3, 4, 30, 2]
+    batches = token_budget_batches(lengths, 12)
+
+    assert batches == [[2, 6, 0, 3], [4], [1], [5]]
+
+    with pytest.raises(ValueError):
+        token_budget_batches(lengths, 0)
+
+
+def test_out_of_memory_backoff(tiny_scorer, tmp_path):
+    """
+    Test that batches running out of memory are split and retried with the
+    same scores, and that the reduced budget is remembered.
+    """
+    token_ids = tiny_scorer.tokenizer([
+        "the actor won the award", "the actor won the battle",
+        "the animal found the food", "a very old animal slowly found the map",
+        "the anchorman told the news",
+    ])["input_ids"]
+    expected = score_token_ids(tiny_scorer, token_ids, 1)
+
+    def limited_score_batch(model, ids, reduction):
+        if padded_tokens(ids) > 8:
+            raise torch.cuda.OutOfMemoryError("CUDA out of memory.")
+        return score_batch(model, ids, reduction)
+
+    path = str(tmp_path / "budgets.json")
+    budget = TokenBudget("tiny | cpu", 64, path=path)
+    with patch.object(token_budget, "score_batch", limited_score_batch):
+        scores = score_token_budget(tiny_scorer, token_ids, budget)
+
+    assert scores == pytest.approx(expected, abs=1e-5)
+    assert budget.max_tokens <= 8
+    with open(path, "r", encoding="utf-8") as file:
+        assert json.load(file) == {"tiny | cpu": budget.max_tokens}
+
+    # Later runs start from the safe budget, unless they ask for less
+    assert TokenBudget("tiny | cpu", 64, path=path).max_tokens \
+        == budget.max_tokens
+    assert TokenBudget("tiny | cpu", 2, path=path).max_tokens == 2
+    assert TokenBudget("other | cpu", 64, path=path).max_tokens == 64
+
+    # Errors other than running out of memory are not retried
+    def failing_score_batch(model, ids, reduction):
+        raise RuntimeError("shape mismatch")
+
+    with patch.object(token_budget, "score_batch", failing_score_batch), \
+            pytest.raises(RuntimeError, match="shape mismatch"):
+        score_token_budget(tiny_scorer, token_ids, budget)
+
+
+def test_rss_estimate_splits_batches(tiny_scorer, tmp_path):
+    """
+    Test that on CPU a large resident set size alone leaves the budget
+    alone, while a batch estimated to leave too little memory is split
+    before it runs and lowers the budget of this run only.
+    """
+    token_ids = tiny_scorer.tokenizer(
+        ["the actor won the award", "the actor won the battle"]
+        )["input_ids"]
+    expected = score_token_ids(tiny_scorer, token_ids, 1)
+    path = str(tmp_path / "budgets.json")
+    budget = TokenBudget("tiny | cpu", 64, path=path)
+
+    with patch.object(token_budget, "current_rss", return_value=2 ** 62):
+        score_token_budget(tiny_scorer, token_ids, budget)
+    assert budget.max_tokens == 64
+
+    with patch.object(token_budget, "estimated_rss", return_value=2 ** 62):
+        scores = score_token_budget(tiny_scorer, token_ids, budget)
+
+    assert scores == pytest.approx(expected, abs=1e-5)
+    assert budget.max_tokens == padded_tokens(token_ids) // 2
+    assert not os.path.exists(path)
+
+
+def test_estimated_rss(tiny_scorer):
+    """
+    Test that the memory estimate grows with the padded size of a batch once
+    a batch of the model was measured.
+    """
+    assert estimated_rss(tiny_scorer, 8) is None
+
+    token_ids = tiny_scorer.tokenizer(["the actor won the award"] * 64)["input_ids"]
+    with patch.object(token_budget, "peak_rss", side_effect=[0, 2 ** 30]), \
+            patch.object(token_budget, "current_rss", return_value=2 ** 29):
+        score_batch_safely(tiny_scorer, token_ids)
+
+    assert estimated_rss(tiny_scorer, 0) == 2 ** 29
+    assert estimated_rss(tiny_scorer, padded_tokens(token_ids)) == 2 ** 30
+
+
+def test_memory_unknown(tiny_scorer):
+    """
+    Test that batches are scored without a memory estimate where the memory
+    cannot be measured, e.g. without the resource module on Windows.
+    """
+    token_ids = tiny_scorer.tokenizer(["the actor won the award"] * 4)["input_ids"]
+    with patch.object(token_budget, "resource", None), \
+            patch.object(token_budget, "peak_rss", return_value=None), \
+            patch.object(token_budget, "current_rss", return_value=None):
+        scores, failed, estimated = score_batch_safely(tiny_scorer, token_ids)
+
+    assert scores == score_batch(tiny_scorer, token_ids, token_budget.mean_reduction)
+    assert not failed and not estimated
+
+
+def test_token_budget_with_prefix_cache():
+    """
+    Test that a token budget is rejected together with the prefix cache,
+    whose batches it would not limit.
+    """
+    with pytest.raises(ValueError):
+        ScoringOptions(
+            prefix_cache=True,
+            token_budget=TokenBudget("tiny | cpu", 16, path=None)
+        )
+
+
+def test_run_experiment_token_budget(tiny_scorer, tiny_dataset, tmp_path):
+    """
+    Test that batching by a token budget gives the results of fixed-size
+    batches.
+    """
+    run_experiment(
+        tiny_scorer, tiny_dataset, {}, str(tmp_path / "batched.json"),
+        ScoringOptions(batch_size=4)
+        )
+    run_experiment(
+        tiny_scorer, tiny_dataset, {}, str(tmp_path / "budget.json"),
+        ScoringOptions(token_budget=TokenBudget("tiny | cpu", 16, path=None))
+        )
+
+    with open(tmp_path / "batched.json", "r", encoding="utf-8") as file:
+        expected = json.load(file)["results"]
+    with open(tmp_path / "budget.json", "r", encoding="utf-8") as file:
+        results = json.load(file)["results"]
+    for result, exp in zip(results, expected):
+        assert result["logprob_of_good_continuation"] \
+            == pytest.approx(exp["logprob_of_good_continuation"], abs=1e-5)
+        assert result["logprob_of_bad_continuation"] \
+            == pytest.approx(exp["logprob_of_bad_continuation"], abs=1e-5)
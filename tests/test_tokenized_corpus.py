@@ -0,0 +1,86 @@
+"""
+Test suite for the tokenized_corpus module.
+
+This module contains tests for building, caching and scoring from
+pre-tokenized corpora.
+"""
+
+import os
+from unittest.mock import patch
+import numpy as np
+import pytest
+from bin.batching import mean_reduction, score_token_ids
+from bin.scoring import build_stimuli
+from bin.tokenized_corpus import (
+    TokenizedCorpus, load_tokenized_corpus, tokenizer_hash
+)
+from tests.conftest import CORPUS
+
+
+def test_build_tokenized_corpus(tiny_scorer):
+    """
+    Test that the flat arrays hold the token ids and prefix lengths of each
+    stimulus.
+    """
+    tokenizer = tiny_scorer.tokenizer
+    stimuli = build_stimuli(CORPUS)
+    prefixes = [prefix for prefix in CORPUS.prefix for _ in range(2)]
+
+    tokenized = TokenizedCorpus.build(tokenizer, prefixes, stimuli)
+
+    assert tokenized.ids.dtype == np.int32
+    assert tokenized.token_ids(range(len(stimuli))) == \
+        tokenizer(stimuli)["input_ids"]
+    assert tokenized.lengths.tolist() == [
+        len(ids) for ids in tokenizer(stimuli)["input_ids"]
+    ]
+    assert tokenized.prefix_lengths.tolist() == [
+        len(tokenizer(prefix)["input_ids"]) for prefix in prefixes
+    ]
+
+
+def test_load_tokenized_corpus_cache(tiny_scorer, tiny_dataset, tmp_path):
+    """
+    Test that the corpus is tokenized once, memory-mapped from the cache
+    afterwards, and tokenized again when the corpus file changes.
+    """
+    corpus_path = f"./data/{tiny_dataset}/corpus.csv"
+    stimuli = build_stimuli(CORPUS)
+    prefixes = [prefix for prefix in CORPUS.prefix for _ in range(2)]
+    cache_dir = str(tmp_path / "tokenized")
+
+    first = load_tokenized_corpus(
+        corpus_path, tiny_scorer.tokenizer, [(prefixes, stimuli)],
+        cache_dir=cache_dir
+        )
+    with patch.object(TokenizedCorpus, "build") as build:
+        second = load_tokenized_corpus(
+            corpus_path, tiny_scorer.tokenizer, [(prefixes, stimuli)],
+            cache_dir=cache_dir
+            )
+    build.assert_not_called()
+    assert isinstance(second.ids, np.memmap)
+    assert second.token_ids(range(4)) == first.token_ids(range(4))
+
+    CORPUS.head(3).to_csv(corpus_path, index=False)
+    load_tokenized_corpus(
+        corpus_path, tiny_scorer.tokenizer, [(prefixes[:6], stimuli[:6])],
+        cache_dir=cache_dir
+        )
+    assert len(os.listdir(cache_dir)) == 2
+    assert len(tokenizer_hash(tiny_scorer.tokenizer)) == 64
+
+
+def test_score_token_ids_matches_sequence_score(tiny_scorer):
+    """
+    Test that scoring from token ids gives the scores of `sequence_score` on
+    the stimulus strings.
+    """
+    stimuli = build_stimuli(CORPUS)
+    expected = tiny_scorer.sequence_score(stimuli, reduction=mean_reduction)
+
+    actual = score_token_ids(
+        tiny_scorer, tiny_scorer.tokenizer(stimuli)["input_ids"], batch_size=3
+        )
+
+    assert actual == pytest.approx(expected, abs=1e-5)